@@ -0,0 +1,165 @@
+"""
+Admission control for the tasks the API runs.
+
+Every agent task started by the API (`/generate-code`, its streaming
+variant, batch tasks and jobs) holds one of a fixed number of task slots,
+shared by all workers on the node when there are several (see
+`shared_limiter`). A request that finds every slot busy waits in a bounded
+queue. It is rejected with `AdmissionRejected`, which the API answers with
+429 Too Many Requests and a `Retry-After` header, when:
+
+- "queue_full": `ADMISSION_QUEUE_SIZE` requests are already waiting in this
+  worker and no slot is free,
+- "timeout": it waited `ADMISSION_MAX_WAIT_SECONDS` for a slot,
+- "deadline": its deadline passed while it waited.
+
+Overload then shows up as fast rejections rather than ever longer queues
+and growing memory. Batch tasks and jobs are bounded by their own queues,
+so they wait for a slot as long as it takes.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from agent import metrics
+from agent.concurrency import shared_limiter
+from config import ADMISSION_MAX_WAIT_SECONDS, ADMISSION_QUEUE_SIZE
+
+# Weight of the newest task in the average task duration behind Retry-After.
+DURATION_EWMA_ALPHA = 0.2
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away because every task slot is busy."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(
+            f"The server is at capacity ({reason.replace('_', ' ')}), retry in {retry_after}s."
+        )
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounds the tasks running at once and the requests waiting to run one.
+
+    The controller is used from a single event loop, so its counters need
+    no lock. With several workers they describe this worker only.
+    """
+
+    def __init__(
+        self,
+        max_tasks: int,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS,
+    ):
+        """Initializes the controller.
+
+        Args:
+            max_tasks: The number of task slots.
+            queue_size: The number of requests that may wait for a slot.
+            max_wait: The seconds a request may wait for a slot.
+        """
+        self.max_tasks = max_tasks
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._slots = shared_limiter(max_tasks, "tasks")
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self.average_task_seconds: Optional[float] = None
+
+    async def acquire(self, deadline: Optional[float] = None, bounded: bool = True) -> float:
+        """Waits for a task slot.
+
+        Args:
+            deadline: The request's Unix-time deadline, past which it is not
+                kept waiting.
+            bounded: Whether the wait counts against the queue's size and
+                time limits. Batch tasks and jobs wait without limit.
+
+        Returns:
+            The `time.monotonic()` time the slot was taken, for `release`.
+
+        Raises:
+            AdmissionRejected: If the request can't get a slot in time.
+        """
+        queued = time.perf_counter()
+        if bounded:
+            await self._wait_for_slot(deadline)
+        else:
+            await self._slots.__aenter__()
+        metrics.observe("admission_queue", time.perf_counter() - queued)
+        self.running += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    async def _wait_for_slot(self, deadline: Optional[float]) -> None:
+        """Takes a slot within the queue's size and time limits."""
+        if self.waiting >= self.queue_size:
+            # No room in the queue: only a slot that is free right now will do.
+            try:
+                async with asyncio.timeout(0):
+                    await self._slots.__aenter__()
+            except TimeoutError:
+                raise self._reject("queue_full") from None
+            return
+
+        max_wait, reason = self.max_wait, "timeout"
+        if deadline is not None and deadline - time.time() < max_wait:
+            max_wait, reason = max(deadline - time.time(), 0.0), "deadline"
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(max_wait):
+                await self._slots.__aenter__()
+            return
+        except TimeoutError:
+            pass
+        finally:
+            self.waiting -= 1
+        # Rejected once out of the queue, so Retry-After doesn't count it.
+        raise self._reject(reason)
+
+    async def release(self, admitted_at: float) -> None:
+        """Frees a task slot taken by `acquire` at `admitted_at`."""
+        seconds = time.monotonic() - admitted_at
+        self.running -= 1
+        if self.average_task_seconds is None:
+            self.average_task_seconds = seconds
+        else:
+            self.average_task_seconds += DURATION_EWMA_ALPHA * (seconds - self.average_task_seconds)
+        await self._slots.__aexit__(None, None, None)
+
+    @asynccontextmanager
+    async def admit(
+        self, deadline: Optional[float] = None, bounded: bool = True
+    ) -> AsyncIterator[None]:
+        """Holds a task slot for the duration of the block (see `acquire`)."""
+        admitted_at = await self.acquire(deadline, bounded)
+        try:
+            yield
+        finally:
+            await self.release(admitted_at)
+
+    def retry_after(self) -> int:
+        """Estimates the seconds until a slot is free for one more request."""
+        average = self.average_task_seconds or 1.0
+        return max(1, math.ceil(average * (self.waiting + 1) / self.max_tasks))
+
+    def stats(self) -> dict:
+        return {
+            "max_tasks": self.max_tasks,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "average_task_seconds": (
+                None if self.average_task_seconds is None else round(self.average_task_seconds, 3)
+            ),
+        }
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.record_admission_rejection(reason)
+        return AdmissionRejected(reason, self.retry_after())
@@ -0,0 +1,124 @@
+"""
+Runs many code generation tasks concurrently and reports them as they finish.
+
+Tasks are read from JSONL, fanned out over a bounded number of in-flight
+tasks and yielded back in completion order. LLM calls and test runs are
+bounded separately by the LLM interface's limiter and the test runner's
+limiter, so while some tasks wait on the model others are running tests.
+
+A checkpoint file records the ids of finished tasks, so an interrupted run
+can be restarted and only the remaining tasks are executed.
+"""
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+@dataclass
+class BatchTask:
+    """One task of a batch."""
+
+    id: str
+    task_description: str
+    max_tries: Optional[int] = None
+
+# Runs one task and returns its result fields.
+BatchRunner = Callable[[BatchTask], Awaitable[dict]]
+
+def load_tasks(path: str) -> list[BatchTask]:
+    """Reads tasks from a JSONL file.
+
+    Each line is either a JSON string with the task description, or an
+    object with a "task_description" and optional "id" and "max_tries"
+    keys. Tasks without an id are named after their line number.
+
+    Raises:
+        ValueError: If a line is not valid JSON or has no task description.
+    """
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}") from e
+            if isinstance(entry, str):
+                entry = {"task_description": entry}
+            if not isinstance(entry, dict) or not entry.get("task_description"):
+                raise ValueError(f"{path}:{line_number}: missing task_description")
+            tasks.append(BatchTask(
+                id=str(entry.get("id", f"line-{line_number}")),
+                task_description=entry["task_description"],
+                max_tries=entry.get("max_tries"),
+            ))
+    return tasks
+
+def load_checkpoint(path: Optional[str]) -> set[str]:
+    """Returns the ids of the tasks recorded as finished in a checkpoint file."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+async def run_batch(
+    tasks: Iterable[BatchTask],
+    run_one: BatchRunner,
+    max_in_flight: int,
+    checkpoint_path: Optional[str] = None,
+) -> AsyncIterator[dict]:
+    """Runs tasks concurrently and yields one record per task as it finishes.
+
+    Every record has the task's "id", "passed" and "duration_s". A task that
+    raises still produces a record, with passed set to False and an "error".
+
+    Args:
+        tasks: The tasks to run.
+        run_one: Coroutine function that runs a single task.
+        max_in_flight: Maximum number of tasks running at the same time.
+        checkpoint_path: If given, tasks listed in this file are skipped and
+            each finished task's id is appended to it once its record has
+            been yielded.
+
+    Yields:
+        Result records, in completion order.
+    """
+    done = load_checkpoint(checkpoint_path)
+    pending = [task for task in tasks if task.id not in done]
+    semaphore = asyncio.Semaphore(max_in_flight)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(task: BatchTask) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                record = {"id": task.id, **await run_one(task)}
+            except Exception as e:
+                record = {"id": task.id, "passed": False, "error": str(e)}
+            record["duration_s"] = round(time.perf_counter() - start, 3)
+        await results.put(record)
+
+    workers = [asyncio.create_task(run(task)) for task in pending]
+    try:
+        for _ in range(len(workers)):
+            record = await results.get()
+            yield record
+            if checkpoint_path:
+                _append_checkpoint(checkpoint_path, record["id"])
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def _append_checkpoint(path: str, task_id: str) -> None:
+    """Records a finished task id, flushing it to disk immediately."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(task_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,216 @@
+"""
+Content-addressed caches with an in-memory LRU tier and an on-disk SQLite tier.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+def content_key(*parts) -> str:
+    """Builds a stable SHA-256 key from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """A thread-safe LRU cache bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        """Initializes the cache.
+
+        Args:
+            max_bytes: The maximum total size, in bytes, of cached values.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached value and marks it as recently used."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        """Stores a value, evicting the least recently used entries to fit."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous.encode("utf-8"))
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.encode("utf-8"))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCache:
+    """A persistent key/value cache stored in a SQLite database file.
+
+    The database runs in WAL mode, so several processes can share one file.
+    The total size of the values is bounded: once a write takes it past
+    `max_bytes`, the least recently used entries are deleted, whichever
+    process wrote them.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_bytes: int = 0):
+        """Opens (and creates if needed) the cache database.
+
+        Args:
+            path: The path of the SQLite database file.
+            table: The table used to store entries.
+            max_bytes: The maximum total size, in bytes, of stored values.
+                0 leaves the size unbounded.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL DEFAULT 0, accessed_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {
+                row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")
+            }
+            # Files written before the size bound have neither column.
+            if "size" not in columns:
+                self._connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN size INTEGER NOT NULL DEFAULT 0"
+                )
+                self._connection.execute(f"UPDATE {table} SET size = length(CAST(value AS BLOB))")
+            if "accessed_at" not in columns:
+                self._connection.execute(
+                    f"ALTER TABLE {table} ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0"
+                )
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the stored value for a key, if any, and marks it as recently used."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.max_bytes:
+                self._connection.execute(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key)
+                )
+        return row[0] if row else None
+
+    def put(self, key: str, value: str) -> None:
+        """Stores or replaces the value for a key, evicting old entries to fit."""
+        size = len(value.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            if self.max_bytes:
+                self._evict()
+
+    def total_bytes(self) -> int:
+        """Returns the total size of the stored values."""
+        with self._lock:
+            row = self._connection.execute(f"SELECT SUM(size) FROM {self.table}").fetchone()
+        return row[0] or 0
+
+    def _evict(self) -> None:
+        """Deletes the least recently used entries beyond `max_bytes`."""
+        (total,) = self._connection.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        # Keep the most recently used entries whose sizes add up to max_bytes.
+        deleted = self._connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM (SELECT key,"
+            " SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept FROM"
+            f" {self.table}) WHERE kept > ?)",
+            (self.max_bytes,),
+        ).rowcount
+        self.evicted += deleted
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+class TieredCache:
+    """Looks values up in memory first, then on disk, and counts hits."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        """Initializes the tiered cache.
+
+        Args:
+            memory: The in-memory LRU tier.
+            disk: An optional persistent tier, consulted on memory misses.
+        """
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns a cached value, promoting disk hits into memory."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        """Stores a value in every tier."""
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the size of each tier."""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        disk = {}
+        if self.disk is not None:
+            disk = {"disk_bytes": self.disk.total_bytes(), "disk_evictions": self.disk.evicted}
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            **disk,
+        }
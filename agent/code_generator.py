@@ -1,9 +1,36 @@
 """
 Handles the generation and revision of code and tests by interacting with an LLM.
+
+Revisions continue the conversation of the first attempt: every failed
+attempt is replayed as the model's answer followed by its test feedback, so
+each prompt starts with the previous one and providers can reuse their
+cached prefix. Answers after the first are replayed as diffs, and the
+conversation falls back to the last attempt alone when it outgrows
+`REVISION_PROMPT_MAX_TOKENS`.
+
+Similar solved tasks (see `agent/example_index.py`) can be shown before the
+task, as earlier turns of the same conversation, in every prompt of the
+task.
 """
-import re
-from agent.llm_interface import LLMInterface
-from agent.prompts import INITIAL_GENERATION_PROMPT, REVISION_PROMPT
+import difflib
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Sequence
+from agent import metrics
+from agent.example_index import Example
+from agent.generation_guard import GenerationLimits
+from agent.llm_cache import CHARS_PER_TOKEN
+from agent.llm_interface import LLMInterface, prompt_text
+from agent.prompts import (
+    ATTEMPT_DIFF_PROMPT,
+    ATTEMPT_PROMPT,
+    REVISION_PROMPT,
+    SYSTEM_PROMPT,
+    TASK_PROMPT,
+)
+from agent.test_report import TestReport, summarize_failures, truncate_output
+from config import REVISION_DIFFS, REVISION_FEEDBACK_MAX_TOKENS, REVISION_PROMPT_MAX_TOKENS
 
 # Markers to delimkit code and test in the model response
 FUNCTION_START = "[FUNCTION]"
@@ -11,8 +38,134 @@ FUNCTION_END = "[/FUNCTION]"
 TESTS_START = "[TESTS]"
 TESTS_END = "[/TESTS]"
 
+# Receives each chunk of the LLM response as it streams in.
+TokenCallback = Callable[[str], Awaitable[None]]
+# Receives the function code as soon as its closing marker arrives.
+FunctionCallback = Callable[[str], Awaitable[None]]
+
+# A conversation of (role, content) messages.
+Messages = list[tuple[str, str]]
+
+_MARKERS = {
+    "function_start": FUNCTION_START,
+    "function_end": FUNCTION_END,
+    "tests_start": TESTS_START,
+    "tests_end": TESTS_END,
+}
+
+@dataclass
+class Attempt:
+    """A failed attempt, as it is replayed in later revision prompts."""
+
+    code: str
+    tests: str
+    # The failure feedback sent after it (see `failure_feedback`).
+    feedback: str
+
+class _SectionExtractor:
+    """Incrementally extracts the text between a start and an end marker.
+
+    Only a marker-sized tail of unconsumed text is kept between chunks, so
+    markers split across chunk boundaries are still found and each character
+    is scanned a bounded number of times.
+    """
+
+    def __init__(self, start: str, end: str):
+        self.start = start
+        self.end = end
+        self.started = False
+        self.done = False
+        self._pending = ""
+        self._parts: list[str] = []
+
+    def feed(self, chunk: str) -> bool:
+        """Consumes a chunk. Returns True when the end marker is reached."""
+        if self.done:
+            return False
+        self._pending += chunk
+        if not self.started:
+            index = self._pending.find(self.start)
+            if index == -1:
+                self._pending = self._pending[-(len(self.start) - 1):]
+                return False
+            self.started = True
+            self._pending = self._pending[index + len(self.start):]
+
+        index = self._pending.find(self.end)
+        if index != -1:
+            self._parts.append(self._pending[:index])
+            self._pending = ""
+            self.done = True
+            return True
+
+        # Keep just enough text to recognize an end marker split in two.
+        keep = len(self.end) - 1
+        if len(self._pending) > keep:
+            self._parts.append(self._pending[:-keep])
+            self._pending = self._pending[-keep:]
+        return False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts).strip()
+
+    def missing_marker(self) -> Optional[str]:
+        """Returns the marker that was never found, if any."""
+        if not self.started:
+            return self.start
+        if not self.done:
+            return self.end
+        return None
+
+class StreamingResponseParser:
+    """A single-pass parser for the [FUNCTION]/[TESTS] response format.
+
+    Feed it the response in chunks as they stream in. The function code is
+    available as soon as `[/FUNCTION]` arrives and the parser reports `done`
+    once both sections are closed, so generation can be stopped there.
+    """
+
+    def __init__(self):
+        self._function = _SectionExtractor(FUNCTION_START, FUNCTION_END)
+        self._tests = _SectionExtractor(TESTS_START, TESTS_END)
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """Consumes a chunk of the response.
+
+        Returns:
+            The sections completed by this chunk, as ("function", code) and
+            ("tests", tests) pairs.
+        """
+        completed = []
+        if self._function.feed(chunk):
+            completed.append(("function", self._function.text))
+        if self._tests.feed(chunk):
+            completed.append(("tests", self._tests.text))
+        return completed
+
+    @property
+    def done(self) -> bool:
+        """True once both the function and the tests have been closed."""
+        return self._function.done and self._tests.done
+
+    def result(self) -> tuple[str, str]:
+        """Returns the extracted function code and test code.
+
+        Raises:
+            ValueError: If a section's start or end marker was never found.
+        """
+        for extractor in (self._function, self._tests):
+            marker = extractor.missing_marker()
+            if marker is not None:
+                raise ValueError(f"Response format invalid. Missing marker: {marker}")
+        return self._function.text, self._tests.text
+
 def generate_code_and_tests(
-    task_description: str, llm: LLMInterface, verbose: bool = False
+    task_description: str,
+    llm: LLMInterface,
+    verbose: bool = False,
+    limits: Optional[GenerationLimits] = None,
+    examples: Sequence[Example] = (),
 ) -> tuple[str, str]:
     """Generates initial code and tests from a task description.
 
@@ -20,25 +173,61 @@ def generate_code_and_tests(
         task_description: The user's request for code generation.
         llm: An initialized LLMInterface object.
         verbose: If True, prints the full LLM response.
+        limits: The generation limits of the LLM call.
+        examples: Solved tasks shown before this one.
 
     Returns:
         A tuple containing the generated function code and test code.
 
     Raises:
         ValueError: If the LLM response does not match the expected format.
+        GenerationStopped: If the LLM call crossed one of its limits.
     """
-    prompt_context = {
-        "task_description": task_description,
-        "function_start": FUNCTION_START,
-        "function_end": FUNCTION_END,
-        "tests_start": TESTS_START,
-        "tests_end": TESTS_END
-    }
-    prompt = INITIAL_GENERATION_PROMPT.format(**prompt_context)
-    full_response = llm.generate(prompt, verbose=verbose)
+    prompt = _build_initial_prompt(task_description, examples)
+    full_response = llm.generate(prompt, verbose=verbose, limits=limits)
 
     return _parse_code_and_tests(full_response)
 
+async def async_generate_code_and_tests(
+    task_description: str,
+    llm: LLMInterface,
+    verbose: bool = False,
+    on_token: Optional[TokenCallback] = None,
+    on_function: Optional[FunctionCallback] = None,
+    sample: int = 0,
+    limits: Optional[GenerationLimits] = None,
+    examples: Sequence[Example] = (),
+) -> tuple[str, str]:
+    """Asynchronous version of `generate_code_and_tests`.
+
+    The response is streamed and parsed as it arrives, and generation is
+    cancelled as soon as the tests section is closed.
+
+    Args:
+        task_description: The user's request for code generation.
+        llm: An initialized LLMInterface object.
+        verbose: If True, prints the full LLM response.
+        on_token: If given, each chunk of the response is passed to this
+            callback as it arrives.
+        on_function: If given, receives the function code as soon as it is
+            complete, before the tests have been generated.
+        sample: Index of this candidate when several are generated for the
+            same task (see `LLMInterface.astream`).
+        limits: The generation limits of the LLM call.
+        examples: Solved tasks shown before this one.
+
+    Returns:
+        A tuple containing the generated function code and test code.
+
+    Raises:
+        ValueError: If the LLM response does not match the expected format.
+        GenerationStopped: If the LLM call crossed one of its limits.
+    """
+    prompt = _build_initial_prompt(task_description, examples)
+    return await _async_generate_and_parse(
+        llm, prompt, verbose, on_token, on_function, sample, limits
+    )
+
 def revise_code_and_tests(
     original_code: str,
     original_tests: str,
@@ -46,6 +235,10 @@ def revise_code_and_tests(
     task_description: str,
     llm: LLMInterface,
     verbose: bool = False,
+    test_report: Optional[TestReport] = None,
+    history: Sequence[Attempt] = (),
+    limits: Optional[GenerationLimits] = None,
+    examples: Sequence[Example] = (),
 ) -> tuple[str, str]:
     """Revises both the code and tests based on failure feedback.
 
@@ -56,52 +249,234 @@ def revise_code_and_tests(
         task_description: The original high-level task.
         llm: An initialized LLMInterface object.
         verbose: If True, prints the full LLM response.
+        test_report: The structured results of the failed run. When given,
+            only a summary of the failing tests is sent instead of the full
+            test output.
+        history: The failed attempts before the one being revised, oldest
+            first.
+        limits: The generation limits of the LLM call.
+        examples: The solved tasks shown before this one in the first
+            attempt's prompt.
 
     Returns:
         A tuple containing the revised code and the revised tests.
+
+    Raises:
+        ValueError: If the LLM response does not match the expected format.
+        GenerationStopped: If the LLM call crossed one of its limits.
     """
-    prompt_context = {
-        "task_description": task_description,
-        "original_code": original_code,
-        "original_tests": original_tests,
-        "test_output": test_output,
-        "function_start": FUNCTION_START,
-        "function_end": FUNCTION_END,
-        "tests_start": TESTS_START,
-        "tests_end": TESTS_END
-    }
-    prompt = REVISION_PROMPT.format(**prompt_context)
-    full_response = llm.generate(prompt, verbose=verbose)
+    prompt = _build_revision_prompt(
+        original_code, original_tests, test_output, task_description, test_report, history,
+        examples
+    )
+    full_response = llm.generate(prompt, verbose=verbose, limits=limits)
 
     return _parse_code_and_tests(full_response)
 
-def _parse_code_and_tests(response: str) -> tuple[str, str]:
-    """A helper function to parse the LLM's response.
+async def async_revise_code_and_tests(
+    original_code: str,
+    original_tests: str,
+    test_output: str,
+    task_description: str,
+    llm: LLMInterface,
+    verbose: bool = False,
+    on_token: Optional[TokenCallback] = None,
+    on_function: Optional[FunctionCallback] = None,
+    sample: int = 0,
+    test_report: Optional[TestReport] = None,
+    history: Sequence[Attempt] = (),
+    limits: Optional[GenerationLimits] = None,
+    examples: Sequence[Example] = (),
+) -> tuple[str, str]:
+    """Asynchronous version of `revise_code_and_tests`.
+
+    The response is streamed and parsed as it arrives, and generation is
+    cancelled as soon as the tests section is closed.
 
     Args:
-        response: The full string response from the LLM.
+        original_code: The previous version of the code that failed.
+        original_tests: The test suite that failed.
+        test_output: The error message from the test run.
+        task_description: The original high-level task.
+        llm: An initialized LLMInterface object.
+        verbose: If True, prints the full LLM response.
+        on_token: If given, each chunk of the response is passed to this
+            callback as it arrives.
+        on_function: If given, receives the revised function code as soon as
+            it is complete, before the tests have been generated.
+        sample: Index of this candidate when several are generated for the
+            same revision (see `LLMInterface.astream`).
+        test_report: The structured results of the failed run. When given,
+            only a summary of the failing tests is sent instead of the full
+            test output.
+        history: The failed attempts before the one being revised, oldest
+            first.
+        limits: The generation limits of the LLM call.
+        examples: The solved tasks shown before this one in the first
+            attempt's prompt.
 
     Returns:
-        A tuple containing the extracted function code and test code.
+        A tuple containing the revised code and the revised tests.
 
     Raises:
-        ValueError: If the response does not contain the required markers.
+        ValueError: If the LLM response does not match the expected format.
+        GenerationStopped: If the LLM call crossed one of its limits.
     """
-    markers = [FUNCTION_START, FUNCTION_END, TESTS_START, TESTS_END]
-    for marker in markers:
-        if marker not in response:
-            raise ValueError(f"Response format invalid. Missing marker: {marker}")
+    prompt = _build_revision_prompt(
+        original_code, original_tests, test_output, task_description, test_report, history,
+        examples
+    )
+    return await _async_generate_and_parse(
+        llm, prompt, verbose, on_token, on_function, sample, limits
+    )
 
-    # Escape markers to safely use them in regex
-    escaped_markers = [re.escape(m) for m in markers]
+async def _async_generate_and_parse(
+    llm: LLMInterface,
+    prompt: Messages,
+    verbose: bool,
+    on_token: Optional[TokenCallback],
+    on_function: Optional[FunctionCallback],
+    sample: int = 0,
+    limits: Optional[GenerationLimits] = None,
+) -> tuple[str, str]:
+    """Streams a response through the parser and stops once it is complete.
+
+    Closing the stream as soon as `[/TESTS]` arrives cancels the request, so
+    no time is spent on tokens the model produces after the tests.
+    """
+    parser = StreamingResponseParser()
+    # Time spent parsing, excluding the waits for the next chunk.
+    parse_time = 0.0
+    stream = llm.astream(
+        prompt, verbose=verbose, sample=sample, limits=limits, complete=lambda: parser.done
+    )
+    async with aclosing(stream):
+        async for chunk in stream:
+            if on_token is not None:
+                await on_token(chunk)
+            start = time.perf_counter()
+            sections = parser.feed(chunk)
+            parse_time += time.perf_counter() - start
+            for section, text in sections:
+                if section == "function" and on_function is not None:
+                    await on_function(text)
+            if parser.done:
+                break
+    metrics.observe("parse", parse_time)
+    return parser.result()
 
-    function_match = re.search(rf"{escaped_markers[0]}(.*?){escaped_markers[1]}", response, re.DOTALL)
-    tests_match = re.search(rf"{escaped_markers[2]}(.*?){escaped_markers[3]}", response, re.DOTALL)
+def failure_feedback(test_output: str, test_report: Optional[TestReport] = None) -> str:
+    """Builds the feedback on a failed attempt sent in revision prompts.
 
-    if not function_match or not tests_match:
-        raise ValueError("Response format invalid. Could not extract code or tests.")
+    The feedback is kept within `REVISION_FEEDBACK_MAX_TOKENS`: a summary of
+    the failing tests when a report is available, otherwise the end of the
+    raw output.
+    """
+    if test_report is not None:
+        return summarize_failures(test_report, REVISION_FEEDBACK_MAX_TOKENS)
+    return truncate_output(test_output, REVISION_FEEDBACK_MAX_TOKENS)
 
-    function_code = function_match.group(1).strip()
-    test_code = tests_match.group(1).strip()
+def _build_initial_prompt(
+    task_description: str, examples: Sequence[Example] = ()
+) -> Messages:
+    """Formats the initial generation conversation for a task."""
+    with metrics.span("prompt"):
+        messages = _task_messages(task_description, examples)
+        # The system message is shared with every other task's prompts.
+        metrics.record_prompt_prefix(_estimate_tokens(messages[:1]))
+        return messages
 
-    return function_code, test_code
+def _build_revision_prompt(
+    original_code: str,
+    original_tests: str,
+    test_output: str,
+    task_description: str,
+    test_report: Optional[TestReport] = None,
+    history: Sequence[Attempt] = (),
+    examples: Sequence[Example] = (),
+) -> Messages:
+    """Formats the revision conversation from the failed attempts.
+
+    Every attempt is replayed in order, so the prompt extends the previous
+    one. If that exceeds `REVISION_PROMPT_MAX_TOKENS`, only the task and the
+    attempt being revised are sent.
+    """
+    with metrics.span("prompt"):
+        attempts = [
+            *history, Attempt(original_code, original_tests, failure_feedback(test_output, test_report))
+        ]
+        task = _task_messages(task_description, examples)
+        messages = task + _attempt_messages(attempts)
+        # Everything but the last answer and its feedback was in the previous prompt.
+        reused = messages[:-2]
+        if len(attempts) > 1 and _estimate_tokens(messages) > REVISION_PROMPT_MAX_TOKENS:
+            messages = task + _attempt_messages(attempts[-1:])
+            reused = task
+        metrics.record_prompt_prefix(_estimate_tokens(reused))
+        return messages
+
+def _task_messages(task_description: str, examples: Sequence[Example] = ()) -> Messages:
+    """Returns the start of every prompt of a task.
+
+    That is the system message, each example as a task and its answer, and
+    the task itself.
+    """
+    messages = [("system", SYSTEM_PROMPT.format(**_MARKERS))]
+    for example in examples:
+        messages.append(("human", TASK_PROMPT.format(task_description=example.task)))
+        messages.append(("ai", ATTEMPT_PROMPT.format(
+            code=example.code, tests=example.tests, **_MARKERS
+        )))
+    messages.append(("human", TASK_PROMPT.format(task_description=task_description)))
+    return messages
+
+def _attempt_messages(attempts: Sequence[Attempt]) -> Messages:
+    """Replays failed attempts as the model's answers and their feedback.
+
+    With `REVISION_DIFFS`, each answer after the first is sent as a diff
+    against the one before it, unless the diff would be longer.
+    """
+    messages = []
+    previous = None
+    for attempt in attempts:
+        answer = ATTEMPT_PROMPT.format(code=attempt.code, tests=attempt.tests, **_MARKERS)
+        if REVISION_DIFFS and previous is not None:
+            diff = ATTEMPT_DIFF_PROMPT.format(diff=_attempt_diff(previous, attempt))
+            if len(diff) < len(answer):
+                answer = diff
+        messages.append(("ai", answer))
+        messages.append(("human", REVISION_PROMPT.format(test_output=attempt.feedback)))
+        previous = attempt
+    return messages
+
+def _attempt_diff(before: Attempt, after: Attempt) -> str:
+    """Returns unified diffs of an attempt's function and tests."""
+    parts = []
+    for name, old, new in (
+        ("function", before.code, after.code), ("tests", before.tests, after.tests)
+    ):
+        lines = list(difflib.unified_diff(
+            old.splitlines(), new.splitlines(), name, name, lineterm=""
+        ))
+        parts.append("\n".join(lines) if lines else f"({name} unchanged)")
+    return "\n".join(parts)
+
+def _estimate_tokens(messages: Messages) -> int:
+    return len(prompt_text(messages)) // CHARS_PER_TOKEN
+
+def _parse_code_and_tests(response: str) -> tuple[str, str]:
+    """A helper function to parse the LLM's response.
+
+    Args:
+        response: The full string response from the LLM.
+
+    Returns:
+        A tuple containing the extracted function code and test code.
+
+    Raises:
+        ValueError: If the response does not contain the required markers.
+    """
+    with metrics.span("parse"):
+        parser = StreamingResponseParser()
+        parser.feed(response)
+        return parser.result()
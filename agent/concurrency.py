@@ -0,0 +1,231 @@
+"""
+Concurrency primitives shared by the LLM and test-runner stages.
+
+`ConcurrencyLimiter` caps work within one process. When the API runs
+several worker processes (`API_WORKERS`), `shared_limiter` returns a
+`NodeLimiter` instead, whose slots are lock files that every worker on the
+machine competes for, so the LLM, sandbox and task budgets apply to the
+node as a whole.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where limits stay per process.
+    fcntl = None
+
+from config import API_WORKERS, NODE_SLOT_DIR
+
+# Bounds of the exponential backoff of a `NodeLimiter` waiting for a slot.
+POLL_MIN_SECONDS = 0.005
+POLL_MAX_SECONDS = 0.05
+
+# A thread waiting for a slot (as an event), or a coroutine (as its loop and
+# the future it awaits).
+_Waiter = Union[threading.Event, tuple[asyncio.AbstractEventLoop, asyncio.Future]]
+
+class ConcurrencyLimiter:
+    """Caps concurrent work for both threads and asyncio tasks.
+
+    Use `with limiter:` from synchronous code and `async with limiter:` from
+    coroutines. Threads and the coroutines of every event loop share one
+    count of free slots, so the cap applies to all of them together, and
+    waiters get slots in arrival order. A freed slot is handed straight to
+    the oldest waiter: a thread is woken, a coroutine's future is resolved
+    in its own loop.
+    """
+
+    def __init__(self, limit: int):
+        """Initializes the limiter.
+
+        Args:
+            limit: The maximum number of concurrent holders.
+        """
+        if limit <= 0:
+            raise ValueError(f"Concurrency limit must be positive, got {limit}")
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._free = limit
+        self._waiters: deque[_Waiter] = deque()
+
+    def __enter__(self) -> "ConcurrencyLimiter":
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return self
+            granted = threading.Event()
+            self._waiters.append(granted)
+        # The releasing thread hands its slot over before setting the event.
+        granted.wait()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return self
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # Cancelled after the slot was handed over: give it back. (If
+            # the hand-over was still in flight, `_grant` gives it back.)
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Frees a slot, handing it to the oldest waiter if there is one."""
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._grant, future)
+        except RuntimeError:
+            # The waiter's loop is closed, so nothing will take the slot.
+            self.release()
+
+    def _grant(self, future: asyncio.Future) -> None:
+        """Resolves a waiting coroutine's future, in its loop."""
+        if future.done():
+            # The waiter was cancelled while the slot was on its way.
+            self.release()
+        else:
+            future.set_result(None)
+
+class NodeLimiter:
+    """Caps concurrent work across every process on the machine.
+
+    Each slot is a lock file in a shared directory, held with `flock`, so
+    the cap covers all processes using the same directory and name, and the
+    kernel frees the slots of a process that dies. Waiters poll for a free
+    slot with exponential backoff (up to `POLL_MAX_SECONDS`), so unlike
+    `ConcurrencyLimiter`, slots are not handed out in arrival order: a slot
+    goes to whichever waiter polls first after it is freed, and under
+    sustained contention a waiter can lose several times in a row. Its
+    wait is still bounded by the callers' timeouts (admission, deadlines).
+    Use it like `ConcurrencyLimiter`.
+    """
+
+    def __init__(self, limit: int, directory: str, name: str):
+        """Initializes the limiter. The lock files are created on first use.
+
+        Args:
+            limit: The maximum number of concurrent holders on the machine.
+            directory: The directory of the lock files.
+            name: Distinguishes limiters sharing the directory.
+        """
+        if limit <= 0:
+            raise ValueError(f"Concurrency limit must be positive, got {limit}")
+        if fcntl is None:
+            raise RuntimeError("NodeLimiter needs fcntl, which this platform lacks")
+        self.limit = limit
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        self.paths = [os.path.join(directory, f"{name}.{index}.lock") for index in range(limit)]
+        self._lock = threading.Lock()
+        self._fds: list[int] = []
+        # Descriptors whose slot this process holds.
+        self._held: list[int] = []
+        self._pid = None
+
+    def try_acquire(self) -> bool:
+        """Takes a free slot without waiting.
+
+        Returns:
+            True if a slot was free and is now held by the caller.
+        """
+        with self._lock:
+            self._open()
+            for fd in self._fds:
+                if fd in self._held:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._held.append(fd)
+                return True
+            return False
+
+    def release(self) -> None:
+        """Frees one of the slots this process holds."""
+        with self._lock:
+            fcntl.flock(self._held.pop(), fcntl.LOCK_UN)
+
+    def held(self) -> int:
+        """Returns how many slots this process holds."""
+        with self._lock:
+            return len(self._held)
+
+    def _open(self) -> None:
+        """Opens the lock files once per process.
+
+        Descriptors inherited over a fork share their locks with the parent,
+        so a forked child opens its own.
+        """
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.paths[0]) or ".", exist_ok=True)
+        self._fds = [os.open(path, os.O_RDWR | os.O_CREAT, 0o600) for path in self.paths]
+        self._held = []
+        self._pid = os.getpid()
+
+    def __enter__(self) -> "NodeLimiter":
+        for delay in _poll_delays():
+            if self.try_acquire():
+                return self
+            time.sleep(delay)
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "NodeLimiter":
+        for delay in _poll_delays():
+            if self.try_acquire():
+                return self
+            await asyncio.sleep(delay)
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+def _poll_delays() -> Iterator[float]:
+    delay = POLL_MIN_SECONDS
+    while True:
+        yield delay
+        delay = min(delay * 2, POLL_MAX_SECONDS)
+
+def shared_limiter(limit: int, name: str) -> Union[ConcurrencyLimiter, NodeLimiter]:
+    """Returns a limiter for a resource, shared by all API workers if there are several.
+
+    Args:
+        limit: The maximum number of concurrent holders.
+        name: The resource, which names its lock files in `NODE_SLOT_DIR`.
+    """
+    if API_WORKERS > 1 and fcntl is not None:
+        return NodeLimiter(limit, NODE_SLOT_DIR, name)
+    return ConcurrencyLimiter(limit)
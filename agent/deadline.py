@@ -0,0 +1,106 @@
+"""
+Wall-clock budgets for agent tasks.
+
+A task may be given a deadline, from a latency SLO or an absolute time.
+`TaskBudget` tracks the time left and splits it between the stages of the
+agent loop:
+
+- each LLM call is stopped early enough to leave time for the test run
+  after it (the longest test run of the task so far, or
+  `DEADLINE_TEST_RESERVE_SECONDS` until one has been timed),
+- each test run may take at most the time left,
+- a revision is only started if the time left covers the task's longest
+  attempt so far.
+
+Budgets run on the `time.monotonic()` clock, so clock adjustments don't
+move them. Requests and persisted jobs carry Unix times instead, which
+`monotonic_deadline` converts.
+"""
+import time
+from typing import Optional
+
+from agent.generation_guard import GenerationLimits
+from agent.test_report import TestReport
+from config import DEADLINE_TEST_RESERVE_SECONDS, TASK_SLO_SECONDS
+
+def request_deadline(
+    slo_seconds: Optional[float] = None, deadline: Optional[float] = None
+) -> Optional[float]:
+    """Returns the Unix time by which a request must be answered.
+
+    Args:
+        slo_seconds: The request's latency SLO, counted from now. Defaults
+            to `TASK_SLO_SECONDS` when the request sets no deadline either.
+        deadline: An absolute Unix time. The earlier of both applies.
+
+    Returns:
+        The deadline, or None if the request has none.
+    """
+    if slo_seconds is None and deadline is None:
+        slo_seconds = TASK_SLO_SECONDS or None
+    deadlines = [] if deadline is None else [deadline]
+    if slo_seconds is not None:
+        deadlines.append(time.time() + slo_seconds)
+    return min(deadlines, default=None)
+
+def monotonic_deadline(deadline: Optional[float]) -> Optional[float]:
+    """Converts a Unix-time deadline to the `time.monotonic()` clock."""
+    if deadline is None:
+        return None
+    return time.monotonic() + (deadline - time.time())
+
+class TaskBudget:
+    """The time left before a task's deadline, and how to spend it."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        """Initializes the budget.
+
+        Args:
+            deadline: The `time.monotonic()` time by which the task must be
+                over, or None for a task without a deadline.
+        """
+        self.deadline = deadline
+        self.longest_attempt = 0.0
+        self.longest_test_run: Optional[float] = None
+
+    def remaining(self) -> Optional[float]:
+        """Returns the seconds left, negative once the deadline passed."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def can_fit_attempt(self) -> bool:
+        """Tells whether another attempt is likely to finish in time."""
+        remaining = self.remaining()
+        return remaining is None or remaining > self.longest_attempt
+
+    def record_attempt(self, seconds: float, report: Optional[TestReport] = None) -> None:
+        """Records how long an attempt and its test run took.
+
+        Cached test runs are not counted, since they say nothing about how
+        long the next run will take.
+        """
+        self.longest_attempt = max(self.longest_attempt, seconds)
+        if report is not None and report.wall_time is not None and not report.cached:
+            self.longest_test_run = max(self.longest_test_run or 0.0, report.wall_time)
+
+    def generation_limits(self) -> GenerationLimits:
+        """Returns the limits of an LLM call started now."""
+        if self.deadline is None:
+            return GenerationLimits()
+        reserve = self.longest_test_run
+        if reserve is None:
+            reserve = DEADLINE_TEST_RESERVE_SECONDS
+        # Never hold back more than half of what is left, so a late call
+        # still gets a chance to finish.
+        remaining = max(self.remaining(), 0.0)
+        return GenerationLimits(deadline=self.deadline - min(reserve, remaining / 2))
+
+    def test_timeout(self) -> Optional[float]:
+        """Returns the timeout of a test run started now, None for the default."""
+        remaining = self.remaining()
+        return None if remaining is None else max(remaining, 0.0)
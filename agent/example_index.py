@@ -0,0 +1,280 @@
+"""
+A persistent index of solved tasks, used as few-shot examples.
+
+Every task whose tests passed is stored with its code and tests in a SQLite
+file. Before a new task's first prompt, the most similar solved tasks are
+looked up and replayed ahead of it as earlier turns of the conversation
+(see `agent/code_generator.py`).
+
+Task descriptions are compared as sets of terms (lowercased words without
+stop words, plus adjacent word pairs) weighted by inverse document
+frequency, with cosine similarity. An in-memory inverted index maps each
+term to the tasks that contain it, so a lookup only scores tasks sharing a
+term with the query: that first pass goes through the query's terms from
+the rarest, and stops at terms too common to discriminate (more than
+`MAX_CANDIDATE_POSTINGS` tasks) or once `MAX_SCANNED_POSTINGS` entries have
+been scanned. The best candidates are then re-ranked by their exact
+similarity. Inserts are
+incremental, and rows added by other processes sharing the file are
+indexed on the next lookup.
+
+The index is off unless `FEW_SHOT_EXAMPLES` is set. Once on, it keeps every
+task description, code and tests it is given in `FEW_SHOT_INDEX_PATH` until
+the file is deleted, and shows them in the prompts of other users' tasks.
+A solution is recorded when the model's own tests pass, so an example is
+only as correct as the tests written for it.
+"""
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Iterable, Optional
+
+from agent.cache import content_key
+from agent.llm_cache import CHARS_PER_TOKEN
+from config import (
+    FEW_SHOT_EXAMPLES,
+    FEW_SHOT_INDEX_PATH,
+    FEW_SHOT_MAX_TOKENS,
+    FEW_SHOT_MIN_SIMILARITY,
+)
+
+# Terms found in more tasks than this don't select candidates, only score them.
+MAX_CANDIDATE_POSTINGS = 5000
+# Posting entries the first pass of a lookup scans at most, across its terms.
+MAX_SCANNED_POSTINGS = 20000
+# Candidates re-ranked by exact similarity, per requested example.
+RERANK_FACTOR = 8
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset("""
+    a an and any are as at be by can create do does each for from function
+    given has have how i if implement in into is it its make me my of on or
+    python should so such than that the their them then there these this to
+    use uses using we which will with write you your
+""".split())
+
+@dataclass(frozen=True)
+class Example:
+    """A solved task and its passing code and tests."""
+
+    task: str
+    code: str
+    tests: str
+    similarity: float = 1.0
+
+def terms(text: str) -> frozenset[str]:
+    """Returns the terms a task description is indexed by."""
+    words = [
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in _WORD.findall(text.lower())
+        if word not in _STOP_WORDS
+    ]
+    return frozenset(words + [f"{a}_{b}" for a, b in zip(words, words[1:])])
+
+class ExampleIndex:
+    """Solved tasks in a SQLite file, searchable by task similarity."""
+
+    def __init__(self, path: str = ""):
+        """Opens (and creates if needed) the index.
+
+        Args:
+            path: The SQLite database file. An empty path keeps the index
+                in memory, for this process only.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=5)
+        with self._connection:
+            if path:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS examples (id INTEGER PRIMARY KEY, key TEXT UNIQUE,"
+                " task TEXT NOT NULL, code TEXT NOT NULL, tests TEXT NOT NULL, created_at REAL)"
+            )
+        # Row ids and term sets of the indexed tasks, by position.
+        self._row_ids: list[int] = []
+        self._terms: list[frozenset[str]] = []
+        self._postings: dict[str, list[int]] = {}
+        self._last_row_id = 0
+        self.searches = 0
+        self.hits = 0
+
+    def add(self, task: str, code: str, tests: str) -> None:
+        """Stores a solved task. A task already stored keeps its first solution."""
+        self.add_many([(task, code, tests)])
+
+    def add_many(self, examples: Iterable[tuple[str, str, str]]) -> None:
+        """Stores (task, code, tests) triples in a single transaction."""
+        now = time.time()
+        rows = [
+            (content_key(" ".join(task.split()).lower()), task, code, tests, now)
+            for task, code, tests in examples
+        ]
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO examples (key, task, code, tests, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            self._refresh()
+
+    def search(
+        self, task: str, k: int, min_similarity: float = 0.0
+    ) -> list[Example]:
+        """Returns up to `k` solved tasks similar to a task, most similar first."""
+        with self._lock:
+            self._refresh()
+            self.searches += 1
+            ranked = self._rank(terms(task), k, min_similarity)
+            if ranked:
+                self.hits += 1
+            examples = []
+            for position, similarity in ranked:
+                row = self._connection.execute(
+                    "SELECT task, code, tests FROM examples WHERE id = ?",
+                    (self._row_ids[position],),
+                ).fetchone()
+                examples.append(Example(*row, similarity=round(similarity, 3)))
+            return examples
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._row_ids), "searches": self.searches, "hits": self.hits}
+
+    def __len__(self) -> int:
+        return len(self._row_ids)
+
+    def _refresh(self) -> None:
+        """Indexes the rows added since the last refresh, by any process."""
+        rows = self._connection.execute(
+            "SELECT id, task FROM examples WHERE id > ? ORDER BY id", (self._last_row_id,)
+        ).fetchall()
+        for row_id, task in rows:
+            position = len(self._row_ids)
+            task_terms = terms(task)
+            self._row_ids.append(row_id)
+            self._terms.append(task_terms)
+            for term in task_terms:
+                self._postings.setdefault(term, []).append(position)
+            self._last_row_id = row_id
+
+    def _rank(
+        self, query: frozenset[str], k: int, min_similarity: float
+    ) -> list[tuple[int, float]]:
+        """Returns the positions and similarities of the best matches."""
+        total = len(self._row_ids)
+        if not total or not query or k <= 0:
+            return []
+        postings = self._postings
+        weights = {term: self._weight(term, total) for term in query}
+
+        # First pass: the dot product over the discriminating terms, rarest
+        # first, until `MAX_SCANNED_POSTINGS` tasks have been scored.
+        scores: dict[int, float] = {}
+        scanned = 0
+        for term in sorted(weights, key=lambda term: len(postings.get(term, ()))):
+            posting = postings.get(term)
+            if posting is None:
+                continue
+            if (
+                len(posting) > MAX_CANDIDATE_POSTINGS
+                or scanned + len(posting) > MAX_SCANNED_POSTINGS
+            ):
+                break
+            scanned += len(posting)
+            weight = weights[term]
+            for position in posting:
+                scores[position] = scores.get(position, 0.0) + weight
+        candidates = heapq.nlargest(k * RERANK_FACTOR, scores, key=scores.__getitem__)
+
+        # Second pass: the exact cosine similarity of the best candidates.
+        query_norm = math.sqrt(sum(weights.values()))
+        ranked = []
+        for position in candidates:
+            task_terms = self._terms[position]
+            dot = sum(weights[term] for term in query & task_terms)
+            norm = math.sqrt(sum(
+                weights.get(term) or self._weight(term, total) for term in task_terms
+            ))
+            similarity = dot / (query_norm * norm)
+            if similarity >= min_similarity:
+                ranked.append((position, similarity))
+        return heapq.nlargest(k, ranked, key=itemgetter(1))
+
+    def _weight(self, term: str, total: int) -> float:
+        """Returns a term's squared weight: a smoothed, always positive IDF."""
+        idf = math.log((total + 1) / (len(self._postings.get(term, ())) + 1)) + 1
+        return idf * idf
+
+_default_index: Optional[ExampleIndex] = None
+_default_index_lock = threading.Lock()
+_examples = FEW_SHOT_EXAMPLES
+_enabled = _examples > 0
+_path = FEW_SHOT_INDEX_PATH
+
+def set_enabled(
+    enabled: bool, path: Optional[str] = None, examples: Optional[int] = None
+) -> None:
+    """Turns few-shot examples on or off, overriding `FEW_SHOT_EXAMPLES`.
+
+    Args:
+        enabled: Whether examples are retrieved and recorded.
+        path: An index file to use instead of `FEW_SHOT_INDEX_PATH`, ""
+            for an in-memory index.
+        examples: The examples shown per task instead of `FEW_SHOT_EXAMPLES`.
+    """
+    global _enabled, _examples, _path, _default_index
+    _enabled = enabled
+    if examples is not None:
+        _examples = examples
+    if path is not None and path != _path:
+        with _default_index_lock:
+            _path = path
+            _default_index = None
+
+def get_example_index() -> Optional[ExampleIndex]:
+    """Returns the process-wide example index, or None if it is off."""
+    global _default_index
+    if not _enabled:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = ExampleIndex(_path)
+        return _default_index
+
+def find_examples(task: str) -> list[Example]:
+    """Returns the solved tasks to show before a task's first prompt.
+
+    At most `FEW_SHOT_EXAMPLES` tasks at least `FEW_SHOT_MIN_SIMILARITY`
+    similar are returned, as long as they fit in `FEW_SHOT_MAX_TOKENS`.
+    """
+    index = get_example_index()
+    if index is None:
+        return []
+    examples, tokens = [], 0
+    for example in index.search(task, _examples, FEW_SHOT_MIN_SIMILARITY):
+        tokens += len(example.task + example.code + example.tests) // CHARS_PER_TOKEN
+        if tokens > FEW_SHOT_MAX_TOKENS:
+            break
+        examples.append(example)
+    return examples
+
+def record_solution(task: str, code: str, tests: str) -> None:
+    """Stores a task whose tests passed, if the index is on.
+
+    The tests are the model's own, so the solution is only as trustworthy
+    as they are.
+    """
+    index = get_example_index()
+    if index is not None:
+        index.add(task, code, tests)
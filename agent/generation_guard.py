@@ -0,0 +1,160 @@
+"""
+Guards that stop runaway LLM generations early.
+
+Local models sometimes ramble past the expected output, repeat the same
+block over and over, or stall mid-response. A `GenerationGuard` watches a
+streamed response and raises `GenerationStopped` as soon as one of its
+`GenerationLimits` is crossed:
+
+- "max_tokens": the response is longer than its token budget.
+- "repetition": the last `repetition_block` characters already occur
+  `max_repeats` times in the recent output, i.e. the model is looping.
+- "stall": no chunk arrived within the first-token or stall timeout.
+- "deadline": the task's overall deadline passed.
+
+The caller closes the stream when that happens, which cancels the request
+on the provider's side and frees the backend for other calls. A call that
+is still waiting for a concurrency slot at the deadline is stopped too (see
+`deadline_slot`).
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from agent import metrics
+from agent.concurrency import ConcurrencyLimiter
+from agent.llm_cache import CHARS_PER_TOKEN
+from config import (
+    LLM_FIRST_TOKEN_TIMEOUT,
+    LLM_MAX_OUTPUT_TOKENS,
+    LLM_REPETITION_BLOCK_CHARS,
+    LLM_REPETITION_MAX_REPEATS,
+    LLM_STALL_TIMEOUT,
+)
+
+# The repetition window, in blocks: loops with a period of up to a third of
+# the window are detected.
+REPETITION_WINDOW_BLOCKS = 16
+
+class GenerationStopped(ValueError):
+    """Raised when a guard stops a generation before it finished.
+
+    It is a `ValueError`, like a malformed response, so the agent loop
+    treats it as a failed attempt.
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+@dataclass
+class GenerationLimits:
+    """The limits of one LLM call. Zero or None disables a limit."""
+
+    max_tokens: int = LLM_MAX_OUTPUT_TOKENS
+    first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT
+    stall_timeout: float = LLM_STALL_TIMEOUT
+    repetition_block: int = LLM_REPETITION_BLOCK_CHARS
+    max_repeats: int = LLM_REPETITION_MAX_REPEATS
+    # A `time.monotonic()` time by which the call must be over.
+    deadline: Optional[float] = None
+
+class GenerationGuard:
+    """Checks one streamed response against its limits."""
+
+    def __init__(self, limits: Optional[GenerationLimits] = None):
+        self.limits = limits or GenerationLimits()
+        self.chars = 0
+        self.chunks = 0
+        self._window = ""
+        self._window_chars = self.limits.repetition_block * REPETITION_WINDOW_BLOCKS
+
+    def timeout(self) -> Optional[float]:
+        """Returns how long to wait for the next chunk, None for no limit.
+
+        Raises:
+            GenerationStopped: If the deadline has already passed.
+        """
+        limits = self.limits
+        timeout = limits.stall_timeout if self.chunks else limits.first_token_timeout
+        timeout = timeout or None
+        if limits.deadline is not None:
+            remaining = limits.deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._stop("deadline", "The task's deadline passed during generation.")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def time_to_deadline(self) -> Optional[float]:
+        """Returns the seconds left before the deadline, None without one.
+
+        Raises:
+            GenerationStopped: If the deadline has already passed.
+        """
+        if self.limits.deadline is None:
+            return None
+        remaining = self.limits.deadline - time.monotonic()
+        if remaining <= 0:
+            raise self._stop("deadline", "The task's deadline passed during generation.")
+        return remaining
+
+    def timed_out(self) -> GenerationStopped:
+        """Returns the error for a chunk that didn't arrive in time."""
+        if self.limits.deadline is not None and time.monotonic() >= self.limits.deadline:
+            return self._stop("deadline", "The task's deadline passed during generation.")
+        if self.chunks:
+            return self._stop("stall", f"No output for {self.limits.stall_timeout:g}s.")
+        return self._stop("stall", f"No output within {self.limits.first_token_timeout:g}s.")
+
+    def feed(self, chunk: str) -> None:
+        """Checks a newly received chunk.
+
+        Raises:
+            GenerationStopped: If the response crossed a limit.
+        """
+        limits = self.limits
+        self.chunks += 1
+        self.chars += len(chunk)
+        if limits.max_tokens and self.chars // CHARS_PER_TOKEN > limits.max_tokens:
+            raise self._stop(
+                "max_tokens", f"The response exceeded {limits.max_tokens} tokens."
+            )
+        if limits.repetition_block and limits.max_repeats:
+            self._window = (self._window + chunk)[-self._window_chars:]
+            block = self._window[-limits.repetition_block:]
+            if (
+                len(self._window) >= limits.repetition_block * limits.max_repeats
+                and self._window.count(block) >= limits.max_repeats
+            ):
+                raise self._stop("repetition", "The response started repeating itself.")
+        if limits.deadline is not None and time.monotonic() >= limits.deadline:
+            raise self._stop("deadline", "The task's deadline passed during generation.")
+
+    @staticmethod
+    def _stop(reason: str, message: str) -> GenerationStopped:
+        metrics.record_generation_stop(reason)
+        return GenerationStopped(reason, f"Generation stopped: {message}")
+
+@asynccontextmanager
+async def deadline_slot(
+    limiter: Optional[ConcurrencyLimiter], guard: GenerationGuard
+) -> AsyncIterator[None]:
+    """Holds a concurrency slot, waiting for it no later than the deadline.
+
+    Raises:
+        GenerationStopped: If the deadline passed before a slot was free.
+    """
+    if limiter is None:
+        yield
+        return
+    try:
+        async with asyncio.timeout(guard.time_to_deadline()):
+            await limiter.__aenter__()
+    except TimeoutError:
+        raise guard.timed_out() from None
+    try:
+        yield
+    finally:
+        await limiter.__aexit__(None, None, None)
@@ -0,0 +1,493 @@
+"""
+A bounded, prioritized job queue for long-running generation tasks.
+
+Clients submit a task and poll for its result instead of holding an HTTP
+connection open for the whole agent loop. Job state lives in a pluggable
+`JobBackend`: `InMemoryJobBackend` for a single process, or
+`SQLiteJobBackend` for a queue that survives restarts and can be shared by
+several API processes on the same host.
+
+A process running a job from a shared backend holds a lease on it, which its
+queue renews while the job runs. A job whose lease lapses, because the
+process running it was killed, goes back to the queue for another worker.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from agent.cache import content_key
+from config import JOB_LEASE_SECONDS
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+@dataclass
+class Job:
+    """A generation task and its progress through the queue."""
+
+    task_description: str
+    max_tries: int
+    priority: int = 0
+    candidates: Optional[int] = None
+    # The Unix time by which the job must be finished, if any.
+    deadline: Optional[float] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    @property
+    def dedupe_key(self) -> str:
+        """Identical task descriptions and settings share this key."""
+        return content_key(self.task_description, self.max_tries, self.candidates)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "Job":
+        return cls(**json.loads(data))
+
+class JobBackend(ABC):
+    """Stores jobs and hands queued ones out to workers."""
+
+    # Seconds a claimed job is held without a renewal, or None when jobs
+    # can't outlive the process running them.
+    lease_seconds: Optional[float] = None
+
+    @abstractmethod
+    def add(self, job: Job) -> None:
+        """Stores a new job."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns a job by id."""
+
+    @abstractmethod
+    def save(self, job: Job) -> None:
+        """Stores the updated state of an existing job."""
+
+    @abstractmethod
+    def claim_next(self) -> Optional[Job]:
+        """Atomically marks the next queued job as running and returns it.
+
+        Jobs with a higher priority go first, then the oldest ones.
+        """
+
+    @abstractmethod
+    def cancel_if_queued(self, job_id: str) -> Optional[Job]:
+        """Atomically cancels a job that is still queued.
+
+        Returns:
+            The cancelled job, or None if the job doesn't exist or was no
+            longer queued.
+        """
+
+    @abstractmethod
+    def find_active(self, dedupe_key: str) -> Optional[Job]:
+        """Returns a queued or running job with the same dedupe key."""
+
+    @abstractmethod
+    def count_queued(self) -> int:
+        """Returns the number of jobs waiting to run."""
+
+    @abstractmethod
+    def purge_finished(self, before: float) -> int:
+        """Deletes jobs that finished before a timestamp. Returns the count."""
+
+    def renew(self, job_ids: list[str]) -> None:
+        """Extends the leases of jobs this process is running."""
+
+class InMemoryJobBackend(JobBackend):
+    """Keeps jobs in a dictionary; suitable for a single API process."""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            if job.id in self._jobs:
+                self._jobs[job.id] = job
+
+    def claim_next(self) -> Optional[Job]:
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job.status == QUEUED]
+            if not queued:
+                return None
+            job = min(queued, key=lambda j: (-j.priority, j.created_at))
+            job.status = RUNNING
+            job.started_at = time.time()
+            return job
+
+    def cancel_if_queued(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return None
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return job
+
+    def find_active(self, dedupe_key: str) -> Optional[Job]:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status in ACTIVE_STATUSES and job.dedupe_key == dedupe_key:
+                    return job
+        return None
+
+    def count_queued(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def purge_finished(self, before: float) -> int:
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+class SQLiteJobBackend(JobBackend):
+    """Keeps jobs in a SQLite file that several processes can share.
+
+    A running job whose lease has lapsed is requeued by the next
+    `claim_next` or `find_active`, so it is neither left running nor
+    returned as a duplicate while nothing runs it.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        """Opens (and creates if needed) the job database.
+
+        Args:
+            path: The path of the SQLite database file.
+            lease_seconds: Seconds a claimed job is held without a renewal.
+        """
+        self.lease_seconds = lease_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, timeout=5, isolation_level=None
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, finished_at REAL, dedupe_key TEXT NOT NULL,"
+                " data TEXT NOT NULL, lease_expires REAL)"
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+            if "lease_expires" not in columns:
+                # Jobs left running by a version without leases are requeued
+                # by the next claim or lookup.
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_queue"
+                " ON jobs (status, priority DESC, created_at)"
+            )
+
+    def _write(self, job: Job, lease_expires: Optional[float] = None) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO jobs"
+            " (id, status, priority, created_at, finished_at, dedupe_key, data, lease_expires)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.status, job.priority, job.created_at, job.finished_at,
+             job.dedupe_key, job.to_json(), lease_expires),
+        )
+
+    def _requeue_expired(self, now: float) -> None:
+        """Puts running jobs whose lease lapsed back in the queue."""
+        rows = self._connection.execute(
+            "SELECT data FROM jobs WHERE status = ?"
+            " AND (lease_expires IS NULL OR lease_expires < ?)",
+            (RUNNING, now),
+        ).fetchall()
+        for (data,) in rows:
+            job = Job.from_json(data)
+            job.status = QUEUED
+            job.started_at = None
+            self._write(job)
+
+    def add(self, job: Job) -> None:
+        with self._lock:
+            self._write(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return Job.from_json(row[0]) if row else None
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._write(job)
+
+    def claim_next(self) -> Optional[Job]:
+        with self._lock:
+            # An immediate transaction stops two processes claiming one job.
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired(now)
+                row = self._connection.execute(
+                    "SELECT data FROM jobs WHERE status = ?"
+                    " ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is None:
+                    self._connection.execute("COMMIT")
+                    return None
+                job = Job.from_json(row[0])
+                job.status = RUNNING
+                job.started_at = now
+                self._write(job, now + self.lease_seconds)
+                self._connection.execute("COMMIT")
+                return job
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def cancel_if_queued(self, job_id: str) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            # One conditional update, so a job claimed by another process in
+            # the meantime is left running.
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?,"
+                " data = json_set(data, '$.status', ?, '$.finished_at', ?)"
+                " WHERE id = ? AND status = ?",
+                (CANCELLED, now, CANCELLED, now, job_id, QUEUED),
+            )
+        return self.get(job_id) if cursor.rowcount else None
+
+    def find_active(self, dedupe_key: str) -> Optional[Job]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose lease lapsed is requeued rather than reported
+                # as running in a process that is gone.
+                self._requeue_expired(time.time())
+                row = self._connection.execute(
+                    "SELECT data FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) LIMIT 1",
+                    (dedupe_key, *ACTIVE_STATUSES),
+                ).fetchone()
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return Job.from_json(row[0]) if row else None
+
+    def count_queued(self) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()
+        return row[0]
+
+    def purge_finished(self, before: float) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (before,),
+            )
+        return cursor.rowcount
+
+    def renew(self, job_ids: list[str]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ?",
+                [(time.time() + self.lease_seconds, job_id, RUNNING) for job_id in job_ids],
+            )
+
+# Runs a claimed job and returns its result.
+JobRunner = Callable[[Job], Awaitable[dict]]
+
+class JobQueue:
+    """Runs queued jobs on a fixed number of asyncio workers."""
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        run_job: JobRunner,
+        workers: int,
+        max_queued: int,
+        result_ttl: float,
+        poll_interval: float = 1.0,
+        purge_interval: float = 60.0,
+    ):
+        """Initializes the queue without starting its workers.
+
+        Args:
+            backend: Where jobs are stored.
+            run_job: Coroutine function that executes a job.
+            workers: Number of jobs run at the same time by this process.
+            max_queued: Maximum number of jobs waiting to run.
+            result_ttl: Seconds a finished job is kept before it is purged.
+            poll_interval: Seconds between checks for jobs submitted by
+                other processes sharing the backend.
+            purge_interval: Seconds between deletions of expired finished
+                jobs.
+        """
+        self.backend = backend
+        self.run_job = run_job
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._wakeup = asyncio.Event()
+        self._worker_tasks: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        """Starts the worker tasks, the purge, and the lease renewal if the backend uses leases."""
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._work()))
+        self._worker_tasks.append(asyncio.create_task(self._purge()))
+        if self.backend.lease_seconds is not None:
+            self._worker_tasks.append(asyncio.create_task(self._renew_leases()))
+
+    async def stop(self) -> None:
+        """Stops the workers and puts interrupted jobs back in the queue."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    def submit(
+        self,
+        task_description: str,
+        max_tries: int,
+        priority: int = 0,
+        candidates: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> Job:
+        """Queues a job, or returns the in-flight job for an identical task.
+
+        Raises:
+            QueueFullError: If `max_queued` jobs are already waiting.
+        """
+        job = Job(
+            task_description=task_description,
+            max_tries=max_tries,
+            priority=priority,
+            candidates=candidates,
+            deadline=deadline,
+        )
+        existing = self.backend.find_active(job.dedupe_key)
+        if existing is not None:
+            return existing
+        if self.backend.count_queued() >= self.max_queued:
+            raise QueueFullError(f"The job queue is full ({self.max_queued} jobs waiting).")
+        self.backend.add(job)
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns a job by id."""
+        return self.backend.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancels a queued job, or a job running in this process.
+
+        Returns:
+            The job, or None if it does not exist.
+        """
+        cancelled = self.backend.cancel_if_queued(job_id)
+        if cancelled is not None:
+            return cancelled
+        job = self.backend.get(job_id)
+        task = self._running.get(job_id)
+        if job is None or task is None:
+            # Finished, or running in another process, where it can't be
+            # interrupted from here.
+            return job
+        # This process owns the job, so no other writer can race the save.
+        task.cancel()
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        self.backend.save(job)
+        return job
+
+    async def _work(self) -> None:
+        """Claims and runs jobs until cancelled."""
+        while True:
+            self._wakeup.clear()
+            # Backend calls may block on SQLite, so they run off the event loop.
+            job = await asyncio.to_thread(self.backend.claim_next)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _purge(self) -> None:
+        """Deletes expired finished jobs every `purge_interval` seconds, busy or not."""
+        while True:
+            await asyncio.to_thread(self.backend.purge_finished, time.time() - self.result_ttl)
+            await asyncio.sleep(self.purge_interval)
+
+    async def _renew_leases(self) -> None:
+        """Renews the leases of the running jobs a few times per lease."""
+        while True:
+            await asyncio.sleep(self.backend.lease_seconds / 3)
+            if self._running:
+                await asyncio.to_thread(self.backend.renew, list(self._running))
+
+    async def _run(self, job: Job) -> None:
+        """Runs one job and records its outcome."""
+        task = asyncio.create_task(self.run_job(job))
+        self._running[job.id] = task
+        try:
+            job.result = await asyncio.shield(task)
+            job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # The worker itself is stopping: requeue the job.
+                task.cancel()
+                job.status = QUEUED
+                job.started_at = None
+                await asyncio.to_thread(self.backend.save, job)
+                raise
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            self._running.pop(job.id, None)
+        job.finished_at = time.time()
+        await asyncio.to_thread(self.backend.save, job)
@@ -0,0 +1,114 @@
+"""
+A content-addressed cache of LLM responses.
+
+Responses are keyed by a hash of the provider, model, temperature and the
+fully formatted prompt, so identical generation and revision requests are
+answered without another LLM round trip.
+"""
+import json
+import threading
+from typing import Optional
+
+from agent.cache import LRUCache, SQLiteCache, TieredCache, content_key
+from config import (
+    LLM_CACHE,
+    LLM_CACHE_DISK_MAX_BYTES,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_PATH,
+    LLM_TEMPERATURE,
+)
+
+# Rough characters-per-token ratio used to estimate the tokens saved.
+CHARS_PER_TOKEN = 4
+
+class ResponseCache:
+    """Caches LLM responses and tracks the latency and tokens they save."""
+
+    def __init__(self, cache: TieredCache):
+        """Initializes the response cache.
+
+        Args:
+            cache: The tiered store holding serialized responses.
+        """
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def key(
+        provider: str, model_name: str, temperature: float, prompt: str, sample: int = 0
+    ) -> str:
+        """Builds the cache key for a generation request.
+
+        Independent samples of the same prompt (see `LLMInterface.astream`)
+        get distinct keys, so they aren't all answered with one response.
+        """
+        if sample:
+            return content_key(provider, model_name, temperature, prompt, sample)
+        return content_key(provider, model_name, temperature, prompt)
+
+    def get(self, key: str, prompt: str) -> Optional[str]:
+        """Returns the cached response for a key, if any.
+
+        Args:
+            key: The key built by `ResponseCache.key`.
+            prompt: The prompt, used to estimate the tokens saved by a hit.
+        """
+        raw = self.cache.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        with self._lock:
+            self.saved_seconds += entry["latency"]
+            self.saved_tokens += (len(prompt) + len(entry["response"])) // CHARS_PER_TOKEN
+        return entry["response"]
+
+    def put(self, key: str, response: str, latency: float) -> None:
+        """Stores a response together with the latency it took to produce."""
+        self.cache.put(key, json.dumps({"response": response, "latency": latency}))
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the estimated savings."""
+        return {
+            **self.cache.stats(),
+            "saved_seconds": round(self.saved_seconds, 3),
+            "saved_tokens_estimate": self.saved_tokens,
+        }
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            disk = None
+            if LLM_CACHE_PATH:
+                disk = SQLiteCache(
+                    LLM_CACHE_PATH, table="llm_responses", max_bytes=LLM_CACHE_DISK_MAX_BYTES
+                )
+            _default_cache = ResponseCache(TieredCache(LRUCache(LLM_CACHE_MAX_BYTES), disk))
+        return _default_cache
+
+def response_cache_stats() -> dict:
+    """Returns the response cache's stats, without creating a disabled cache."""
+    if _default_cache is None and not cache_enabled(LLM_TEMPERATURE):
+        return {"enabled": False}
+    return {"enabled": True, **get_response_cache().stats()}
+
+def cache_enabled(temperature: float, use_cache: Optional[bool] = None) -> bool:
+    """Decides whether responses at a given temperature should be cached.
+
+    Sampling above temperature 0 is not deterministic, so caching is only on
+    by default for temperature 0. `use_cache` or the `LLM_CACHE` setting
+    ("on", "off" or "auto") can opt in or out explicitly.
+    """
+    if use_cache is not None:
+        return use_cache
+    if LLM_CACHE == "on":
+        return True
+    if LLM_CACHE == "off":
+        return False
+    return temperature == 0
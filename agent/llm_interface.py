@@ -1,67 +1,401 @@
 """
 This module provides a standardized interface for interacting with different
 language models using the LangChain framework.
+
+Prompts are either a single user message or a conversation of
+(role, content) messages, with roles "system", "human" and "ai".
+
+The LangChain, provider SDK and HTTP client imports take most of a cold
+start, so they are deferred until an interface is built, and only the
+provider in use is loaded.
+
+Every generation is checked against `GenerationLimits` as it streams in
+(see `agent.generation_guard`), and the token budget is also sent to the
+provider as its output cap.
 """
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from pydantic import SecretStr
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import AsyncIterator, Callable, Iterator, Optional, Sequence, Union
+
+from agent import metrics
+from agent.concurrency import ConcurrencyLimiter
+from agent.generation_guard import GenerationGuard, GenerationLimits, deadline_slot
+from agent.llm_cache import ResponseCache, cache_enabled, get_response_cache
+from config import (
+    LLM_PROVIDER,
+    MODEL,
+    LLM_TEMPERATURE,
+    OPENAI_API_KEY,
+    OLLAMA_HOST,
+    OLLAMA_KEEP_ALIVE,
+    LLM_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_OUTPUT_TOKENS,
+    export_provider_env,
+)
 
-from config import LLM_PROVIDER, MODEL, OPENAI_API_KEY, OLLAMA_HOST
+# httpcore trace events marking a newly opened connection.
+_CONNECT_EVENTS = ("connect_tcp.complete", "connect_unix_socket.complete")
+
+# A single user message, or a conversation of (role, content) messages.
+Prompt = Union[str, Sequence[tuple[str, str]]]
+
+def as_messages(prompt: Prompt) -> list[tuple[str, str]]:
+    """Returns a prompt as a list of (role, content) messages."""
+    if isinstance(prompt, str):
+        return [("human", prompt)]
+    return list(prompt)
+
+def prompt_text(prompt: Prompt) -> str:
+    """Returns the text of a prompt's messages, used to estimate its tokens."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(content for _, content in prompt)
 
 class LLMInterface:
     """A wrapper for language models to provide a consistent interface."""
 
-    def __init__(self):
-        """Initializes the LLM interface based on the configured provider."""
-        self.provider = LLM_PROVIDER
-        self.model_name = MODEL
-        self.temperature = 0.7
+    def __init__(
+        self,
+        provider: Optional[str] = None,
+        model_name: Optional[str] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        use_cache: Optional[bool] = None,
+        cache: Optional[ResponseCache] = None,
+        base_url: Optional[str] = None,
+    ):
+        """Initializes the LLM interface based on the configured provider.
+
+        Args:
+            provider: The LLM provider to use. Defaults to `LLM_PROVIDER`.
+            model_name: The model to use. Defaults to `MODEL`.
+            limiter: An optional limiter shared with other interfaces of the
+                same provider, used to cap concurrent LLM calls.
+            use_cache: Explicitly enables or disables the response cache. By
+                default it is only enabled at temperature 0 (see `LLM_CACHE`).
+            cache: The response cache to use. Defaults to the shared one.
+            base_url: The provider endpoint. Defaults to `OLLAMA_HOST` for
+                Ollama and to the SDK's default for OpenAI.
+        """
+        self.provider = provider or LLM_PROVIDER
+        self.model_name = model_name or MODEL
+        self.temperature = LLM_TEMPERATURE
+        self.limiter = limiter
+        self.cache = None
+        if cache_enabled(self.temperature, use_cache):
+            self.cache = cache or get_response_cache()
+
+        # Call accounting, read by LLMPool to report connection reuse.
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        # HTTP requests sent, and connections opened for them, as traced by
+        # the HTTP clients.
+        self.http_requests = 0
+        self.connections_opened = 0
+
+        # The SDKs read some of their settings from the environment.
+        export_provider_env()
+        import httpx
+
+        # Keep-alive limits shared by the sync and async HTTP clients, so
+        # connections are reused across calls instead of re-handshaking.
+        limits = httpx.Limits(
+            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        hooks = {"event_hooks": {"request": [self._trace_request]}}
+        async_hooks = {"event_hooks": {"request": [self._async_trace_request]}}
+        self._http_clients: list[httpx.Client] = []
+        self._async_http_clients: list[httpx.AsyncClient] = []
 
         if self.provider == "openai":
+            from langchain_openai import ChatOpenAI
+            from pydantic import SecretStr
+
+            http_client = httpx.Client(limits=limits, **hooks)
+            http_async_client = httpx.AsyncClient(limits=limits, **async_hooks)
+            self._http_clients.append(http_client)
+            self._async_http_clients.append(http_async_client)
             self.model = ChatOpenAI(
                 model=self.model_name,
                 temperature=self.temperature,
-                api_key=SecretStr(OPENAI_API_KEY) if OPENAI_API_KEY else None
+                api_key=SecretStr(OPENAI_API_KEY) if OPENAI_API_KEY else None,
+                base_url=base_url,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                max_tokens=LLM_MAX_OUTPUT_TOKENS or None,
             )
         elif self.provider == "ollama":
+            from langchain_ollama import ChatOllama
+
+            # Keeping the model loaded between calls lets Ollama reuse the
+            # KV cache of a conversation's unchanged prefix.
             self.model = ChatOllama(
                 model=self.model_name,
                 temperature=self.temperature,
-                base_url=OLLAMA_HOST
+                base_url=base_url or OLLAMA_HOST,
+                keep_alive=OLLAMA_KEEP_ALIVE or None,
+                num_predict=LLM_MAX_OUTPUT_TOKENS or None,
+                client_kwargs={"limits": limits},
+                sync_client_kwargs=hooks,
+                async_client_kwargs=async_hooks,
             )
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
 
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
         # Define the LangChain processing chain.
         # This combines a prompt template, the model, and an output parser.
-        self.prompt_template = ChatPromptTemplate.from_template("{prompt}")
+        self.prompt_template = ChatPromptTemplate.from_messages([MessagesPlaceholder("messages")])
         self.output_parser = StrOutputParser()
         self.chain = self.prompt_template | self.model | self.output_parser
 
-    def generate(self, prompt: str, verbose: bool = False) -> str:
+    def _trace_request(self, request) -> None:
+        """Counts an HTTP request, and traces it for new connections."""
+        with self._stats_lock:
+            self.http_requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _async_trace_request(self, request) -> None:
+        with self._stats_lock:
+            self.http_requests += 1
+        request.extensions["trace"] = self._async_trace
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name.endswith(_CONNECT_EVENTS):
+            with self._stats_lock:
+                self.connections_opened += 1
+
+    async def _async_trace(self, event_name: str, info: dict) -> None:
+        self._trace(event_name, info)
+
+    def connection_stats(self) -> dict:
+        """Returns the HTTP requests sent and the connections opened for them."""
+        with self._stats_lock:
+            return {
+                "http_requests": self.http_requests,
+                "connections_opened": self.connections_opened,
+            }
+
+    def _limit(self):
+        """Returns the concurrency slot to hold for one LLM call."""
+        return self.limiter if self.limiter is not None else nullcontext()
+
+    @contextmanager
+    def _track_call(self) -> Iterator[None]:
+        """Records a call as in flight while it runs."""
+        with self._stats_lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+
+    def _cached(self, prompt: Prompt, sample: int = 0) -> tuple[Optional[str], Optional[str]]:
+        """Looks a prompt up in the response cache.
+
+        Returns:
+            The cache key (None when caching is disabled) and the cached
+            response (None on a miss).
+        """
+        if self.cache is None:
+            return None, None
+        key_text = prompt if isinstance(prompt, str) else json.dumps(as_messages(prompt))
+        key = self.cache.key(
+            self.provider, self.model_name, self.temperature, key_text, sample
+        )
+        return key, self.cache.get(key, prompt_text(prompt))
+
+    def _store(self, cache_key: Optional[str], response: str, latency: float) -> None:
+        """Stores a fresh response in the cache when caching is enabled."""
+        if self.cache is not None and cache_key is not None:
+            self.cache.put(cache_key, response, latency)
+
+    def _finish(
+        self, cache_key: Optional[str], prompt: Prompt, response: str, latency: float
+    ) -> None:
+        """Records a completed LLM call and caches its response."""
+        metrics.observe("llm", latency)
+        metrics.record_tokens(prompt_text(prompt), response)
+        self._store(cache_key, response, latency)
+
+    @staticmethod
+    def _print_prompt(prompt: Prompt) -> None:
+        print("\n--- Sending Prompt to LLM ---")
+        if isinstance(prompt, str):
+            print(prompt)
+        else:
+            for role, content in prompt:
+                print(f"[{role}]\n{content}")
+        print("-----------------------------")
+
+    @staticmethod
+    def _print_response(response: str) -> None:
+        print("\n--- Received LLM Response ---")
+        print(response)
+        print("-----------------------------")
+
+    def generate(
+        self, prompt: Prompt, verbose: bool = False, limits: Optional[GenerationLimits] = None
+    ) -> str:
         """Generates a response from the language model using a prompt.
 
+        The response is streamed so the generation limits can stop it early.
+        A blocking call can't be interrupted between chunks, so the first
+        token and stall timeouts only apply to the async methods.
+
         Args:
-            prompt: The input prompt to send to the language model.
+            prompt: The input prompt or conversation to send to the language model.
             verbose: If True, prints the prompt and raw response.
+            limits: The limits of this call. Defaults to the configured ones.
 
         Returns:
             A string containing the language model's response.
+
+        Raises:
+            GenerationStopped: If the response crossed one of the limits.
         """
         if verbose:
-            print("\n--- Sending Prompt to LLM ---")
-            print(prompt)
-            print("-----------------------------")
+            self._print_prompt(prompt)
 
-        # Invoke the LangChain chain with the prompt.
-        response = self.chain.invoke({"prompt": prompt})
+        cache_key, response = self._cached(prompt)
+        if response is None:
+            guard = GenerationGuard(limits)
+            chunks = []
+            with self._limit(), self._track_call():
+                start = time.perf_counter()
+                stream = self.chain.stream({"messages": as_messages(prompt)})
+                try:
+                    for chunk in stream:
+                        guard.feed(chunk)
+                        chunks.append(chunk)
+                finally:
+                    # Closing the stream closes the connection, which cancels
+                    # a generation stopped early.
+                    stream.close()
+            response = "".join(chunks)
+            self._finish(cache_key, prompt, response, time.perf_counter() - start)
 
         if verbose:
-            print("\n--- Received LLM Response ---")
-            print(response)
-            print("-----------------------------")
-            
+            self._print_response(response)
+
         return response.strip()
 
+    async def async_generate(
+        self, prompt: Prompt, verbose: bool = False, limits: Optional[GenerationLimits] = None
+    ) -> str:
+        """Asynchronously generates a response from the language model.
+
+        Unlike `generate`, this does not block the calling thread while the
+        model responds, so a single event loop can serve many calls at once.
+
+        Args:
+            prompt: The input prompt or conversation to send to the language model.
+            verbose: If True, prints the prompt and raw response.
+            limits: The limits of this call. Defaults to the configured ones.
+
+        Returns:
+            A string containing the language model's response.
+
+        Raises:
+            GenerationStopped: If the response crossed one of the limits.
+        """
+        chunks = [chunk async for chunk in self.astream(prompt, verbose=verbose, limits=limits)]
+        return "".join(chunks).strip()
+
+    async def astream(
+        self,
+        prompt: Prompt,
+        verbose: bool = False,
+        sample: int = 0,
+        limits: Optional[GenerationLimits] = None,
+        complete: Optional[Callable[[], bool]] = None,
+    ) -> AsyncIterator[str]:
+        """Streams a response from the language model as it is generated.
+
+        Cached responses are yielded as a single chunk. If the caller stops
+        iterating early, the underlying request is cancelled, and the part of
+        the response consumed so far is cached only if `complete` says it is
+        the whole useful response; a stream closed or cancelled for any other
+        reason caches nothing. If the response crosses one of its limits,
+        the request is cancelled too and nothing is cached.
+
+        Args:
+            prompt: The input prompt or conversation to send to the language model.
+            verbose: If True, prints the prompt and the full raw response.
+            sample: Index of an independent sample of the same prompt. Each
+                sample is cached separately, so concurrent candidates for one
+                prompt don't collapse into a single cached response.
+            limits: The limits of this call. Defaults to the configured ones.
+            complete: Called when the caller stops iterating early. Returns
+                True if what it consumed is a complete response.
+
+        Yields:
+            Chunks of the language model's response, in order.
+
+        Raises:
+            GenerationStopped: If the response crossed one of the limits.
+        """
+        if verbose:
+            self._print_prompt(prompt)
+
+        cache_key, response = self._cached(prompt, sample)
+        if response is not None:
+            yield response
+        else:
+            guard = GenerationGuard(limits)
+            chunks = []
+            completed = False
+            try:
+                async with deadline_slot(self.limiter, guard):
+                    with self._track_call():
+                        start = time.perf_counter()
+                        stream = self.chain.astream({"messages": as_messages(prompt)})
+                        try:
+                            while True:
+                                try:
+                                    async with asyncio.timeout(guard.timeout()):
+                                        chunk = await anext(stream)
+                                except StopAsyncIteration:
+                                    break
+                                except TimeoutError:
+                                    raise guard.timed_out() from None
+                                guard.feed(chunk)
+                                if not chunks:
+                                    metrics.observe("llm_first_token", time.perf_counter() - start)
+                                chunks.append(chunk)
+                                yield chunk
+                        finally:
+                            # Closing the stream closes the connection, which
+                            # cancels a generation stopped early.
+                            await stream.aclose()
+                completed = True
+            except GeneratorExit:
+                # The caller stopped early. What it consumed is the useful
+                # response only if it had everything it needed.
+                completed = complete is not None and complete()
+                raise
+            finally:
+                response = "".join(chunks)
+                if completed:
+                    self._finish(cache_key, prompt, response, time.perf_counter() - start)
+
+        if verbose:
+            self._print_response(response)
+
+    async def aclose(self) -> None:
+        """Closes the HTTP clients owned by this interface."""
+        for client in self._http_clients:
+            client.close()
+        for async_client in self._async_http_clients:
+            await async_client.aclose()
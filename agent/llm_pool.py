@@ -0,0 +1,139 @@
+"""
+A process-wide pool of shared LLMInterface instances.
+
+Building an `LLMInterface` creates a new LangChain chain and a new HTTP client
+with its own connection pool, so building one per request pays a fresh TCP/TLS
+handshake every time. The pool builds each (provider, model) interface once
+and hands the same instance to every caller, with a per-provider limiter
+capping how many LLM calls run at the same time (across all API workers on
+the node, when there are several).
+
+With `LLM_PROVIDER=router`, the pooled interface is an `LLMRouter` spreading
+calls over the backends listed in `LLM_BACKENDS`, each with its own limiter.
+"""
+import threading
+from typing import Callable, Optional
+
+from agent.concurrency import ConcurrencyLimiter, shared_limiter
+from agent.llm_interface import LLMInterface
+from agent.llm_router import ROUTER_PROVIDER, LLMRouter, parse_backends
+from config import LLM_PROVIDER, MODEL, LLM_CONCURRENCY_LIMITS, LLM_BACKENDS
+
+class LLMPool:
+    """Hands out shared, keep-alive LLMInterface instances."""
+
+    def __init__(
+        self,
+        concurrency_limits: Optional[dict[str, int]] = None,
+        interface_factory: Callable[..., LLMInterface] = LLMInterface,
+    ):
+        """Initializes an empty pool.
+
+        Args:
+            concurrency_limits: Maximum concurrent LLM calls per provider.
+                Defaults to `LLM_CONCURRENCY_LIMITS` from the config.
+            interface_factory: Builds each pooled interface from `provider`,
+                `model_name` and `limiter` keyword arguments. Defaults to
+                `LLMInterface`; benchmarks substitute a fake backend.
+        """
+        self.concurrency_limits = concurrency_limits or LLM_CONCURRENCY_LIMITS
+        self.interface_factory = interface_factory
+        self._lock = threading.Lock()
+        self._interfaces: dict[tuple[str, str], LLMInterface] = {}
+        self._limiters: dict[str, ConcurrencyLimiter] = {}
+        self._checkouts: dict[tuple[str, str], int] = {}
+
+    def get(
+        self, provider: Optional[str] = None, model_name: Optional[str] = None
+    ) -> LLMInterface:
+        """Returns the shared interface for a provider and model.
+
+        The interface is created on first use and reused afterwards.
+
+        Args:
+            provider: The LLM provider. Defaults to `LLM_PROVIDER`.
+            model_name: The model name. Defaults to `MODEL`.
+
+        Returns:
+            The pooled LLMInterface instance.
+        """
+        key = (provider or LLM_PROVIDER, model_name or MODEL)
+        with self._lock:
+            interface = self._get_or_create(key)
+            self._checkouts[key] += 1
+        return interface
+
+    def warm(
+        self, provider: Optional[str] = None, model_name: Optional[str] = None
+    ) -> LLMInterface:
+        """Builds an interface ahead of time without counting a checkout."""
+        with self._lock:
+            return self._get_or_create((provider or LLM_PROVIDER, model_name or MODEL))
+
+    def _get_or_create(self, key: tuple[str, str]) -> LLMInterface:
+        """Returns the interface for a key, building it if needed."""
+        interface = self._interfaces.get(key)
+        if interface is None:
+            if key[0] == ROUTER_PROVIDER:
+                # The backends come from LLM_BACKENDS; the model is ignored.
+                interface = LLMRouter.from_specs(
+                    parse_backends(LLM_BACKENDS), self.interface_factory
+                )
+            else:
+                interface = self.interface_factory(
+                    provider=key[0],
+                    model_name=key[1],
+                    limiter=self._limiter_for(key[0]),
+                )
+            self._interfaces[key] = interface
+            self._checkouts[key] = 0
+        return interface
+
+    def _limiter_for(self, provider: str) -> Optional[ConcurrencyLimiter]:
+        """Returns the limiter shared by all interfaces of a provider."""
+        limit = self.concurrency_limits.get(provider)
+        if not limit or limit <= 0:
+            return None
+        if provider not in self._limiters:
+            self._limiters[provider] = shared_limiter(limit, f"llm-{provider}")
+        return self._limiters[provider]
+
+    def stats(self) -> dict:
+        """Reports reuse statistics for every pooled interface.
+
+        Connections are counted as the HTTP clients open them, so
+        "connections_reused" is the number of HTTP requests that were sent
+        over an already open keep-alive connection instead of paying a new
+        handshake. Responses served from the cache send no request.
+
+        Returns:
+            A dictionary keyed by "provider/model" with the counters.
+        """
+        report = {}
+        with self._lock:
+            for (provider, model_name), interface in self._interfaces.items():
+                checkouts = self._checkouts[(provider, model_name)]
+                connections = interface.connection_stats()
+                report[f"{provider}/{model_name}"] = {
+                    "checkouts": checkouts,
+                    "llm_calls": interface.calls,
+                    "in_flight": interface.in_flight,
+                    "peak_in_flight": interface.peak_in_flight,
+                    "concurrency_limit": self.concurrency_limits.get(provider),
+                    **connections,
+                    "connections_reused": max(
+                        0, connections["http_requests"] - connections["connections_opened"]
+                    ),
+                }
+                if isinstance(interface, LLMRouter):
+                    report[f"{provider}/{model_name}"]["backends"] = interface.backend_stats()
+        return report
+
+    async def aclose(self) -> None:
+        """Closes every pooled interface and empties the pool."""
+        with self._lock:
+            interfaces = list(self._interfaces.values())
+            self._interfaces.clear()
+            self._checkouts.clear()
+        for interface in interfaces:
+            await interface.aclose()
@@ -0,0 +1,484 @@
+"""
+Routes LLM calls across several backends by observed latency and health.
+
+`LLMRouter` has the same calling interface as `LLMInterface` (`generate`,
+`async_generate`, `astream`, `aclose` and the call counters), but holds
+several backends, e.g. a few Ollama hosts and an OpenAI fallback. For each
+call it picks the healthy backend with the lowest expected latency: its
+exponentially weighted moving average (EWMA) latency, scaled by how busy it
+is. Backends are grouped in tiers, and a higher tier is only used while
+every lower one is unhealthy or at its concurrency cap.
+
+A backend that fails is skipped for the call and the next best one is tried.
+Once its error rate reaches `ROUTER_ERROR_THRESHOLD` it is taken out of
+rotation for `ROUTER_COOLDOWN_SECONDS`, then given another chance.
+
+Async calls are hedged: if the chosen backend hasn't answered (or, for a
+stream, sent its first chunk) within its recent `ROUTER_HEDGE_PERCENTILE`
+latency, the same request is also sent to the next best backend with spare
+capacity, and whichever answers first is used. The other request is
+cancelled.
+
+A backend that stalls (see `agent.generation_guard`) counts as failed. A
+generation stopped for its length, repetition or deadline is the model's or
+the task's problem rather than the backend's, so it is raised to the caller
+without failing over.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from agent.concurrency import ConcurrencyLimiter, shared_limiter
+from agent.generation_guard import (
+    GenerationGuard,
+    GenerationLimits,
+    GenerationStopped,
+    deadline_slot,
+)
+from agent.llm_interface import LLMInterface, Prompt
+from config import (
+    LLM_CONCURRENCY_LIMITS,
+    ROUTER_EWMA_ALPHA,
+    ROUTER_ERROR_THRESHOLD,
+    ROUTER_COOLDOWN_SECONDS,
+    ROUTER_HEDGE_PERCENTILE,
+    ROUTER_HEDGE_MIN_SAMPLES,
+)
+
+ROUTER_PROVIDER = "router"
+# Latency samples kept per backend for the hedging percentile.
+LATENCY_WINDOW = 200
+
+@dataclass
+class BackendSpec:
+    """The configuration of one router backend."""
+
+    provider: str
+    model: str
+    base_url: Optional[str] = None
+    max_concurrency: Optional[int] = None
+    tier: int = 0
+    name: Optional[str] = None
+
+def parse_backends(spec: str) -> list[BackendSpec]:
+    """Parses the `LLM_BACKENDS` setting.
+
+    Raises:
+        ValueError: If the setting isn't a non-empty JSON list of backends.
+    """
+    try:
+        entries = json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM_BACKENDS is not valid JSON: {e}") from e
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("LLM_BACKENDS must be a non-empty JSON list")
+    try:
+        return [BackendSpec(**entry) for entry in entries]
+    except TypeError as e:
+        raise ValueError(f"Invalid LLM_BACKENDS entry: {e}") from e
+
+class LatencyStats:
+    """An EWMA and a sliding window of latencies, in seconds."""
+
+    def __init__(self, alpha: float = ROUTER_EWMA_ALPHA):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        if self.ewma is None:
+            self.ewma = seconds
+        else:
+            self.ewma = self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Returns a percentile of the window, or None with too few samples."""
+        if len(self.samples) < max(ROUTER_HEDGE_MIN_SAMPLES, 1):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+class Backend:
+    """One interface behind the router, with its health and latency stats.
+
+    Backends are ranked by the full duration of a stream or a response.
+    Streams are hedged on their time to first chunk, since that is what a
+    duplicate request can still save once the stream has started.
+    """
+
+    def __init__(self, name: str, interface: LLMInterface, max_concurrency: int, tier: int = 0):
+        self.name = name
+        self.interface = interface
+        self.max_concurrency = max_concurrency
+        self.tier = tier
+        self.latency = {
+            "first_chunk": LatencyStats(), "stream": LatencyStats(), "response": LatencyStats()
+        }
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.in_flight = 0
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def healthy(self, now: float) -> bool:
+        return self.error_rate < ROUTER_ERROR_THRESHOLD or now >= self.retry_at
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.max_concurrency
+
+    def expected_latency(self, kind: str) -> float:
+        """The EWMA latency scaled by load. Untried backends score 0."""
+        ewma = self.latency[kind].ewma or 0.0
+        return ewma * (1 + self.in_flight / self.max_concurrency)
+
+    def hedge_delay(self, kind: str, percentile: float) -> Optional[float]:
+        """How long to wait before hedging a call, or None not to hedge."""
+        if percentile <= 0:
+            return None
+        return self.latency[kind].percentile(percentile)
+
+    def begin(self) -> None:
+        """Counts a call as in flight on this backend."""
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_latency(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.latency[kind].record(seconds)
+
+    def record_success(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.latency[kind].record(seconds)
+            self.error_rate *= 1 - ROUTER_EWMA_ALPHA
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+            self.error_rate = ROUTER_EWMA_ALPHA + (1 - ROUTER_EWMA_ALPHA) * self.error_rate
+            if self.error_rate >= ROUTER_ERROR_THRESHOLD:
+                self.retry_at = time.monotonic() + ROUTER_COOLDOWN_SECONDS
+
+    def stats(self) -> dict:
+        return {
+            "tier": self.tier,
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "error_rate": round(self.error_rate, 4),
+            "healthy": self.healthy(time.monotonic()),
+            **{
+                f"ewma_{kind}_s": round(stats.ewma, 4) if stats.ewma is not None else None
+                for kind, stats in self.latency.items()
+            },
+        }
+
+class _Racer:
+    """One request in flight during a (possibly hedged) async call."""
+
+    def __init__(self, backend: Backend, close: Optional[Callable[[], Awaitable]]):
+        self.backend = backend
+        self.close = close
+        self.start = time.perf_counter()
+
+class LLMRouter:
+    """Spreads LLM calls over several backends. See the module docstring."""
+
+    def __init__(
+        self, backends: list[Backend], hedge_percentile: float = ROUTER_HEDGE_PERCENTILE
+    ):
+        """Initializes the router.
+
+        Args:
+            backends: The backends to route between.
+            hedge_percentile: The latency percentile after which async calls
+                are hedged. 0 disables hedging.
+        """
+        if not backends:
+            raise ValueError("The router needs at least one backend")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.provider = ROUTER_PROVIDER
+        self.model_name = ",".join(backend.name for backend in backends)
+        # Caps routed calls at the total capacity; hedges don't count twice.
+        self.limiter = ConcurrencyLimiter(sum(backend.max_concurrency for backend in backends))
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @classmethod
+    def from_specs(
+        cls,
+        specs: list[BackendSpec],
+        interface_factory: Callable[..., LLMInterface] = LLMInterface,
+    ) -> "LLMRouter":
+        """Builds a router and an interface for each backend.
+
+        Each interface gets its own limiter, which enforces the backend's
+        concurrency cap.
+        """
+        backends = []
+        for index, spec in enumerate(specs):
+            limit = spec.max_concurrency or LLM_CONCURRENCY_LIMITS.get(spec.provider) or 1
+            name = spec.name or f"{index}:{spec.provider}/{spec.model}"
+            interface = interface_factory(
+                provider=spec.provider,
+                model_name=spec.model,
+                limiter=shared_limiter(limit, f"llm-{name}"),
+                base_url=spec.base_url,
+            )
+            backends.append(Backend(name, interface, limit, spec.tier))
+        return cls(backends)
+
+    @contextmanager
+    def _track_call(self) -> Iterator[None]:
+        with self._stats_lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+
+    def _pick(
+        self, kind: str, exclude: set[str], require_capacity: bool = False
+    ) -> Optional[Backend]:
+        """Returns the best backend not tried yet for this call, if any."""
+        now = time.monotonic()
+        candidates = [
+            backend for backend in self.backends
+            if backend.name not in exclude
+            and (not require_capacity or backend.has_capacity() and backend.healthy(now))
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda backend: (
+            not backend.healthy(now),
+            not backend.has_capacity(),
+            backend.tier,
+            backend.expected_latency(kind),
+        ))
+
+    def generate(
+        self, prompt: Prompt, verbose: bool = False, limits: Optional[GenerationLimits] = None
+    ) -> str:
+        """Generates a response, failing over to other backends on errors.
+
+        Synchronous calls are not hedged.
+        """
+        if verbose:
+            LLMInterface._print_prompt(prompt)
+        tried: set[str] = set()
+        last_error: Optional[Exception] = None
+        with self.limiter, self._track_call():
+            while (backend := self._pick("response", tried)) is not None:
+                tried.add(backend.name)
+                start = time.perf_counter()
+                backend.begin()
+                try:
+                    response = backend.interface.generate(prompt, limits=limits)
+                except Exception as e:
+                    if not _backend_fault(e):
+                        raise
+                    backend.record_error()
+                    last_error = e
+                    continue
+                finally:
+                    backend.end()
+                backend.record_success("response", time.perf_counter() - start)
+                if verbose:
+                    LLMInterface._print_response(response)
+                return response
+        raise last_error or RuntimeError("No LLM backend available")
+
+    async def async_generate(
+        self, prompt: Prompt, verbose: bool = False, limits: Optional[GenerationLimits] = None
+    ) -> str:
+        """Asynchronous version of `generate`, with hedging."""
+        if verbose:
+            LLMInterface._print_prompt(prompt)
+
+        def start(backend: Backend) -> tuple[Awaitable, None]:
+            return backend.interface.async_generate(prompt, limits=limits), None
+
+        async with deadline_slot(self.limiter, GenerationGuard(limits)):
+            with self._track_call():
+                backend, response = await self._race("response", start)
+                backend.end()
+        if verbose:
+            LLMInterface._print_response(response)
+        return response
+
+    async def astream(
+        self,
+        prompt: Prompt,
+        verbose: bool = False,
+        sample: int = 0,
+        limits: Optional[GenerationLimits] = None,
+        complete: Optional[Callable[[], bool]] = None,
+    ) -> AsyncIterator[str]:
+        """Streams a response, hedging and failing over until the first chunk.
+
+        Once a backend has sent its first chunk the rest of the stream comes
+        from it; an error after that point is raised to the caller.
+        """
+        if verbose:
+            LLMInterface._print_prompt(prompt)
+
+        def start(backend: Backend) -> tuple[Awaitable, Callable[[], Awaitable]]:
+            stream = backend.interface.astream(
+                prompt, sample=sample, limits=limits, complete=complete
+            )
+            return _first_chunk(stream), stream.aclose
+
+        chunks = []
+        async with deadline_slot(self.limiter, GenerationGuard(limits)):
+            with self._track_call():
+                started = time.perf_counter()
+                backend, (first, stream) = await self._race("stream", start)
+                try:
+                    if first is not None:
+                        chunks.append(first)
+                        yield first
+                        async for chunk in stream:
+                            chunks.append(chunk)
+                            yield chunk
+                except GeneratorExit:
+                    # The caller had everything it needed.
+                    backend.record_latency("stream", time.perf_counter() - started)
+                    raise
+                except Exception as e:
+                    if _backend_fault(e):
+                        backend.record_error()
+                    raise
+                else:
+                    backend.record_latency("stream", time.perf_counter() - started)
+                finally:
+                    await stream.aclose()
+                    backend.end()
+        if verbose:
+            LLMInterface._print_response("".join(chunks))
+
+    async def _race(
+        self,
+        kind: str,
+        start: Callable[[Backend], tuple[Awaitable, Optional[Callable[[], Awaitable]]]],
+    ) -> tuple[Backend, Any]:
+        """Runs a call on the best backend, hedging and failing over.
+
+        Args:
+            kind: "stream" or "response", the latency backends are ranked by.
+            start: Starts the call on a backend, returning the awaitable to
+                race and a function closing what it opened, if anything.
+
+        Returns:
+            The winning backend, still counted as in flight until the caller
+            calls its `end`, and the awaitable's result.
+
+        Raises:
+            Exception: The last backend error, if every backend failed.
+        """
+        tried: set[str] = set()
+        last_error: Optional[BaseException] = None
+        racers: dict[asyncio.Future, _Racer] = {}
+        hedge_delay: Optional[float] = None
+        # What the race itself waits for, and so what hedging can shorten.
+        race_kind = "first_chunk" if kind == "stream" else kind
+
+        def launch(backend: Backend) -> None:
+            tried.add(backend.name)
+            backend.begin()
+            awaitable, close = start(backend)
+            racers[asyncio.ensure_future(awaitable)] = _Racer(backend, close)
+
+        async def retire(racer: _Racer) -> None:
+            racer.backend.end()
+            if racer.close is not None:
+                await racer.close()
+
+        try:
+            while True:
+                if not racers:
+                    backend = self._pick(kind, tried)
+                    if backend is None:
+                        raise last_error or RuntimeError("No LLM backend available")
+                    launch(backend)
+                    hedge_delay = backend.hedge_delay(race_kind, self.hedge_percentile)
+                done, _ = await asyncio.wait(
+                    racers, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # The first request is slow: race it against a backup.
+                    hedge_delay = None
+                    backup = self._pick(kind, tried, require_capacity=True)
+                    if backup is not None:
+                        backup.hedges += 1
+                        launch(backup)
+                    continue
+                for future in done:
+                    racer = racers.pop(future)
+                    if future.exception() is None:
+                        racer.backend.record_success(race_kind, time.perf_counter() - racer.start)
+                        return racer.backend, future.result()
+                    if not _backend_fault(future.exception()):
+                        await retire(racer)
+                        raise future.exception()
+                    racer.backend.record_error()
+                    last_error = future.exception()
+                    await retire(racer)
+        finally:
+            # Cancel the requests that lost the race, or all of them if the
+            # caller was cancelled.
+            for future in racers:
+                future.cancel()
+            for future, racer in racers.items():
+                try:
+                    await future
+                except BaseException:
+                    pass
+                await retire(racer)
+
+    def connection_stats(self) -> dict:
+        """Returns the HTTP requests and connections of all backends."""
+        totals = {"http_requests": 0, "connections_opened": 0}
+        for backend in self.backends:
+            for key, value in backend.interface.connection_stats().items():
+                totals[key] += value
+        return totals
+
+    def backend_stats(self) -> dict:
+        """Reports each backend's health, latency and load."""
+        return {backend.name: backend.stats() for backend in self.backends}
+
+    async def aclose(self) -> None:
+        """Closes every backend's interface."""
+        for backend in self.backends:
+            await backend.interface.aclose()
+
+def _backend_fault(error: BaseException) -> bool:
+    """Tells whether an error counts against the backend that raised it."""
+    return not isinstance(error, GenerationStopped) or error.reason == "stall"
+
+async def _first_chunk(stream: AsyncIterator[str]) -> tuple[Optional[str], AsyncIterator[str]]:
+    """Waits for a stream's first chunk (None if it is empty)."""
+    try:
+        return await stream.__anext__(), stream
+    except StopAsyncIteration:
+        return None, stream
@@ -0,0 +1,309 @@
+"""
+Lightweight timing and token instrumentation for the agent loop.
+
+Each stage of a task (prompt formatting, the LLM call and its time to first
+token, parsing, waiting for a test slot, the sandbox's own overhead and the
+tests themselves) is wrapped in `span(name)` or reported with
+`observe(name, seconds)`. Durations go to the process-wide
+`agent_stage_seconds` histogram, which the API serves in the Prometheus text
+format at `/metrics`, and to the breakdown of the task being tracked with
+`track_task`, if any.
+
+With `METRICS_ENABLED` off and no task being tracked, `span` returns a shared
+no-op context manager and nothing is recorded. With `METRICS_OTEL` on and
+the `opentelemetry-api` package installed, spans are also started as
+OpenTelemetry spans on the globally configured tracer provider.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from agent.llm_cache import CHARS_PER_TOKEN
+from config import METRICS_ENABLED, METRICS_OTEL
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 10)
+
+_NOOP = nullcontext()
+_tracer = None
+if METRICS_OTEL:
+    try:
+        from opentelemetry import trace as otel_trace
+        _tracer = otel_trace.get_tracer("ai-codegen-agent")
+    except ImportError:  # Optional: spans are only exported when it is installed.
+        pass
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """A Prometheus histogram with optional labels."""
+
+    def __init__(
+        self, name: str, help_text: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._lock = threading.Lock()
+        # Label values -> (per-bucket counts, sum, count).
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Counter:
+    """A Prometheus counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "agent_stage_seconds", "Time spent in each stage of the agent loop.", STAGE_BUCKETS, ("stage",)
+)
+LLM_TOKENS = Histogram(
+    "agent_llm_tokens", "Estimated tokens per LLM call.", TOKEN_BUCKETS, ("kind",)
+)
+TASK_ATTEMPTS = Histogram(
+    "agent_task_attempts", "Attempts used per task.", ATTEMPT_BUCKETS
+)
+TASKS = Counter("agent_tasks_total", "Tasks finished, by outcome.", ("outcome",))
+PREFLIGHT_REJECTIONS = Counter(
+    "agent_preflight_rejections_total",
+    "Test runs rejected by pre-flight checks without starting a sandbox, by first failed check.",
+    ("check",),
+)
+GENERATION_STOPS = Counter(
+    "agent_generation_stops_total",
+    "LLM generations cancelled by a generation guard, by reason.",
+    ("reason",),
+)
+ADMISSION_REJECTIONS = Counter(
+    "agent_admission_rejections_total",
+    "API requests rejected with 429 because every task slot was busy, by reason.",
+    ("reason",),
+)
+REGISTRY = (
+    STAGE_SECONDS, LLM_TOKENS, TASK_ATTEMPTS, TASKS, PREFLIGHT_REJECTIONS, GENERATION_STOPS,
+    ADMISSION_REJECTIONS,
+)
+
+class TaskTimings:
+    """The timing and token breakdown of one task."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: dict[str, list] = {}
+        self.attempts: list[dict] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            attempt = self._current_attempt()
+            attempt["llm_calls"] += 1
+            attempt["prompt_tokens"] += prompt_tokens
+            attempt["completion_tokens"] += completion_tokens
+
+    def add_prefix_tokens(self, tokens: int) -> None:
+        with self._lock:
+            self._current_attempt()["prefix_tokens"] += tokens
+
+    def _current_attempt(self) -> dict:
+        if not self.attempts:
+            self.attempts.append(_new_attempt(1))
+        return self.attempts[-1]
+
+    def start_attempt(self, attempt: int) -> None:
+        with self._lock:
+            self.attempts.append(_new_attempt(attempt))
+
+    def as_dict(self) -> dict:
+        """Returns the breakdown as plain data, durations in seconds."""
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {"seconds": round(seconds, 6), "count": count}
+                    for stage, (seconds, count) in self.stages.items()
+                },
+                "attempts": [dict(attempt) for attempt in self.attempts],
+            }
+
+def _new_attempt(attempt: int) -> dict:
+    return {
+        "attempt": attempt, "llm_calls": 0, "prompt_tokens": 0, "prefix_tokens": 0,
+        "completion_tokens": 0,
+    }
+
+_current_task: ContextVar[Optional[TaskTimings]] = ContextVar("agent_task_timings", default=None)
+
+class _Span:
+    __slots__ = ("name", "start", "otel")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self.otel = _tracer.start_as_current_span(f"agent.{self.name}")
+            self.otel.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+        if self.otel is not None:
+            return self.otel.__exit__(*exc_info)
+        return None
+
+def is_active() -> bool:
+    """True if measurements are currently being recorded."""
+    return METRICS_ENABLED or _current_task.get() is not None
+
+def span(name: str):
+    """Returns a context manager that times a stage.
+
+    Args:
+        name: The stage's name, used as the histogram's "stage" label.
+    """
+    if not is_active():
+        return _NOOP
+    return _Span(name)
+
+def observe(stage: str, seconds: float) -> None:
+    """Records a stage duration measured by the caller."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage)
+    timings = _current_task.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+def record_tokens(prompt: str, response: str) -> None:
+    """Records the estimated token counts of an LLM call."""
+    if not is_active():
+        return
+    prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+    completion_tokens = len(response) // CHARS_PER_TOKEN
+    if METRICS_ENABLED:
+        LLM_TOKENS.observe(prompt_tokens, "prompt")
+        LLM_TOKENS.observe(completion_tokens, "completion")
+    timings = _current_task.get()
+    if timings is not None:
+        timings.add_tokens(prompt_tokens, completion_tokens)
+
+def record_prompt_prefix(tokens: int) -> None:
+    """Records the estimated tokens a prompt shares with earlier prompts.
+
+    These are the tokens at the start of the prompt that providers caching
+    prompt prefixes don't have to process again.
+    """
+    if not is_active():
+        return
+    if METRICS_ENABLED:
+        LLM_TOKENS.observe(tokens, "prompt_prefix")
+    timings = _current_task.get()
+    if timings is not None:
+        timings.add_prefix_tokens(tokens)
+
+def start_attempt(attempt: int) -> None:
+    """Starts a new attempt in the tracked task's breakdown."""
+    timings = _current_task.get()
+    if timings is not None:
+        timings.start_attempt(attempt)
+
+def record_preflight_rejection(check: str) -> None:
+    """Records a test run skipped because a pre-flight check failed."""
+    if METRICS_ENABLED:
+        PREFLIGHT_REJECTIONS.inc(1, check)
+
+def record_generation_stop(reason: str) -> None:
+    """Records an LLM generation cancelled by a generation guard."""
+    if METRICS_ENABLED:
+        GENERATION_STOPS.inc(1, reason)
+
+def record_admission_rejection(reason: str) -> None:
+    """Records a request turned away by the admission controller."""
+    if METRICS_ENABLED:
+        ADMISSION_REJECTIONS.inc(1, reason)
+
+def record_task(passed: bool, attempts: int, deadline_exceeded: bool = False) -> None:
+    """Records a finished task's outcome and attempt count."""
+    if METRICS_ENABLED:
+        outcome = "passed" if passed else "deadline_exceeded" if deadline_exceeded else "failed"
+        TASKS.inc(1, outcome)
+        TASK_ATTEMPTS.observe(attempts)
+
+@contextmanager
+def track_task() -> Iterator[TaskTimings]:
+    """Collects the breakdown of the task run inside the block.
+
+    The breakdown is collected even when `METRICS_ENABLED` is off. It
+    follows the task into the coroutines, tasks and threads it starts.
+    """
+    timings = TaskTimings()
+    token = _current_task.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_task.reset(token)
+
+def render_prometheus() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
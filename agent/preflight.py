@@ -0,0 +1,302 @@
+"""
+Static checks of generated code and tests before spending a sandbox run.
+
+Sources are parsed once: `parse` caches syntax trees (and syntax errors) by
+content hash, and the same trees serve symbol discovery, test fingerprints
+and the checks below. `check` looks for the problems that make a test run
+fail before any test executes, or make it meaningless:
+
+- a syntax error in the code or the tests,
+- code without importable symbols,
+- tests that never import `unittest` (the test script ends with
+  `unittest.main()`),
+- names the code or tests use but never define, import or get from the code,
+- tests that use none of the code's symbols.
+
+The name checks are deliberately lenient: a name bound anywhere in a module,
+in any scope, counts as defined, and modules with a wildcard import are not
+checked, so no suite is rejected for a name it could resolve at run time.
+The last check is different: tests that never touch the code may well pass,
+and are rejected because passing them proves nothing about the code.
+"""
+import ast
+import builtins
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from agent.cache import content_key
+from config import PREFLIGHT_AST_CACHE_SIZE
+
+# PEP 695 type parameters (`def first[T](...)`), which carry their name as a
+# plain string. The node types only exist from Python 3.12 on.
+_TYPE_PARAMS = tuple(
+    getattr(ast, name) for name in ("TypeVar", "ParamSpec", "TypeVarTuple") if hasattr(ast, name)
+)
+
+# Names every module can use without defining them.
+_ALWAYS_DEFINED = frozenset(dir(builtins)) | {
+    "__name__", "__file__", "__doc__", "__spec__", "__loader__", "__package__",
+    "__builtins__", "__annotations__", "__class__", "__qualname__", "__module__",
+}
+
+# A parsed module, or the syntax error its source raised.
+_ParseResult = tuple[Optional[ast.Module], Optional[SyntaxError]]
+
+@dataclass(frozen=True)
+class PreflightError:
+    """A problem found without running the tests."""
+
+    # "syntax", "no_symbols", "missing_import", "undefined_name" or
+    # "no_symbol_references".
+    check: str
+    # "code" or "tests".
+    source: str
+    message: str
+    line: Optional[int] = None
+
+    def format(self) -> str:
+        location = f"{self.source}, line {self.line}" if self.line else self.source
+        return f"{location}: {self.message}"
+
+class _TreeCache:
+    """A thread-safe LRU cache of parse results, keyed by content hash."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, _ParseResult] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, source: str) -> ast.Module:
+        key = content_key(source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            try:
+                entry = (ast.parse(source), None)
+            except SyntaxError as e:
+                entry = (None, e)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        tree, error = entry
+        if error is not None:
+            raise error
+        return tree
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+_trees = _TreeCache(PREFLIGHT_AST_CACHE_SIZE)
+
+def parse(source: str) -> ast.Module:
+    """Parses Python source like `ast.parse`, reusing earlier results.
+
+    The returned tree is shared between callers and must not be modified.
+
+    Raises:
+        SyntaxError: If the source is not valid Python.
+    """
+    return _trees.parse(source)
+
+@lru_cache(maxsize=PREFLIGHT_AST_CACHE_SIZE)
+def dump(source: str) -> str:
+    """Dumps a source's syntax tree without positions.
+
+    Sources that differ only in whitespace, comments or formatting have the
+    same dump.
+
+    Raises:
+        SyntaxError: If the source is not valid Python.
+    """
+    return ast.dump(parse(source))
+
+def imported_modules(source: str) -> frozenset[str]:
+    """Returns the top-level packages a source imports, anywhere in it.
+
+    Raises:
+        SyntaxError: If the source is not valid Python.
+    """
+    modules = set()
+    for node in ast.walk(parse(source)):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module.split(".")[0])
+    return frozenset(modules)
+
+def cache_stats() -> dict:
+    """Returns the syntax tree cache's size and hit/miss counters."""
+    return _trees.stats()
+
+def importable_names(tree: ast.Module) -> list[str]:
+    """Returns the top-level classes, functions and variables of a module."""
+    names = []
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            # For assignments, find the names of the variables being assigned.
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    names.append(target.id)
+    return names
+
+def check(code: str, tests: str) -> list[PreflightError]:
+    """Checks code and its unittest script without running them.
+
+    Args:
+        code: The code under test.
+        tests: The test script, which gets the code's importable names.
+
+    Returns:
+        The problems found, empty if the tests are worth running.
+    """
+    return list(_check(code, tests))
+
+@lru_cache(maxsize=PREFLIGHT_AST_CACHE_SIZE)
+def _check(code: str, tests: str) -> tuple[PreflightError, ...]:
+    errors: list[PreflightError] = []
+    code_tree = _parse_checked(code, "code", errors)
+    tests_tree = _parse_checked(tests, "tests", errors)
+
+    symbols: list[str] = []
+    if code_tree is not None:
+        symbols = importable_names(code_tree)
+        if not symbols:
+            errors.append(PreflightError(
+                "no_symbols", "code", "No importable functions, classes or variables found."
+            ))
+        errors.extend(_undefined_names(code_tree, "code", set()))
+
+    if tests_tree is not None:
+        if "unittest" not in _module_imports(tests_tree):
+            errors.append(PreflightError(
+                "missing_import", "tests", "The tests never run `import unittest`."
+            ))
+        if code_tree is not None:
+            errors.extend(_undefined_names(tests_tree, "tests", set(symbols)))
+            if symbols and not _names_loaded(tests_tree) & set(symbols):
+                errors.append(PreflightError(
+                    "no_symbol_references", "tests",
+                    f"The tests use none of the code's symbols ({', '.join(symbols)}).",
+                ))
+    return tuple(errors)
+
+def format_errors(errors: list[PreflightError]) -> str:
+    """Formats pre-flight errors as the output of a failed test run."""
+    lines = ["Pre-flight checks failed, so the tests were not run:"]
+    lines.extend(error.format() for error in errors)
+    return "\n".join(lines)
+
+def _parse_checked(
+    source: str, name: str, errors: list[PreflightError]
+) -> Optional[ast.Module]:
+    """Parses a source, recording a syntax error instead of raising it."""
+    try:
+        return parse(source)
+    except SyntaxError as e:
+        message = f"SyntaxError: {e.msg}"
+        if e.text and e.text.strip():
+            message += f"\n    {e.text.strip()}"
+        errors.append(PreflightError("syntax", name, message, e.lineno))
+        return None
+
+def _module_imports(tree: ast.Module) -> set[str]:
+    """Returns the names bound by the imports at a module's top level."""
+    return {
+        alias.asname or alias.name.split(".")[0]
+        for node in tree.body
+        if isinstance(node, ast.Import)
+        for alias in node.names
+    }
+
+def _names_loaded(tree: ast.Module) -> set[str]:
+    return {
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+
+def _bound_names(node: ast.AST) -> list[str]:
+    """Returns the names a single node binds, in whatever scope."""
+    if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+        return [node.id]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return [node.name]
+    if isinstance(node, ast.arg):
+        return [node.arg]
+    if isinstance(node, _TYPE_PARAMS):
+        return [node.name]
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return [alias.asname or alias.name.split(".")[0] for alias in node.names]
+    if isinstance(node, ast.ExceptHandler) and node.name:
+        return [node.name]
+    if isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+        return [node.name]
+    if isinstance(node, ast.MatchMapping) and node.rest:
+        return [node.rest]
+    return []
+
+def _undefined_names(
+    tree: ast.Module, source: str, provided: set[str]
+) -> list[PreflightError]:
+    """Finds names that are used but bound nowhere in a module.
+
+    Args:
+        tree: The module.
+        source: "code" or "tests", for the errors.
+        provided: Names the module gets without binding them itself.
+    """
+    bound = set(provided)
+    postponed = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom):
+            if any(alias.name == "*" for alias in node.names):
+                return []
+            if node.module == "__future__":
+                postponed = postponed or any(alias.name == "annotations" for alias in node.names)
+        bound.update(_bound_names(node))
+
+    # With postponed evaluation, annotations never need their names at runtime.
+    skipped = _annotation_names(tree) if postponed else set()
+    errors, reported = [], set()
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Name)
+            and isinstance(node.ctx, ast.Load)
+            and node.id not in bound
+            and node.id not in _ALWAYS_DEFINED
+            and node.id not in reported
+            and id(node) not in skipped
+        ):
+            reported.add(node.id)
+            errors.append(PreflightError(
+                "undefined_name", source, f"NameError: name '{node.id}' is not defined",
+                node.lineno,
+            ))
+    return sorted(errors, key=lambda error: error.line or 0)
+
+def _annotation_names(tree: ast.Module) -> set[int]:
+    """Returns the ids of the name nodes inside annotations."""
+    annotations = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.returns:
+            annotations.append(node.returns)
+        elif isinstance(node, ast.arg) and node.annotation:
+            annotations.append(node.annotation)
+        elif isinstance(node, ast.AnnAssign):
+            annotations.append(node.annotation)
+    return {
+        id(child) for annotation in annotations for child in ast.walk(annotation)
+        if isinstance(child, ast.Name)
+    }
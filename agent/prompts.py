@@ -1,11 +1,14 @@
 # A central place for all LLM prompt templates.
+#
+# Prompts are sent as a conversation. The system message is the same for
+# every task and every attempt, and each revision only appends to the
+# previous conversation, so providers that cache prompt prefixes (Ollama's
+# KV cache, OpenAI prompt caching) only process the new turns.
 
-INITIAL_GENERATION_PROMPT = """
-You are a Senior Python engineer assigned to a test-driven development task.
+SYSTEM_PROMPT = """
+You are a Senior Python engineer assigned to test-driven development tasks.
 
-Task: {task_description}
-
-Please do the following:
+For each task:
 1. Write a Python function that attempts to solve the task.
 2. Write a comprehensive set of unit tests using Python's unittest module.
 3. Do not include any explanations, comments, or `if __name__ == '__main__':` blocks.
@@ -19,27 +22,27 @@ Please do the following:
 {tests_end}
 """ # + "6. **CRITICAL INSTRUCTION**: You MUST include at least one test case that is designed to FAIL. For example: `self.assertEqual(add(2, 2), 5)`. This is required to test the code revision process.\n""
 
-REVISION_PROMPT = """
-You're a Senior Python engineer. A previous attempt to solve a task failed.
+TASK_PROMPT = "Task: {task_description}"
 
-Original Task: {task_description}
+# A previous answer, replayed as the assistant's turn.
+ATTEMPT_PROMPT = """{function_start}
+{code}
+{function_end}
+{tests_start}
+{tests}
+{tests_end}"""
 
-Previous Code:
-{original_code}
+# A revised answer after the first, replayed as a diff against the answer it revised.
+ATTEMPT_DIFF_PROMPT = """(Revised answer, shown as a diff against the previous one.)
+{diff}"""
 
-Previous Tests:
-{original_tests}
+REVISION_PROMPT = """
+The tests failed.
 
 Test Output / Errors:
 {test_output}
 
 Please analyze the failure. Revise both the function and the tests so that all tests pass. The issue might be in the code, the tests, or both.
 
-Use this exact format:
-{function_start}
-<code>
-{function_end}
-{tests_start}
-<test_code>
-{tests_end}
-"""
\ No newline at end of file
+Reply with the complete revised function and tests, not a diff, in the format above.
+"""
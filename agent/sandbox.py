@@ -0,0 +1,271 @@
+"""
+Child-side sandbox that runs a generated test suite without temporary files.
+
+This script is executed by a separate Python interpreter; the API process
+only imports `apply_limits` from it, to use as a subprocess `preexec_fn`. It
+only depends on the standard library so it starts fast.
+
+In `--stdin` mode it reads a single JSON request from stdin, runs the suite in
+its own process and exits with the suite's exit code.
+
+In `--worker` mode it is a long-lived, pre-imported worker: it reads one JSON
+request per line on stdin and forks a fresh child for every suite, so each
+run still gets its own process, exactly like a cold `python test_x.py`
+launch. The result is written back as one JSON line on the original stdout.
+
+The code under test is served to the test script's `from module_x import ...`
+line by an in-memory loader, and the test script itself is compiled under
+the same file name the cold runner would have used, so output and tracebacks
+match a run from files on disk.
+"""
+import importlib.abc
+import importlib.util
+import json
+import linecache
+import locale
+import os
+import selectors
+import sys
+import traceback
+import types
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+# Modules imported once by the worker so forked children don't pay for them.
+PRELOADED_MODULES = (
+    "unittest", "collections", "dataclasses", "functools", "itertools",
+    "math", "re", "string", "typing", "_agent_test_results",
+)
+
+# Standard-library-only helpers that test scripts may import.
+SANDBOX_LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_lib")
+
+class InMemorySourceLoader(importlib.abc.SourceLoader):
+    """Loads a module from a source string instead of a file."""
+
+    def __init__(self, source: str, filename: str):
+        self.source = source
+        self.filename = filename
+
+    def get_filename(self, fullname: str) -> str:
+        return self.filename
+
+    def get_data(self, path: str) -> bytes:
+        return self.source.encode("utf-8")
+
+class InMemoryFinder(importlib.abc.MetaPathFinder):
+    """Finds modules registered by name with their source code."""
+
+    def __init__(self, modules: dict[str, tuple[str, str]]):
+        """Initializes the finder.
+
+        Args:
+            modules: Maps module names to (source, filename) pairs.
+        """
+        self.modules = modules
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self.modules:
+            return None
+        source, filename = self.modules[fullname]
+        loader = InMemorySourceLoader(source, filename)
+        return importlib.util.spec_from_loader(fullname, loader, origin=filename)
+
+def apply_limits(limits: dict) -> None:
+    """Applies a run's resource limits to the current process.
+
+    Used as the `preexec_fn` of test subprocesses and by forked pool
+    children. Limits that are missing or zero are left unchanged.
+
+    Args:
+        limits: Optional "memory_bytes" (RLIMIT_AS), "cpu_seconds"
+            (RLIMIT_CPU), "max_processes" (RLIMIT_NPROC) and "cgroup" (a
+            cgroup v2 directory the process moves itself into).
+    """
+    cgroup = limits.get("cgroup")
+    if cgroup:
+        try:
+            with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                f.write(str(os.getpid()))
+        except OSError:
+            pass
+    if resource is None:
+        return
+    if limits.get("memory_bytes"):
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory_bytes"],) * 2)
+    if limits.get("cpu_seconds"):
+        # SIGXCPU at the soft limit, SIGKILL one second later.
+        cpu = limits["cpu_seconds"]
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if limits.get("max_processes"):
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["max_processes"],) * 2)
+
+def execute_suite(request: dict) -> int:
+    """Runs a test script in the current process as if it were `__main__`.
+
+    Args:
+        request: A dictionary with the code module's name, source and file
+            name, the final test script and its file name, and optionally
+            the script's command-line arguments.
+
+    Returns:
+        The process exit code a cold `python test_x.py` run would have had.
+    """
+    sys.meta_path.insert(0, InMemoryFinder({
+        request["module_name"]: (request["code"], request["code_filename"]),
+    }))
+
+    test_filename = request["test_filename"]
+    test_script = request["test_script"]
+    linecache.cache[test_filename] = (
+        len(test_script), None, test_script.splitlines(keepends=True), test_filename
+    )
+
+    main_module = types.ModuleType("__main__")
+    main_module.__file__ = test_filename
+    sys.modules["__main__"] = main_module
+    sys.argv = [test_filename, *request.get("argv", [])]
+    sys.path.insert(0, os.path.dirname(test_filename))
+
+    try:
+        exec(compile(test_script, test_filename, "exec"), main_module.__dict__)
+    except SystemExit as e:
+        return _exit_code(e)
+    except BaseException as e:
+        _print_script_exception(e, test_filename)
+        return 1
+    return 0
+
+def _exit_code(exit_request: SystemExit) -> int:
+    """Converts a SystemExit into a process exit code like the interpreter."""
+    code = exit_request.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+def _print_script_exception(error: BaseException, test_filename: str) -> None:
+    """Prints an uncaught exception, hiding the sandbox's own frames."""
+    tb = error.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != test_filename:
+        tb = tb.tb_next
+    traceback.print_exception(type(error), error, tb or error.__traceback__)
+
+def run_forked(request: dict) -> dict:
+    """Runs a suite in a forked child and captures its output.
+
+    Args:
+        request: The suite description accepted by `execute_suite`.
+
+    Returns:
+        A dictionary with the child's return code, stdout, stderr and
+        resource usage.
+    """
+    out_read, out_write = os.pipe()
+    err_read, err_write = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(out_read)
+            os.close(err_read)
+            os.dup2(out_write, 1)
+            os.dup2(err_write, 2)
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            apply_limits(request.get("limits", {}))
+            code = execute_suite(request)
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    os.close(out_write)
+    os.close(err_write)
+    stdout, stderr = _read_pipes(out_read, err_read)
+    _, status, usage = os.wait4(pid, 0)
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout": stdout,
+        "stderr": stderr,
+        "usage": {
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+            "peak_rss_kb": (
+                usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+            ),
+        },
+    }
+
+def _read_pipes(out_fd: int, err_fd: int) -> tuple[str, str]:
+    """Reads two pipes until both are closed."""
+    chunks = {out_fd: [], err_fd: []}
+    selector = selectors.DefaultSelector()
+    for fd in chunks:
+        selector.register(fd, selectors.EVENT_READ)
+    open_fds = len(chunks)
+    while open_fds:
+        for key, _ in selector.select():
+            data = os.read(key.fd, 65536)
+            if data:
+                chunks[key.fd].append(data)
+            else:
+                selector.unregister(key.fd)
+                os.close(key.fd)
+                open_fds -= 1
+    selector.close()
+    return _decode(b"".join(chunks[out_fd])), _decode(b"".join(chunks[err_fd]))
+
+def _decode(output: bytes) -> str:
+    """Decodes raw child output the way `subprocess.run(text=True)` would."""
+    text = output.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def worker_main() -> None:
+    """Serves suite requests from stdin until it is closed."""
+    for module_name in PRELOADED_MODULES:
+        __import__(module_name)
+
+    # Keep the real stdout for replies and point fd 1 at /dev/null, so
+    # nothing else written by this process can corrupt the protocol.
+    replies = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    replies.write(json.dumps({"ready": True}) + "\n")
+    replies.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        reply = run_forked(json.loads(line))
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+def oneshot_main() -> None:
+    """Runs the single suite read from stdin and exits with its exit code."""
+    request = json.loads(sys.stdin.read())
+    sys.exit(execute_suite(request))
+
+if __name__ == "__main__":
+    # Don't let generated code import the agent's own modules by accident.
+    if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+        sys.path.pop(0)
+    sys.path.append(SANDBOX_LIB_DIR)
+
+    if sys.argv[1:] == ["--worker"]:
+        worker_main()
+    elif sys.argv[1:] == ["--stdin"]:
+        oneshot_main()
+    else:
+        sys.exit("usage: sandbox.py --worker | --stdin")
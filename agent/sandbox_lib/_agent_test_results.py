@@ -0,0 +1,133 @@
+"""
+Child-side collector that records per-test results while tests run.
+
+This module is imported at the top of every generated test script (see
+`agent/test_runner.py`), by whichever runner mode executes it, so it only
+depends on the standard library. Importing it makes every
+`unittest.TextTestRunner` use `StructuredTestResult`, which behaves exactly
+like the default result but also records each test's status, duration,
+message and trimmed traceback.
+
+When a test run stops, the records are written to stderr as one JSON
+document between `RECORD_SEPARATOR` characters, and the process's CPU time
+and peak memory are written the same way when it exits. The parent strips
+those segments out again, so the captured output is unchanged.
+"""
+import atexit
+import json
+import os
+import sys
+import time
+import traceback
+import unittest
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+RECORD_SEPARATOR = "\x1e"
+RESULTS_TAG = "AGENT_TEST_RESULTS:"
+USAGE_TAG = "AGENT_TEST_USAGE:"
+
+# Frames from unittest itself are noise in a failure report.
+_UNITTEST_DIR = os.path.dirname(unittest.__file__)
+# Frames kept from the end of each traceback.
+MAX_TRACEBACK_FRAMES = 3
+# Characters kept from each failure message.
+MAX_MESSAGE_CHARS = 2000
+
+class StructuredTestResult(unittest.TextTestResult):
+    """A `TextTestResult` that also records a structured entry per test."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+        self._started = {}
+
+    def startTest(self, test):
+        self._started[test.id()] = time.perf_counter()
+        super().startTest(test)
+
+    def _record(self, test, status, err=None, name=None):
+        started = self._started.get(test.id())
+        record = {
+            "id": name or test.id(),
+            "status": status,
+            "duration": round(time.perf_counter() - started, 6) if started else 0.0,
+        }
+        if err is not None:
+            record["message"] = _format_message(err)
+            record["traceback"] = _trim_traceback(err)
+        self.records.append(record)
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, "passed")
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, "failed", err)
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self._record(test, "error", err)
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.records.append({"id": test.id(), "status": "skipped", "message": reason})
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, "expected_failure")
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, "unexpected_success")
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None:
+            failed = issubclass(err[0], test.failureException)
+            self._record(test, "failed" if failed else "error", err, name=subtest.id())
+
+    def stopTestRun(self):
+        super().stopTestRun()
+        payload = json.dumps({"tests_run": self.testsRun, "tests": self.records})
+        sys.stderr.write(f"{RECORD_SEPARATOR}{RESULTS_TAG}{payload}{RECORD_SEPARATOR}")
+        sys.stderr.flush()
+
+def _format_message(err) -> str:
+    """Returns "ExceptionType: message", including any assertion diff."""
+    exc_type, exc_value, _ = err
+    message = "".join(traceback.format_exception_only(exc_type, exc_value)).strip()
+    if len(message) > MAX_MESSAGE_CHARS:
+        message = message[:MAX_MESSAGE_CHARS] + "..."
+    return message
+
+def _trim_traceback(err) -> str:
+    """Formats the last few frames of a traceback, skipping unittest's own."""
+    frames = [
+        frame for frame in traceback.extract_tb(err[2])
+        if not frame.filename.startswith(_UNITTEST_DIR)
+    ]
+    return "".join(traceback.format_list(frames[-MAX_TRACEBACK_FRAMES:])).rstrip()
+
+def _report_usage() -> None:
+    """Writes this process's CPU time and peak RSS, including its children."""
+    if resource is None:
+        return
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak_rss = max(own.ru_maxrss, children.ru_maxrss)
+    payload = json.dumps({
+        "cpu_time": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        "peak_rss_kb": peak_rss // 1024 if sys.platform == "darwin" else peak_rss,
+    })
+    sys.stderr.write(f"{RECORD_SEPARATOR}{USAGE_TAG}{payload}{RECORD_SEPARATOR}")
+    sys.stderr.flush()
+
+unittest.TextTestRunner.resultclass = StructuredTestResult
+# Forked pool children exit with os._exit and report their usage via wait4.
+atexit.register(_report_usage)
@@ -0,0 +1,125 @@
+"""
+Resource limits and accounting for test runs.
+
+Every test run gets the same limits whatever the runner mode: an address
+space cap (RLIMIT_AS), a CPU time cap (RLIMIT_CPU) and optionally a process
+count cap (RLIMIT_NPROC). Subprocesses apply them in a `preexec_fn`, forked
+pool children apply them themselves (see `agent/sandbox.py`).
+
+When `TEST_CGROUP_ROOT` points at a writable, delegated cgroup v2 directory
+(with the memory and pids controllers enabled for its children), each run is
+also placed in its own child cgroup. That caps the memory and process count
+of everything the run starts, measures its peak memory and CPU time
+including descendants, and lets leftover processes be killed afterwards.
+"""
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator, Optional
+
+from agent.sandbox import apply_limits
+from config import (
+    TEST_MEMORY_LIMIT_MB,
+    TEST_CPU_LIMIT_SECONDS,
+    TEST_MAX_PROCESSES,
+    TEST_CGROUP_ROOT,
+)
+
+def base_limits() -> dict:
+    """Returns the configured rlimits in the form `apply_limits` expects."""
+    return {
+        "memory_bytes": TEST_MEMORY_LIMIT_MB * 1024 * 1024,
+        "cpu_seconds": TEST_CPU_LIMIT_SECONDS,
+        "max_processes": TEST_MAX_PROCESSES,
+    }
+
+def preexec_for(limits: dict) -> Optional[Callable[[], None]]:
+    """Returns a `preexec_fn` applying the limits, or None where unsupported."""
+    if os.name != "posix":
+        return None
+    return partial(apply_limits, limits)
+
+def cgroup_available(root: str = TEST_CGROUP_ROOT) -> bool:
+    """Returns True if runs can be placed in child cgroups of `root`."""
+    return bool(root) and os.access(os.path.join(root, "cgroup.procs"), os.W_OK)
+
+class RunCgroup:
+    """A cgroup v2 directory holding a single test run."""
+
+    def __init__(self, root: str):
+        """Creates the cgroup and sets its memory and process limits.
+
+        Raises:
+            OSError: If the cgroup can't be created.
+        """
+        self.path = os.path.join(root, f"run-{uuid.uuid4().hex}")
+        os.mkdir(self.path)
+        if TEST_MEMORY_LIMIT_MB:
+            self._write("memory.max", str(TEST_MEMORY_LIMIT_MB * 1024 * 1024))
+        if TEST_MAX_PROCESSES:
+            self._write("pids.max", str(TEST_MAX_PROCESSES))
+
+    def _write(self, name: str, value: str) -> None:
+        with open(os.path.join(self.path, name), "w") as f:
+            f.write(value)
+
+    def _read(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def usage(self) -> dict:
+        """Returns the run's "cpu_time" and "peak_rss_kb" where available."""
+        usage = {}
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat:
+            for line in cpu_stat.splitlines():
+                key, _, value = line.partition(" ")
+                if key == "usage_usec":
+                    usage["cpu_time"] = int(value) / 1_000_000
+        peak = self._read("memory.peak")
+        if peak and peak.strip().isdigit():
+            usage["peak_rss_kb"] = int(peak) // 1024
+        return usage
+
+    def remove(self) -> None:
+        """Kills anything left in the cgroup and removes it."""
+        for attempt in range(10):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # Still populated, e.g. by a process the tests left behind.
+                try:
+                    self._write("cgroup.kill", "1")
+                except OSError:
+                    pass
+                time.sleep(0.01 * (attempt + 1))
+
+@contextmanager
+def run_limits() -> Iterator[tuple[dict, Optional[RunCgroup]]]:
+    """Prepares the limits for one test run.
+
+    Yields:
+        The limits to pass to `apply_limits` (including the run's cgroup, if
+        any) and the cgroup itself, to read its usage before it is removed.
+    """
+    limits = base_limits()
+    cgroup = None
+    if cgroup_available():
+        try:
+            cgroup = RunCgroup(TEST_CGROUP_ROOT)
+            limits["cgroup"] = cgroup.path
+        except OSError as e:
+            print(f"Could not create a test cgroup: {e}")
+    try:
+        yield limits, cgroup
+    finally:
+        if cgroup is not None:
+            cgroup.remove()
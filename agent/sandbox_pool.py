@@ -0,0 +1,233 @@
+"""
+A pool of warm, pre-started sandbox worker processes for running tests.
+
+Launching a fresh interpreter for every test run pays full interpreter and
+`unittest` import startup. Workers from this pool are started ahead of time
+with those modules already imported and fork a fresh child per suite (see
+`agent/sandbox.py`), so a run only costs a fork. A worker is recycled after a
+fixed number of runs, and immediately after any crash or timeout.
+"""
+import json
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+SANDBOX_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox.py")
+# Standard-library-only helpers that test scripts may import.
+SANDBOX_LIB_DIR = os.path.join(os.path.dirname(SANDBOX_SCRIPT), "sandbox_lib")
+
+class WorkerError(Exception):
+    """Raised when a worker crashes or stops responding."""
+
+class NoWorkerError(TimeoutError):
+    """Raised when no worker became free in time to start a run."""
+
+def is_supported() -> bool:
+    """Returns True if the platform can run forking sandbox workers."""
+    return hasattr(os, "fork")
+
+class _Worker:
+    """A single pre-started sandbox process."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, SANDBOX_SCRIPT, "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            # A new session lets us kill the worker and its children at once.
+            start_new_session=True,
+        )
+        self.runs = 0
+        # Replies are read without blocking, so a worker that stalls after a
+        # partial line can't hold a run past its timeout.
+        self._stdout = self.process.stdout.fileno()
+        os.set_blocking(self._stdout, False)
+        self._buffer = b""
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._stdout, selectors.EVENT_READ)
+
+    def wait_ready(self, timeout: float) -> None:
+        """Blocks until the worker has finished its imports."""
+        self._read_reply(timeout)
+
+    def run(self, request: dict, timeout: float) -> dict:
+        """Sends one suite to the worker and waits for its result.
+
+        Raises:
+            TimeoutError: If no reply arrives within `timeout` seconds.
+            WorkerError: If the worker died or sent an invalid reply.
+        """
+        self.runs += 1
+        try:
+            self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"Sandbox worker is not accepting requests: {e}") from e
+        return self._read_reply(timeout)
+
+    def _read_reply(self, timeout: float) -> dict:
+        """Reads the worker's next reply line within `timeout` seconds.
+
+        Raises:
+            TimeoutError: If no complete line arrived in time.
+            WorkerError: If the worker exited first.
+        """
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._selector.select(remaining):
+                raise TimeoutError
+            try:
+                chunk = os.read(self._stdout, 65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise WorkerError("Sandbox worker exited unexpectedly.")
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        """Kills the worker and any child it is still running."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+        self._selector.close()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+class SandboxPool:
+    """Runs test suites on a fixed-size pool of warm sandbox workers."""
+
+    def __init__(self, size: int, max_runs_per_worker: int, start_timeout: float = 30):
+        """Initializes the pool without starting any worker.
+
+        Args:
+            size: The number of workers, which is also the maximum number of
+                suites running at the same time.
+            max_runs_per_worker: Runs after which a worker is replaced.
+            start_timeout: Seconds to wait for a new worker to become ready.
+        """
+        self.size = size
+        self.max_runs_per_worker = max_runs_per_worker
+        self.start_timeout = start_timeout
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.counters = {"runs": 0, "spawned": 0, "recycled": 0, "timeouts": 0, "crashes": 0}
+
+    def start(self) -> None:
+        """Starts all workers in the background if not already started."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._spawn_in_background()
+
+    def run(self, request: dict, timeout: float) -> dict:
+        """Runs one suite on an idle worker.
+
+        Args:
+            request: The suite description understood by the sandbox.
+            timeout: Maximum seconds to wait for the suite to finish.
+
+        Returns:
+            A dictionary with the run's return code, stdout and stderr.
+
+        Raises:
+            NoWorkerError: If no worker became free in time.
+            TimeoutError: If the suite did not finish in time.
+            WorkerError: If the worker crashed while running the suite.
+        """
+        self.start()
+        wait = self.start_timeout + timeout
+        try:
+            worker = self._idle.get(timeout=wait)
+        except queue.Empty:
+            raise NoWorkerError(f"no sandbox worker became free in {wait:g}s") from None
+        self._count("runs")
+        try:
+            reply = worker.run(request, timeout)
+        except TimeoutError:
+            self._count("timeouts")
+            self._retire(worker)
+            raise
+        except (WorkerError, ValueError):
+            self._count("crashes")
+            self._retire(worker)
+            raise WorkerError("Sandbox worker crashed while running the tests.")
+
+        if worker.runs >= self.max_runs_per_worker:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return reply
+
+    def _retire(self, worker: _Worker) -> None:
+        """Kills a worker and starts its replacement."""
+        self._count("recycled")
+        threading.Thread(target=worker.kill, daemon=True).start()
+        self._spawn_in_background()
+
+    def _spawn_in_background(self) -> None:
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _spawn(self) -> None:
+        """Starts a worker, waits until it is ready and makes it available."""
+        while not self._closed:
+            worker = _Worker()
+            try:
+                worker.wait_ready(self.start_timeout)
+            except (TimeoutError, WorkerError, ValueError):
+                worker.kill()
+                time.sleep(1)
+                continue
+            self._count("spawned")
+            if self._closed:
+                worker.kill()
+            else:
+                self._idle.put(worker)
+            return
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> dict:
+        """Returns worker usage counters."""
+        with self._lock:
+            return {**self.counters, "size": self.size, "idle": self._idle.qsize()}
+
+    def shutdown(self) -> None:
+        """Kills all idle workers and stops replacing retired ones."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+_default_pool: Optional[SandboxPool] = None
+_default_pool_lock = threading.Lock()
+
+def get_sandbox_pool(size: int, max_runs_per_worker: int) -> SandboxPool:
+    """Returns the process-wide sandbox pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SandboxPool(size, max_runs_per_worker)
+        return _default_pool
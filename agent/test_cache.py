@@ -0,0 +1,191 @@
+"""
+A cache of test run results, keyed by everything a run's outcome depends on.
+
+Reports are looked up by the exact code and tests first, together with the
+unittest arguments, the Python version and the sandbox limits. Passing runs
+are also stored under the normalized syntax trees of the sources, so a
+candidate that differs only in whitespace, comments or formatting is served
+the pass. Failing runs, timeouts included, are only served to identical
+sources, since their tracebacks carry the file's line numbers, and they
+expire sooner. So do passes of sources that import modules whose results
+vary between runs (clocks, randomness, threads), which may be flaky. Runs
+that failed because of the runner itself (an unexpected error outside the
+tests) are never cached.
+
+Like the LLM response cache, it has a size-bounded in-memory tier and an
+optional SQLite tier that several API workers can share.
+"""
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from agent import preflight
+from agent.cache import LRUCache, SQLiteCache, TieredCache, content_key
+from agent.test_report import TestCaseResult, TestReport
+from config import (
+    TEST_CACHE,
+    TEST_CACHE_DISK_MAX_BYTES,
+    TEST_CACHE_MAX_BYTES,
+    TEST_CACHE_NEGATIVE_TTL,
+    TEST_CACHE_PATH,
+    TEST_CACHE_TTL,
+    TEST_CPU_LIMIT_SECONDS,
+    TEST_MAX_PROCESSES,
+    TEST_MEMORY_LIMIT_MB,
+    TEST_TIMEOUT_SECONDS,
+)
+
+# Report fields that describe the run itself. The rest (test selection
+# bookkeeping) is recomputed by the caller for every run.
+_CACHED_FIELDS = ("passed", "output", "tests", "tests_run", "wall_time", "cpu_time", "peak_rss_mb")
+
+# Imported modules that make a run's outcome vary between runs. Passes of
+# sources importing them expire as soon as failures do.
+NONDETERMINISTIC_MODULES = frozenset({
+    "asyncio", "concurrent", "datetime", "multiprocessing", "random", "secrets",
+    "socket", "subprocess", "threading", "time", "uuid",
+})
+
+@dataclass(frozen=True)
+class RunKey:
+    """The cache keys of a test run."""
+
+    # The key of the exact sources, and of their normalized syntax trees.
+    exact: str
+    normalized: str
+    # Whether the sources import none of `NONDETERMINISTIC_MODULES`.
+    deterministic: bool
+
+class ResultCache:
+    """Caches test reports and tracks the run time they save."""
+
+    def __init__(self, cache: TieredCache, ttl: float, negative_ttl: float):
+        """Initializes the result cache.
+
+        Args:
+            cache: The tiered store holding serialized reports.
+            ttl: Seconds a passing run's report stays valid.
+            negative_ttl: Seconds a failing run's report stays valid.
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self.saved_seconds = 0.0
+        self.expired = 0
+        self.normalized_hits = 0
+
+    @staticmethod
+    def key(code: str, tests: str, argv: tuple[str, ...] = ()) -> RunKey:
+        """Builds the cache keys of a run."""
+        settings = [
+            list(argv),
+            sys.version,
+            [TEST_TIMEOUT_SECONDS, TEST_MEMORY_LIMIT_MB, TEST_CPU_LIMIT_SECONDS, TEST_MAX_PROCESSES],
+        ]
+        return RunKey(
+            exact=content_key("test_run", code, tests, *settings),
+            normalized=content_key("test_run_ast", _normalized(code), _normalized(tests), *settings),
+            deterministic=_deterministic(code) and _deterministic(tests),
+        )
+
+    def get(self, key: RunKey) -> Optional[TestReport]:
+        """Returns a fresh copy of the cached report for a run, if any.
+
+        A report stored for other sources with the same syntax trees is
+        only returned if the run passed.
+        """
+        entry = self._entry(key.exact)
+        if entry is None:
+            entry = self._entry(key.normalized)
+            if entry is None or not entry["report"]["passed"]:
+                return None
+            with self._lock:
+                self.normalized_hits += 1
+        report = entry["report"]
+        if report["tests"] is not None:
+            report["tests"] = [TestCaseResult(**test) for test in report["tests"]]
+        report = TestReport(**report, cached=True)
+        with self._lock:
+            self.saved_seconds += report.wall_time or 0.0
+        return report
+
+    def _entry(self, key: str) -> Optional[dict]:
+        """Returns the unexpired entry stored under a key."""
+        raw = self.cache.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry["expires_at"] < time.time():
+            with self._lock:
+                self.expired += 1
+            return None
+        return entry
+
+    def put(self, key: RunKey, report: TestReport) -> None:
+        """Stores a run's report, unless the runner itself failed."""
+        if not report.cacheable:
+            return
+        data = asdict(report)
+        ttl = self.ttl if report.passed and key.deterministic else self.negative_ttl
+        entry = json.dumps({
+            "report": {name: data[name] for name in _CACHED_FIELDS},
+            "expires_at": time.time() + ttl,
+        })
+        self.cache.put(key.exact, entry)
+        if report.passed:
+            self.cache.put(key.normalized, entry)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the estimated run time saved."""
+        return {
+            **self.cache.stats(),
+            "expired": self.expired,
+            "normalized_hits": self.normalized_hits,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+def _normalized(source: str) -> str:
+    """Returns a source's syntax tree without positions, or the source itself."""
+    try:
+        return preflight.dump(source)
+    except SyntaxError:
+        return source
+
+def _deterministic(source: str) -> bool:
+    """Whether a source imports none of `NONDETERMINISTIC_MODULES`."""
+    try:
+        return not preflight.imported_modules(source) & NONDETERMINISTIC_MODULES
+    except SyntaxError:
+        return True
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+_enabled = TEST_CACHE
+
+def set_enabled(enabled: bool) -> None:
+    """Turns the process-wide result cache on or off, overriding `TEST_CACHE`."""
+    global _enabled
+    _enabled = enabled
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Returns the process-wide result cache, or None if it is off."""
+    global _default_cache
+    if not _enabled:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            disk = None
+            if TEST_CACHE_PATH:
+                disk = SQLiteCache(
+                    TEST_CACHE_PATH, table="test_results", max_bytes=TEST_CACHE_DISK_MAX_BYTES
+                )
+            _default_cache = ResultCache(
+                TieredCache(LRUCache(TEST_CACHE_MAX_BYTES), disk),
+                TEST_CACHE_TTL,
+                TEST_CACHE_NEGATIVE_TTL,
+            )
+        return _default_cache
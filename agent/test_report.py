@@ -0,0 +1,190 @@
+"""
+Structured results of a test run and compact failure summaries for revisions.
+
+Test scripts record per-test results with the collector in
+`agent/sandbox_lib/_agent_test_results.py`. `extract_results` pulls that
+record back out of the captured stderr, and `summarize_failures` turns a
+report into the short feedback sent to the LLM when revising, instead of the
+full test output.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from agent.llm_cache import CHARS_PER_TOKEN
+
+# Must match the collector's RECORD_SEPARATOR, RESULTS_TAG and USAGE_TAG.
+_SEGMENT = re.compile("\x1eAGENT_TEST_(RESULTS|USAGE):(.*?)\x1e", re.DOTALL)
+# The summary line unittest prints after a failed run, e.g. "FAILED (failures=2)".
+_FAILED_SUMMARY = re.compile(r"^FAILED \((.*)\)$", re.MULTILINE)
+
+FAILING_STATUSES = ("failed", "error", "unexpected_success")
+
+@dataclass
+class TestCaseResult:
+    """The outcome of a single test (or failing subtest)."""
+
+    id: str
+    status: str
+    duration: float = 0.0
+    message: str = ""
+    traceback: str = ""
+
+    @property
+    def name(self) -> str:
+        """The test name without the module prefix, e.g. "TestAdd.test_sum"."""
+        return self.id.split(".", 1)[-1]
+
+@dataclass
+class TestReport:
+    """The outcome of a test run.
+
+    `tests` is None when the script never got as far as running tests, for
+    example because of a syntax error or a failing import. `selected` is set
+    when a revision's previously failing or changed tests were run on their
+    own and failed, so the rest of the suite was not run.
+    """
+
+    passed: bool
+    output: str
+    tests: Optional[list[TestCaseResult]] = None
+    tests_run: int = 0
+    # Fingerprints of the tests known to pass (see `agent/test_selection.py`).
+    passed_fingerprints: dict[str, str] = field(default_factory=dict)
+    # The tests run when only a selection of the suite was run.
+    selected: Optional[list[str]] = None
+    # Problems found before the run, which was then skipped (see `agent/preflight.py`).
+    preflight_errors: Optional[list] = None
+    # Resource usage of the run, when it could be measured.
+    wall_time: Optional[float] = None
+    cpu_time: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    # Whether the report was served by the result cache (see `agent/test_cache.py`),
+    # and whether it may be, which it may not when the runner itself failed.
+    cached: bool = False
+    cacheable: bool = True
+
+    @property
+    def failures(self) -> list[TestCaseResult]:
+        return [test for test in self.tests or [] if test.status in FAILING_STATUSES]
+
+    @property
+    def failed_count(self) -> Optional[int]:
+        """The number of failing tests, or None if it is unknown."""
+        if self.tests is not None:
+            return len(self.failures)
+        return count_failed_tests(self.output)
+
+def extract_results(stderr: str) -> tuple[str, Optional[dict], Optional[dict]]:
+    """Removes the collector's records from captured stderr.
+
+    Returns:
+        The stderr exactly as the test script printed it, the merged records
+        of every test run in it (None if there were none), and the process's
+        resource usage (None if it didn't exit normally).
+    """
+    results = usage = None
+    for match in _SEGMENT.finditer(stderr):
+        try:
+            payload = json.loads(match.group(2))
+        except json.JSONDecodeError:
+            continue
+        if match.group(1) == "USAGE":
+            usage = payload
+            continue
+        if results is None:
+            results = {"tests_run": 0, "tests": []}
+        results["tests_run"] += payload.get("tests_run", 0)
+        results["tests"].extend(payload.get("tests", []))
+    return _SEGMENT.sub("", stderr), results, usage
+
+def build_report(
+    passed: bool,
+    output: str,
+    results: Optional[dict],
+    usage: Optional[dict] = None,
+    wall_time: Optional[float] = None,
+) -> TestReport:
+    """Builds a report from a run's outcome and its extracted records.
+
+    Args:
+        passed: Whether the run succeeded.
+        output: The captured output, without the collector's records.
+        results: The per-test records, if any.
+        usage: The run's "cpu_time" in seconds and "peak_rss_kb", if known.
+        wall_time: The run's wall time in seconds, if known.
+    """
+    report = TestReport(passed=passed, output=output, wall_time=wall_time)
+    if results is not None:
+        report.tests = [TestCaseResult(**test) for test in results["tests"]]
+        report.tests_run = results["tests_run"]
+    if usage:
+        if usage.get("cpu_time") is not None:
+            report.cpu_time = round(usage["cpu_time"], 4)
+        if usage.get("peak_rss_kb") is not None:
+            report.peak_rss_mb = round(usage["peak_rss_kb"] / 1024, 2)
+    return report
+
+def count_failed_tests(test_output: str) -> Optional[int]:
+    """Counts the failing tests reported in a unittest run's output.
+
+    Args:
+        test_output: The output returned by `run_tests`.
+
+    Returns:
+        The number of failures plus errors, 0 if the run ended with "OK", or
+        None if the output has no unittest summary (e.g. the script crashed
+        before the tests ran).
+    """
+    match = _FAILED_SUMMARY.search(test_output)
+    if match is None:
+        return 0 if re.search(r"^OK\b", test_output, re.MULTILINE) else None
+    counts = re.findall(r"(failures|errors|unexpected successes)=(\d+)", match.group(1))
+    return sum(int(count) for _, count in counts)
+
+def summarize_failures(report: TestReport, max_tokens: int) -> str:
+    """Builds compact revision feedback from a failed test run.
+
+    Each failing test contributes its name, message (including any
+    assertion diff) and trimmed traceback, until the token budget is used
+    up. Runs that crashed before any test ran fall back to the tail of the
+    raw output, where the error is.
+
+    Args:
+        report: The failed run.
+        max_tokens: The approximate token budget for the summary.
+
+    Returns:
+        The feedback text.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    failures = report.failures
+    if report.tests is None or not failures:
+        return truncate_output(report.output, max_tokens)
+
+    lines = [f"{len(failures)} of {report.tests_run} tests failed."]
+    used = len(lines[0])
+    for index, test in enumerate(failures):
+        entry = f"\n{test.status.upper()}: {test.name}\n{test.message}"
+        if test.traceback:
+            entry += f"\n{test.traceback}"
+        if used + len(entry) > max_chars:
+            remaining = len(failures) - index
+            if index == 0:
+                # Always include something about the first failure.
+                lines.append(entry[:max(max_chars - used, 0)].rstrip() + "\n...")
+                remaining -= 1
+            if remaining:
+                lines.append(f"\n... {remaining} more failing tests omitted.")
+            break
+        lines.append(entry)
+        used += len(entry)
+    return "\n".join(lines).strip()
+
+def truncate_output(output: str, max_tokens: int) -> str:
+    """Keeps the end of a raw test output within a token budget."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(output) <= max_chars:
+        return output
+    return "...\n" + output[-max_chars:]
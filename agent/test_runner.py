@@ -1,9 +1,50 @@
+import asyncio
+import json
+import locale
 import tempfile
 import subprocess
 import os
+import signal
 import sys
+import time
 import uuid
-import ast
+from typing import Optional
+
+from agent import metrics, preflight, sandbox_pool
+from agent.concurrency import shared_limiter
+from agent.sandbox_limits import RunCgroup, preexec_for, run_limits
+from agent.test_cache import get_result_cache
+from agent.test_report import TestReport, build_report, extract_results
+from agent.test_selection import fingerprint_tests, record_passed, select_tests
+from config import (
+    TEST_RUNNER_MODE,
+    TEST_WORKER_POOL_SIZE,
+    TEST_WORKER_MAX_RUNS,
+    TEST_MAX_CONCURRENCY,
+    TEST_TIMEOUT_SECONDS,
+    TEST_PREFLIGHT,
+)
+
+
+NO_SYMBOLS_MESSAGE = "Execution Error: No importable symbols found in code."
+
+# Why the sandbox limits may have terminated a test process.
+_SIGNAL_REASONS = {
+    "SIGXCPU": "CPU time limit exceeded",
+    "SIGKILL": "killed, possibly for exceeding a resource limit",
+}
+
+# Directory of the helper modules test scripts import, and the module that
+# records structured per-test results (see `agent/test_report.py`).
+SANDBOX_LIB_DIR = sandbox_pool.SANDBOX_LIB_DIR
+RESULTS_MODULE = "_agent_test_results"
+
+# Caps concurrent test runs across all callers in this process.
+_test_limiter = shared_limiter(TEST_MAX_CONCURRENCY, "sandbox")
+
+# Cached runs in progress on an event loop, by result cache key, so that
+# concurrent duplicates wait for that run instead of starting their own.
+_in_flight: dict[str, asyncio.Future] = {}
 
 def discover_symbols(source_code: str) -> list[str]:
     """Parse Python source code to find top-level importable names.
@@ -22,20 +63,14 @@ def discover_symbols(source_code: str) -> list[str]:
     """
     names = []
     try:
-        tree = ast.parse(source_code)
-        for node in tree.body:
-            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
-                names.append(node.name)
-            elif isinstance(node, ast.Assign):
-                # For assignments, find the names of the variables being assigned.
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        names.append(target.id)
+        names = preflight.importable_names(preflight.parse(source_code))
     except SyntaxError as e:
         print(f"AST parsing error: {e}")
     return names
 
-def run_tests(code_to_test: str, test_script_content: str) -> tuple[bool, str]:
+def run_tests(
+    code_to_test: str, test_script_content: str, mode: Optional[str] = None
+) -> tuple[bool, str]:
     """Run unit tests in an isolated subprocess using temporary files.
 
     This function provides a secure and reliable way to execute tests. It
@@ -45,68 +80,637 @@ def run_tests(code_to_test: str, test_script_content: str) -> tuple[bool, str]:
     test script. The test script is then executed in a separate Python process
     with a modified environment to ensure the import is successful.
 
+    The "memory" and "pool" modes skip the temporary files and send the
+    sources to a sandbox process over a pipe instead (see `agent/sandbox.py`).
+
     Args:
         code_to_test: A string of Python code containing functions/classes.
         test_script_content: A string of Python unittest code.
+        mode: The runner mode ("cold", "memory" or "pool"). Defaults to
+            `TEST_RUNNER_MODE`.
 
     Returns:
         A tuple containing:
         - A boolean indicating if all tests passed (True) or not (False).
         - A string containing the captured stdout and stderr from the test run.
     """
+    report = run_test_suite(code_to_test, test_script_content, mode)
+    return report.passed, report.output
+
+async def async_run_tests(
+    code_to_test: str, test_script_content: str, mode: Optional[str] = None
+) -> tuple[bool, str]:
+    """Asynchronous version of `run_tests`.
+
+    The test script is launched with `asyncio.create_subprocess_exec` (or
+    handed to a warm worker from a thread), so the event loop keeps serving
+    other tasks while the tests run.
+
+    Args:
+        code_to_test: A string of Python code containing functions/classes.
+        test_script_content: A string of Python unittest code.
+        mode: The runner mode ("cold", "memory" or "pool"). Defaults to
+            `TEST_RUNNER_MODE`.
+
+    Returns:
+        A tuple containing:
+        - A boolean indicating if all tests passed (True) or not (False).
+        - A string containing the captured stdout and stderr from the test run.
+    """
+    report = await async_run_test_suite(code_to_test, test_script_content, mode)
+    return report.passed, report.output
+
+def run_test_suite(
+    code_to_test: str,
+    test_script_content: str,
+    mode: Optional[str] = None,
+    previous: Optional[TestReport] = None,
+    timeout: Optional[float] = None,
+) -> TestReport:
+    """Like `run_tests`, but also returns each test's structured result.
+
+    When the report of the suite's previous version is given, the tests
+    that failed or changed since then (see `agent/test_selection.py`) are
+    run first with unittest's fail-fast option. If any of them fails, that
+    report is returned without running the rest of the suite; otherwise the
+    full suite runs as usual.
+
+    Args:
+        code_to_test: A string of Python code containing functions/classes.
+        test_script_content: A string of Python unittest code.
+        mode: The runner mode ("cold", "memory" or "pool"). Defaults to
+            `TEST_RUNNER_MODE`.
+        previous: The report of the previous attempt's test run, if any.
+        timeout: Seconds each run may take, e.g. the time left before a
+            task's deadline. Capped at, and defaults to, `TEST_TIMEOUT_SECONDS`.
+
+    Unless `TEST_PREFLIGHT` is off, the sources are first checked statically
+    (see `agent/preflight.py`), and a failed report listing the problems is
+    returned without starting a run if any is found.
+
+    Returns:
+        The run's report. For a full run, its output is exactly what
+        `run_tests` returns.
+    """
+    mode = _resolve_mode(mode)
+    timeout = _resolve_timeout(timeout)
+    rejected = _preflight(code_to_test, test_script_content)
+    if rejected is not None:
+        return rejected
+    fingerprints = fingerprint_tests(code_to_test, test_script_content)
+    selected = select_tests(fingerprints, previous)
+    if selected is not None:
+        report = _run_suite(
+            mode, code_to_test, test_script_content, _focus_argv(selected), timeout
+        )
+        if _selection_failed(report):
+            report.selected = selected
+            return record_passed(report, fingerprints, previous)
+    report = _run_suite(mode, code_to_test, test_script_content, timeout=timeout)
+    return record_passed(report, fingerprints)
+
+async def async_run_test_suite(
+    code_to_test: str,
+    test_script_content: str,
+    mode: Optional[str] = None,
+    previous: Optional[TestReport] = None,
+    timeout: Optional[float] = None,
+) -> TestReport:
+    """Asynchronous version of `run_test_suite`."""
+    mode = _resolve_mode(mode)
+    timeout = _resolve_timeout(timeout)
+    rejected = _preflight(code_to_test, test_script_content)
+    if rejected is not None:
+        return rejected
+    fingerprints = fingerprint_tests(code_to_test, test_script_content)
+    selected = select_tests(fingerprints, previous)
+    if selected is not None:
+        report = await _async_run_suite(
+            mode, code_to_test, test_script_content, _focus_argv(selected), timeout
+        )
+        if _selection_failed(report):
+            report.selected = selected
+            return record_passed(report, fingerprints, previous)
+    report = await _async_run_suite(mode, code_to_test, test_script_content, timeout=timeout)
+    return record_passed(report, fingerprints)
+
+def _preflight(code_to_test: str, test_script_content: str) -> Optional[TestReport]:
+    """Returns a failed report if the sources fail a pre-flight check."""
+    if not TEST_PREFLIGHT:
+        return None
+    with metrics.span("preflight"):
+        errors = preflight.check(code_to_test, test_script_content)
+    if not errors:
+        return None
+    metrics.record_preflight_rejection(errors[0].check)
+    return TestReport(False, preflight.format_errors(errors), preflight_errors=errors)
+
+def _run_suite(
+    mode: str,
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Runs a suite in the given mode, holding a test concurrency slot.
+
+    With `TEST_CACHE` on, a cached report of the same run is returned
+    instead, and new reports are cached.
+    """
+    cache = get_result_cache()
+    if cache is not None:
+        key = cache.key(code_to_test, test_script_content, argv)
+        report = cache.get(key)
+        if report is None:
+            report = _run_suite_uncached(mode, code_to_test, test_script_content, argv, timeout)
+            cache.put(key, report)
+        return report
+    return _run_suite_uncached(mode, code_to_test, test_script_content, argv, timeout)
+
+def _run_suite_uncached(
+    mode: str,
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    queued = time.perf_counter()
+    with _test_limiter:
+        metrics.observe("test_queue", time.perf_counter() - queued)
+        if mode == "pool":
+            report = _run_tests_in_pool(code_to_test, test_script_content, argv, timeout)
+        elif mode == "memory":
+            report = _run_tests_in_memory(code_to_test, test_script_content, argv, timeout)
+        else:
+            report = _run_tests_cold(code_to_test, test_script_content, argv, timeout)
+    _record_run(report)
+    return report
+
+async def _async_run_suite(
+    mode: str,
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Asynchronous version of `_run_suite`.
+
+    Concurrent runs with the same cache key share a single run.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return await _async_run_suite_uncached(
+            mode, code_to_test, test_script_content, argv, timeout
+        )
+
+    key = cache.key(code_to_test, test_script_content, argv)
+    report = cache.get(key)
+    if report is not None:
+        return report
+    loop = asyncio.get_running_loop()
+    running = _in_flight.get(key)
+    if running is not None and running.get_loop() is loop:
+        await asyncio.shield(running)
+        report = cache.get(key)
+        if report is not None:
+            return report
+
+    done = loop.create_future()
+    _in_flight[key] = done
+    try:
+        report = await _async_run_suite_uncached(
+            mode, code_to_test, test_script_content, argv, timeout
+        )
+        cache.put(key, report)
+        return report
+    finally:
+        if _in_flight.get(key) is done:
+            del _in_flight[key]
+        done.set_result(None)
+
+async def _async_run_suite_uncached(
+    mode: str,
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    queued = time.perf_counter()
+    async with _test_limiter:
+        metrics.observe("test_queue", time.perf_counter() - queued)
+        if mode == "pool":
+            report = await asyncio.to_thread(
+                _run_tests_in_pool, code_to_test, test_script_content, argv, timeout
+            )
+        elif mode == "memory":
+            report = await _async_run_tests_in_memory(
+                code_to_test, test_script_content, argv, timeout
+            )
+        else:
+            report = await _async_run_tests_cold(code_to_test, test_script_content, argv, timeout)
+    _record_run(report)
+    return report
+
+def _record_run(report: TestReport) -> None:
+    """Splits a run's wall time into the tests themselves and sandbox overhead.
+
+    The overhead covers starting the process, importing the code and test
+    script, and collecting the results.
+    """
+    if report.wall_time is None or not metrics.is_active():
+        return
+    # Failing subtests are recorded separately, each timed from its test's start.
+    durations: dict[str, float] = {}
+    for test in report.tests or []:
+        test_id = test.id.split(" ", 1)[0]
+        durations[test_id] = max(durations.get(test_id, 0.0), test.duration)
+    execution = sum(durations.values())
+    metrics.observe("test_execution", execution)
+    metrics.observe("sandbox", max(report.wall_time - execution, 0.0))
+
+def _focus_argv(selected: list[str]) -> tuple[str, ...]:
+    """Returns unittest arguments that run only some tests, failing fast."""
+    return ("--failfast", *selected)
+
+def _selection_failed(report: TestReport) -> bool:
+    """True if a run of selected tests failed in a way worth reporting.
+
+    A run where no test ran at all (e.g. a selected name unittest couldn't
+    resolve) is not trusted; the full suite is run instead.
+    """
+    return not report.passed and report.tests is not None
+
+def set_max_concurrency(limit: int) -> None:
+    """Changes how many test runs may execute at the same time."""
+    global _test_limiter
+    _test_limiter = shared_limiter(limit, "sandbox")
+
+def _run_tests_cold(
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Runs the tests in a new interpreter from temporary files.
+
+    `argv` is passed to the test script, e.g. to select tests for unittest.
+    """
+    code_module_name, code_path, test_path = _temp_paths()
+    try:
+        env = _write_test_files(
+            code_to_test, test_script_content, code_module_name, code_path, test_path
+        )
+        if env is None:
+            return TestReport(False, NO_SYMBOLS_MESSAGE)
+
+        # Execute the test script in the isolated environment.
+        with run_limits() as (limits, cgroup):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, test_path, *argv],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                env=env,
+                preexec_fn=preexec_for(limits)
+            )
+            wall_time = time.perf_counter() - start
+
+            return _report(
+                result.returncode, result.stdout, result.stderr, wall_time, cgroup
+            )
+
+    except Exception as e:
+        return _error_report(e)
+    finally:
+        _remove_files(code_path, test_path)
+
+async def _async_run_tests_cold(
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Asynchronous version of `_run_tests_cold`."""
+    code_module_name, code_path, test_path = _temp_paths()
+    try:
+        env = _write_test_files(
+            code_to_test, test_script_content, code_module_name, code_path, test_path
+        )
+        if env is None:
+            return TestReport(False, NO_SYMBOLS_MESSAGE)
+
+        command = [sys.executable, test_path, *argv]
+        with run_limits() as (limits, cgroup):
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                preexec_fn=preexec_for(limits)
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise _timeout_error(test_path, timeout)
+            wall_time = time.perf_counter() - start
+
+            return _report(
+                process.returncode, _decode(stdout), _decode(stderr), wall_time, cgroup
+            )
+
+    except Exception as e:
+        return _error_report(e)
+    finally:
+        _remove_files(code_path, test_path)
+
+def _error_report(error: Exception) -> TestReport:
+    """Reports a run that failed outside the tests.
+
+    Only timeouts are the tests' doing; other errors are the runner's and
+    are not cached. Neither are timeouts shortened by a task's deadline,
+    since the same run could pass with the full `TEST_TIMEOUT_SECONDS`.
+    """
+    report = TestReport(False, f"An unexpected error occurred: {error}")
+    report.cacheable = (
+        isinstance(error, subprocess.TimeoutExpired)
+        and error.timeout >= TEST_TIMEOUT_SECONDS
+    )
+    return report
+
+def _report(
+    returncode: int,
+    stdout: str,
+    stderr: str,
+    wall_time: Optional[float] = None,
+    cgroup: Optional[RunCgroup] = None,
+    usage: Optional[dict] = None,
+) -> TestReport:
+    """Builds a run's report, removing the structured results from stderr.
+
+    Resource usage comes from the run's cgroup when there is one, since it
+    also covers processes the tests started, otherwise from `usage` or from
+    what the test process reported about itself.
+    """
+    stderr, results, own_usage = extract_results(stderr)
+    usage = {**(own_usage or {}), **(usage or {}), **(cgroup.usage() if cgroup else {})}
+    output = (stdout + stderr).strip()
+    if returncode < 0:
+        output = f"{output}\n\n{_signal_message(-returncode)}".strip()
+    return build_report(returncode == 0, output, results, usage, wall_time)
+
+def _signal_message(signal_number: int) -> str:
+    """Explains why a test process was terminated by a signal."""
+    try:
+        name = signal.Signals(signal_number).name
+    except ValueError:
+        name = f"signal {signal_number}"
+    reason = _SIGNAL_REASONS.get(name)
+    return f"Test process terminated by {name}" + (f" ({reason})." if reason else ".")
+
+def _resolve_timeout(timeout: Optional[float]) -> float:
+    """Returns a run's timeout, at most `TEST_TIMEOUT_SECONDS`."""
+    if timeout is None:
+        return TEST_TIMEOUT_SECONDS
+    return min(timeout, TEST_TIMEOUT_SECONDS)
+
+def _resolve_mode(mode: Optional[str]) -> str:
+    """Returns the runner mode to use, falling back to "cold" if unsupported."""
+    mode = mode or TEST_RUNNER_MODE
+    if mode not in ("cold", "memory", "pool"):
+        raise ValueError(f"Unsupported test runner mode: {mode}")
+    if mode == "pool" and not sandbox_pool.is_supported():
+        return "cold"
+    return mode
+
+def get_worker_pool() -> sandbox_pool.SandboxPool:
+    """Returns the shared pool of warm sandbox workers."""
+    return sandbox_pool.get_sandbox_pool(TEST_WORKER_POOL_SIZE, TEST_WORKER_MAX_RUNS)
+
+def _run_tests_in_pool(
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Runs the tests on a warm sandbox worker instead of a new interpreter.
+
+    Nothing is written to disk: the worker receives the sources over a pipe
+    and runs them under the file names the cold runner would have used.
+    """
+    try:
+        request = _suite_request(code_to_test, test_script_content, argv)
+        if request is None:
+            return TestReport(False, NO_SYMBOLS_MESSAGE)
+
+        with run_limits() as (limits, cgroup):
+            request["limits"] = limits
+            start = time.perf_counter()
+            try:
+                reply = get_worker_pool().run(request, timeout)
+            except sandbox_pool.NoWorkerError:
+                # The tests never started, so this is no test timeout.
+                raise
+            except TimeoutError:
+                raise _timeout_error(request["test_filename"], timeout)
+            wall_time = time.perf_counter() - start
+
+            return _report(
+                reply["returncode"], reply["stdout"], reply["stderr"],
+                wall_time, cgroup, reply.get("usage")
+            )
+
+    except Exception as e:
+        return _error_report(e)
+
+def _run_tests_in_memory(
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Runs the tests in a new interpreter that loads the sources from stdin.
+
+    Unlike the cold runner, no file is written, no environment is copied and
+    the interpreter's output is the same as if it had run the files.
+    """
+    try:
+        request = _suite_request(code_to_test, test_script_content, argv)
+        if request is None:
+            return TestReport(False, NO_SYMBOLS_MESSAGE)
+
+        with run_limits() as (limits, cgroup):
+            start = time.perf_counter()
+            try:
+                result = subprocess.run(
+                    [sys.executable, sandbox_pool.SANDBOX_SCRIPT, "--stdin"],
+                    input=json.dumps(request),
+                    capture_output=True,
+                    text=True,
+                    timeout=timeout,
+                    preexec_fn=preexec_for(limits),
+                )
+            except subprocess.TimeoutExpired:
+                raise _timeout_error(request["test_filename"], timeout)
+            wall_time = time.perf_counter() - start
+
+            return _report(
+                result.returncode, result.stdout, result.stderr, wall_time, cgroup
+            )
+
+    except Exception as e:
+        return _error_report(e)
+
+async def _async_run_tests_in_memory(
+    code_to_test: str,
+    test_script_content: str,
+    argv: tuple[str, ...] = (),
+    timeout: float = TEST_TIMEOUT_SECONDS,
+) -> TestReport:
+    """Asynchronous version of `_run_tests_in_memory`."""
+    try:
+        request = _suite_request(code_to_test, test_script_content, argv)
+        if request is None:
+            return TestReport(False, NO_SYMBOLS_MESSAGE)
+
+        with run_limits() as (limits, cgroup):
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, sandbox_pool.SANDBOX_SCRIPT, "--stdin",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                preexec_fn=preexec_for(limits),
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(json.dumps(request).encode("utf-8")),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise _timeout_error(request["test_filename"], timeout)
+            wall_time = time.perf_counter() - start
+
+            return _report(
+                process.returncode, _decode(stdout), _decode(stderr), wall_time, cgroup
+            )
+
+    except Exception as e:
+        return _error_report(e)
+
+def _suite_request(
+    code_to_test: str, test_script_content: str, argv: tuple[str, ...] = ()
+) -> Optional[dict]:
+    """Builds the request a sandbox process needs to run a suite from memory.
+
+    Returns:
+        The request, or None if the code has no importable symbols.
+    """
+    code_module_name, code_path, test_path = _temp_paths()
+    final_test_script = _build_test_script(
+        code_to_test, test_script_content, code_module_name
+    )
+    if final_test_script is None:
+        return None
+    return {
+        "module_name": code_module_name,
+        "code": code_to_test,
+        "code_filename": code_path,
+        "test_script": final_test_script,
+        "test_filename": test_path,
+        "argv": list(argv),
+    }
+
+def _timeout_error(test_path: str, timeout: float) -> subprocess.TimeoutExpired:
+    """Builds the timeout error every runner mode reports, like the cold runner."""
+    return subprocess.TimeoutExpired([sys.executable, test_path], timeout)
+
+def _temp_paths() -> tuple[str, str, str]:
+    """Returns a unique module name and the code and test file paths."""
     temp_dir = tempfile.gettempdir()
     unique_id = uuid.uuid4().hex
     code_module_name = f"module_{unique_id}"
     code_path = os.path.join(temp_dir, f"{code_module_name}.py")
     test_path = os.path.join(temp_dir, f"test_{unique_id}.py")
+    return code_module_name, code_path, test_path
+
+def _write_test_files(
+    code_to_test: str,
+    test_script_content: str,
+    code_module_name: str,
+    code_path: str,
+    test_path: str,
+) -> Optional[dict[str, str]]:
+    """Writes the code module and the runnable test script to disk.
+
+    Returns:
+        The environment to run the test script with, or None if the code
+        has no importable symbols and the run should be skipped.
+    """
+    with open(code_path, "w", encoding="utf-8") as f:
+        f.write(code_to_test)
+
+    final_test_script = _build_test_script(
+        code_to_test, test_script_content, code_module_name
+    )
+    if final_test_script is None:
+        return None
+
+    with open(test_path, "w", encoding="utf-8") as f:
+        f.write(final_test_script)
 
     # Create a modified environment for the subprocess. This ensures the
     # subprocess can find the temporary module.
+    temp_dir = os.path.dirname(code_path)
     env = os.environ.copy()
-    env["PYTHONPATH"] = temp_dir + os.pathsep + env.get("PYTHONPATH", "")
+    env["PYTHONPATH"] = os.pathsep.join(
+        [temp_dir, SANDBOX_LIB_DIR, env.get("PYTHONPATH", "")]
+    )
+    return env
 
-    try:
-        with open(code_path, "w", encoding="utf-8") as f:
-            f.write(code_to_test)
-
-        # Use AST to discover all importable names from the code.
-        importable_names = discover_symbols(code_to_test)
-        if not importable_names:
-            return False, "Execution Error: No importable symbols found in code."
-
-        # Dynamically build the explicit import line.
-        import_statement = ", ".join(importable_names)
-        import_line = f"from {code_module_name} import {import_statement}\n"
-        
-        # Add the main execution block to run unittest.
-        main_block = "\n\nif __name__ == '__main__':\n    unittest.main()"
-        final_test_script = import_line + test_script_content + main_block
-        
-        with open(test_path, "w", encoding="utf-8") as f:
-            f.write(final_test_script)
+def _build_test_script(
+    code_to_test: str, test_script_content: str, code_module_name: str
+) -> Optional[str]:
+    """Builds the runnable test script that imports the code under test.
 
-        # Execute the test script in the isolated environment.
-        result = subprocess.run(
-            [sys.executable, test_path],
-            capture_output=True,
-            text=True,
-            timeout=10,
-            env=env
-        )
+    Returns:
+        The final test script, or None if the code has no importable symbols.
+    """
+    # Use AST to discover all importable names from the code.
+    importable_names = discover_symbols(code_to_test)
+    if not importable_names:
+        return None
 
-        passed = result.returncode == 0
-        captured_output = result.stdout + result.stderr
-        
-        return passed, captured_output.strip()
+    # Dynamically build the explicit import lines. The results collector gets
+    # a line of its own, so a traceback through the code's import doesn't
+    # show it.
+    import_statement = ", ".join(importable_names)
+    import_lines = (
+        f"import {RESULTS_MODULE}\n"
+        f"from {code_module_name} import {import_statement}\n"
+    )
 
-    except Exception as e:
-        return False, f"An unexpected error occurred: {e}"
-    finally:
-        # Ensure temporary files are always cleaned up.
-        if os.path.exists(code_path):
-            os.remove(code_path)
-        if os.path.exists(test_path):
-            os.remove(test_path)
+    # Add the main execution block to run unittest.
+    main_block = "\n\nif __name__ == '__main__':\n    unittest.main()"
+    return import_lines + test_script_content + main_block
+
+def _remove_files(*paths: str) -> None:
+    """Ensure temporary files are always cleaned up."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _decode(output: bytes) -> str:
+    """Decodes raw subprocess output the way `text=True` would."""
+    text = output.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
 
 if __name__ == "__main__":
     print("--- Running Example Test Case with AST-based Imports ---")
@@ -0,0 +1,170 @@
+"""
+Chooses which tests to re-run first when a revised suite is tested again.
+
+Each test method gets a fingerprint from its own source, its class's shared
+setup, the test module's top-level code and the source of every symbol of
+the code under test it uses, directly or through other symbols. A test whose
+fingerprint matches one that passed last time can't have changed outcome, so
+revisions first run only the tests that failed or changed, and fail fast.
+"""
+import ast
+from functools import lru_cache
+from typing import Optional
+
+from agent import preflight
+from agent.cache import content_key
+from agent.test_report import TestReport
+from config import PREFLIGHT_AST_CACHE_SIZE
+
+# Statuses that count as a test that didn't fail.
+_OK_STATUSES = ("passed", "skipped", "expected_failure")
+
+def fingerprint_tests(code: str, tests: str) -> dict[str, str]:
+    """Fingerprints every test method of a unittest script.
+
+    Args:
+        code: The code under test.
+        tests: The test script.
+
+    Returns:
+        A mapping from test ids ("Class.test_method", as unittest names them
+        in the `__main__` module) to fingerprints. Empty if either source
+        can't be parsed.
+    """
+    return dict(_fingerprint_tests(code, tests))
+
+@lru_cache(maxsize=PREFLIGHT_AST_CACHE_SIZE)
+def _fingerprint_tests(code: str, tests: str) -> dict[str, str]:
+    try:
+        code_tree = preflight.parse(code)
+        tests_tree = preflight.parse(tests)
+    except SyntaxError:
+        return {}
+
+    symbols = _top_level_definitions(code_tree)
+    # Imports and other top-level statements of the code affect every test.
+    code_setup = [
+        node for node in code_tree.body
+        if not isinstance(
+            node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef, ast.Assign)
+        )
+    ]
+    code_key = content_key(*(ast.dump(node) for node in code_setup))
+    module_setup = [node for node in tests_tree.body if not isinstance(node, ast.ClassDef)]
+    module_key = content_key(*(ast.dump(node) for node in module_setup))
+    module_names = _names_used(module_setup)
+
+    fingerprints = {}
+    for node in tests_tree.body:
+        if not isinstance(node, ast.ClassDef) or not node.bases:
+            continue
+        methods = [item for item in node.body if isinstance(item, ast.FunctionDef)]
+        shared = [
+            item for item in node.body
+            if not (isinstance(item, ast.FunctionDef) and item.name.startswith("test"))
+        ]
+        shared_key = content_key(*(ast.dump(item) for item in shared + node.bases))
+        shared_names = _names_used(shared)
+        for method in methods:
+            if not method.name.startswith("test"):
+                continue
+            used = _closure(module_names | shared_names | _names_used([method]), symbols)
+            fingerprints[f"{node.name}.{method.name}"] = content_key(
+                ast.dump(method),
+                shared_key,
+                module_key,
+                code_key,
+                {name: ast.dump(symbols[name]) for name in sorted(used)},
+            )
+    return fingerprints
+
+def select_tests(
+    fingerprints: dict[str, str], previous: Optional[TestReport]
+) -> Optional[list[str]]:
+    """Returns the tests to run first, or None to run the full suite directly.
+
+    A test is selected unless the same fingerprint passed in an earlier run.
+    Nothing is selected when there is no history, or when the selection
+    would be empty or the whole suite anyway.
+    """
+    if previous is None or not fingerprints:
+        return None
+    selected = [
+        test_id for test_id, fingerprint in fingerprints.items()
+        if previous.passed_fingerprints.get(test_id) != fingerprint
+    ]
+    if not selected or len(selected) == len(fingerprints):
+        return None
+    return selected
+
+def record_passed(
+    report: TestReport,
+    fingerprints: dict[str, str],
+    previous: Optional[TestReport] = None,
+) -> TestReport:
+    """Stores the fingerprints of the tests a run showed to pass.
+
+    Args:
+        report: The run's report, updated in place.
+        fingerprints: The fingerprints of the suite that was run.
+        previous: For a run of selected tests only, the earlier report whose
+            passing tests are carried over when unchanged.
+
+    Returns:
+        The report.
+    """
+    passed = {}
+    if previous is not None:
+        passed = {
+            test_id: fingerprint
+            for test_id, fingerprint in previous.passed_fingerprints.items()
+            if fingerprints.get(test_id) == fingerprint
+        }
+    failed = {_local_id(test.id) for test in report.failures}
+    for test in report.tests or []:
+        test_id = _local_id(test.id)
+        if test.status in _OK_STATUSES and test_id in fingerprints and test_id not in failed:
+            passed[test_id] = fingerprints[test_id]
+    report.passed_fingerprints = passed
+    return report
+
+def _local_id(test_id: str) -> str:
+    """Turns "__main__.Class.test (i=1)" into "Class.test"."""
+    test_id = test_id.split(" ", 1)[0]
+    return test_id[len("__main__."):] if test_id.startswith("__main__.") else test_id
+
+def _top_level_definitions(tree: ast.Module) -> dict[str, ast.AST]:
+    """Maps each top-level name of a module to the statement defining it."""
+    definitions = {}
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            definitions[node.name] = node
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    definitions[target.id] = node
+    return definitions
+
+def _names_used(nodes: list[ast.AST]) -> set[str]:
+    """Returns every plain name referenced in some statements."""
+    return {
+        child.id
+        for node in nodes
+        for child in ast.walk(node)
+        if isinstance(child, ast.Name)
+    }
+
+def _closure(names: set[str], symbols: dict[str, ast.AST]) -> set[str]:
+    """Returns the code symbols reachable from a set of names."""
+    used: set[str] = set()
+    pending = [name for name in names if name in symbols]
+    while pending:
+        name = pending.pop()
+        if name in used:
+            continue
+        used.add(name)
+        pending.extend(
+            other for other in _names_used([symbols[name]])
+            if other in symbols and other not in used
+        )
+    return used
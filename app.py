@@ -1,3 +1,4 @@
+import json
 import os
 import requests
 
@@ -12,19 +13,60 @@ if st.button("Generate Code"):
 
     # Get the API URL from the environment variable, with a default for local development
     api_base_url = os.getenv("API_URL", "http://127.0.0.1:8000")
-    api_url = f"{api_base_url}/generate-code"
-    response = requests.post(api_url, json={"task_description": task})
+    api_url = f"{api_base_url}/generate-code/stream"
+    response = requests.post(api_url, json={"task_description": task}, stream=True)
 
     if response.status_code == 200:
-        result = response.json()
-
+        status = st.empty()
         st.subheader("Generated Code")
-        st.code(result["code"], language="python")
-
+        code_placeholder = st.empty()
         st.subheader("Generated Tests")
-        st.code(result["tests"], language="python")
-
+        tests_placeholder = st.empty()
         st.subheader("Test Output")
-        st.text(result["output"])
+        output_placeholder = st.empty()
+
+        llm_output = ""
+        function_done = False
+
+        # Render each event as soon as the API streams it.
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            event = json.loads(line)
+            kind = event["event"]
+
+            if kind == "attempt":
+                llm_output = ""
+                function_done = False
+                status.info(f"Attempt {event['attempt']}/{event['max_tries']}...")
+            elif kind == "revision":
+                status.info(f"Tests failed. Revising (attempt {event['attempt']})...")
+            elif kind == "token":
+                # Show the raw LLM output under the section being generated.
+                llm_output += event["text"]
+                placeholder = tests_placeholder if function_done else code_placeholder
+                placeholder.code(llm_output, language="python")
+            elif kind == "function":
+                code_placeholder.code(event["code"], language="python")
+                llm_output = ""
+                function_done = True
+            elif kind == "generated":
+                code_placeholder.code(event["code"], language="python")
+                tests_placeholder.code(event["tests"], language="python")
+                status.info("Running tests...")
+            elif kind == "test_result":
+                output_placeholder.text(event["output"])
+            elif kind == "error":
+                output_placeholder.text(event["message"])
+            elif kind == "result":
+                code_placeholder.code(event["code"], language="python")
+                tests_placeholder.code(event["tests"], language="python")
+                output_placeholder.text(event["output"])
+                if event["passed"]:
+                    status.success("All tests passed!")
+                elif event.get("status") == "deadline_exceeded":
+                    status.warning("Deadline reached. Showing the best attempt; human review required.")
+                else:
+                    status.warning("Max attempts reached. Human review required.")
     else:
-        st.error("Failed to get a response from the API")
\ No newline at end of file
+        st.error("Failed to get a response from the API")
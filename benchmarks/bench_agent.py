@@ -0,0 +1,454 @@
+"""
+Benchmarks the agent loop end to end against a deterministic fake LLM.
+
+Every LLM call is served by `FakeChain` (see `benchmarks/fake_llm.py`), which
+replays recorded good, failing and malformed responses with simulated
+latency, so the measurements cover the agent's own overhead and the test
+runs without depending on a real model. Five stages are measured:
+
+- "parse": `_parse_code_and_tests` on every recorded response.
+- "run_tests": `async_run_tests` on the recorded code under concurrency, per
+  runner mode.
+- "run_task": `async_run_task` on a mix of tasks under concurrency, with the
+  time spent waiting on the LLM, for the first token and in test runs.
+- "api": `POST /generate-code` on the FastAPI app, in process.
+- "overload": a load test sending every task to the API at once, with only
+  `--overload-slots` task slots, once with the bounded admission queue
+  (`--overload-queue` requests waiting at most `--overload-wait` seconds,
+  the rest rejected with 429) and once with an unbounded queue, to compare
+  the latency of admitted requests, the time to a rejection and the peak
+  queue length.
+
+The report is printed as JSON with p50/p95/p99 latencies and throughput.
+The "run_task" and "api" stages use the configured `TEST_RUNNER_MODE` and
+the LLM concurrency limit of the configured `LLM_PROVIDER`. Tasks replay the
+same few recorded responses, so the test result cache is off unless
+`--test-cache` is given, and few-shot examples are off unless
+`--few-shot N` is given (they then come from an in-memory index). With
+`--slo`, every task of those two stages gets that latency SLO, counted from its submission, and the report counts the
+tasks that returned with "deadline_exceeded".
+
+Usage:
+    python benchmarks/bench_agent.py --tasks 40 --concurrency 8 \\
+        --mix good=0.6,failing=0.3,malformed=0.1 --ttft-ms 200
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from functools import partial
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import main as api
+from agent import example_index, test_cache
+from agent.admission import AdmissionController
+from agent.code_generator import _parse_code_and_tests
+from agent.llm_pool import LLMPool
+from agent.test_runner import async_run_tests, get_worker_pool
+from cli import async_run_task
+from config import LLM_PROVIDER, TEST_RUNNER_MODE
+from fake_llm import OUTCOMES, FakeChain, FakeLLMInterface, LatencyProfile, load_fixtures
+from latency_stats import summarize
+
+STAGES = ("parse", "run_tests", "run_task", "api", "overload")
+# The wait of the "unbounded" overload run: long enough to never expire.
+UNBOUNDED_WAIT_SECONDS = 3600.0
+
+def parse_mix(value: str) -> dict[str, float]:
+    """Parses "good=0.6,failing=0.3,malformed=0.1" into outcome weights."""
+    mix = {}
+    for part in value.split(","):
+        outcome, _, weight = part.partition("=")
+        if outcome.strip() not in OUTCOMES:
+            raise argparse.ArgumentTypeError(f"unknown outcome: {outcome}")
+        mix[outcome.strip()] = float(weight)
+    return mix
+
+def make_tasks(
+    chain: FakeChain, fixtures: list[dict], count: int, mix: dict[str, float], seed: int
+) -> list[tuple[str, str]]:
+    """Registers `count` tasks with outcomes drawn from the mix.
+
+    Returns:
+        (task_description, outcome) pairs.
+    """
+    rng = random.Random(seed)
+    outcomes = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    tasks = []
+    for i, outcome in enumerate(outcomes):
+        fixture = fixtures[i % len(fixtures)]
+        description = f"{fixture['task']} (benchmark task {i})"
+        chain.add_task(description, fixture, outcome)
+        tasks.append((description, outcome))
+    return tasks
+
+def bench_parse(fixtures: list[dict], repeats: int) -> dict:
+    report = {}
+    for outcome in OUTCOMES:
+        samples, errors = [], 0
+        for _ in range(repeats):
+            for fixture in fixtures:
+                start = time.perf_counter()
+                try:
+                    _parse_code_and_tests(fixture[outcome])
+                except ValueError:
+                    errors += 1
+                samples.append(time.perf_counter() - start)
+        report[outcome] = {**summarize(samples, unit="us"), "errors": errors}
+    return report
+
+async def bench_run_tests(
+    fixtures: list[dict], mode: str, runs: int, concurrency: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i: int) -> None:
+        fixture = fixtures[i % len(fixtures)]
+        outcome = "good" if i % 2 == 0 else "failing"
+        code, tests = _parse_code_and_tests(fixture[outcome])
+        async with semaphore:
+            start = time.perf_counter()
+            await async_run_tests(code, tests, mode=mode)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "latency": summarize(samples),
+        "runs_per_second": round(runs / elapsed, 2),
+    }
+
+class StageTimer:
+    """Splits one task's wall time into stages from its progress events."""
+
+    def __init__(self):
+        self.llm: list[float] = []
+        self.first_token: list[float] = []
+        self.tests: list[float] = []
+        self.attempts = 0
+        self.deadline_exceeded = False
+        self._attempt_start = self._generated = None
+        self._streaming = False
+
+    async def on_event(self, event: dict) -> None:
+        now = time.perf_counter()
+        kind = event["event"]
+        if kind == "attempt":
+            self.attempts += 1
+            self._attempt_start, self._generated = now, None
+            self._streaming = False
+        elif kind == "token" and not self._streaming:
+            self._streaming = True
+            self.first_token.append(now - self._attempt_start)
+        elif kind == "generated" and self._generated is None:
+            self._generated = now
+            self.llm.append(now - self._attempt_start)
+        elif kind == "test_result" and self._generated is not None:
+            self.tests.append(now - self._generated)
+        elif kind == "error" and self._generated is None:
+            # The response couldn't be parsed: the whole attempt was the LLM's.
+            self.llm.append(now - self._attempt_start)
+        elif kind == "deadline_exceeded":
+            self.deadline_exceeded = True
+
+async def bench_run_task(
+    pool: LLMPool,
+    tasks: list[tuple[str, str]],
+    concurrency: int,
+    max_tries: int,
+    slo: Optional[float] = None,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    agent = pool.get()
+    latencies, timers = [], []
+    outcomes = {
+        outcome: {"tasks": 0, "passed": 0, "deadline_exceeded": 0} for outcome in OUTCOMES
+    }
+
+    async def one(description: str, outcome: str) -> None:
+        timer = StageTimer()
+        deadline = time.monotonic() + slo if slo else None
+        async with semaphore:
+            start = time.perf_counter()
+            _, passed, _, _ = await async_run_task(
+                description, agent, max_tries=max_tries, on_event=timer.on_event,
+                deadline=deadline
+            )
+            latencies.append(time.perf_counter() - start)
+        timers.append(timer)
+        outcomes[outcome]["tasks"] += 1
+        outcomes[outcome]["passed"] += int(passed)
+        outcomes[outcome]["deadline_exceeded"] += int(timer.deadline_exceeded)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*task) for task in tasks))
+    elapsed = time.perf_counter() - start
+    attempts = [timer.attempts for timer in timers]
+    return {
+        "tasks": len(tasks),
+        "concurrency": concurrency,
+        "tasks_per_second": round(len(tasks) / elapsed, 2),
+        "latency": summarize(latencies),
+        "stages": {
+            "llm": summarize([s for timer in timers for s in timer.llm]),
+            "first_token": summarize([s for timer in timers for s in timer.first_token]),
+            "tests": summarize([s for timer in timers for s in timer.tests]),
+        },
+        "attempts": {"total": sum(attempts), "max": max(attempts, default=0)},
+        "outcomes": outcomes,
+    }
+
+async def bench_api(
+    chain: FakeChain,
+    tasks: list[tuple[str, str]],
+    concurrency: int,
+    max_tries: int,
+    slo: Optional[float] = None,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, task_statuses = [], {}, {}
+
+    async with api.lifespan(api.app):
+        # Serve every request from the fake backend instead of a real model.
+        await api.app.state.llm_pool.aclose()
+        api.app.state.llm_pool = LLMPool(interface_factory=partial(FakeLLMInterface, chain))
+        api.app.state.admission = AdmissionController(
+            api.task_slots(api.app.state.llm_pool.get())
+        )
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+
+            async def one(description: str) -> None:
+                request = {"task_description": description, "max_tries": max_tries}
+                if slo:
+                    request["deadline"] = time.time() + slo
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/generate-code", json=request)
+                    latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    status = response.json()["status"]
+                    task_statuses[status] = task_statuses.get(status, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(description) for description, _ in tasks))
+            elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(tasks),
+        "concurrency": concurrency,
+        "requests_per_second": round(len(tasks) / elapsed, 2),
+        "latency": summarize(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "task_statuses": dict(sorted(task_statuses.items())),
+    }
+
+async def bench_overload(
+    chain: FakeChain,
+    tasks: list[tuple[str, str]],
+    max_tries: int,
+    slots: int,
+    queue_size: int,
+    max_wait: float,
+) -> dict:
+    """Sends every task at once to the API, with a bounded and an unbounded queue."""
+    report = {"requests": len(tasks), "slots": slots}
+    async with api.lifespan(api.app):
+        await api.app.state.llm_pool.aclose()
+        api.app.state.llm_pool = LLMPool(interface_factory=partial(FakeLLMInterface, chain))
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            runs = {"bounded": (queue_size, max_wait), "unbounded": (len(tasks), UNBOUNDED_WAIT_SECONDS)}
+            for name, (queue, wait) in runs.items():
+                admission = AdmissionController(slots, queue, wait)
+                api.app.state.admission = admission
+                report[name] = await _overload_run(client, admission, tasks, max_tries)
+                report[name]["queue_size"] = queue
+                report[name]["max_wait_seconds"] = None if name == "unbounded" else wait
+    return report
+
+async def _overload_run(
+    client: httpx.AsyncClient,
+    admission: AdmissionController,
+    tasks: list[tuple[str, str]],
+    max_tries: int,
+) -> dict:
+    accepted, rejected, retry_after = [], [], []
+    statuses, task_statuses = {}, {}
+    peak = {"running": 0, "waiting": 0}
+
+    async def one(description: str) -> None:
+        start = time.perf_counter()
+        response = await client.post(
+            "/generate-code", json={"task_description": description, "max_tries": max_tries}
+        )
+        elapsed = time.perf_counter() - start
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 429:
+            rejected.append(elapsed)
+            retry_after.append(int(response.headers["Retry-After"]))
+        elif response.status_code == 200:
+            accepted.append(elapsed)
+            status = response.json()["status"]
+            task_statuses[status] = task_statuses.get(status, 0) + 1
+
+    async def watch() -> None:
+        while True:
+            peak["running"] = max(peak["running"], admission.running)
+            peak["waiting"] = max(peak["waiting"], admission.waiting)
+            await asyncio.sleep(0.01)
+
+    watcher = asyncio.create_task(watch())
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(description) for description, _ in tasks))
+    finally:
+        watcher.cancel()
+    elapsed = time.perf_counter() - start
+    return {
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "task_statuses": dict(sorted(task_statuses.items())),
+        "accepted_latency": summarize(accepted),
+        "rejected_latency": summarize(rejected),
+        "retry_after_seconds": (
+            {"min": min(retry_after), "max": max(retry_after)} if retry_after else None
+        ),
+        "passed_per_second": round(task_statuses.get("passed", 0) / elapsed, 2),
+        "peak_running": peak["running"],
+        "peak_waiting": peak["waiting"],
+        "elapsed_s": round(elapsed, 2),
+    }
+
+async def run(args: argparse.Namespace) -> dict:
+    fixtures = load_fixtures()
+    profile = LatencyProfile(
+        ttft_ms=args.ttft_ms,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_second=args.tokens_per_second,
+        tokens_per_second_sd=args.tokens_per_second_sd,
+    )
+    chain = FakeChain(fixtures, profile, seed=args.seed)
+    tasks = make_tasks(chain, fixtures, args.tasks, args.mix, args.seed)
+
+    report = {"config": {
+        "tasks": args.tasks,
+        "concurrency": args.concurrency,
+        "max_tries": args.max_tries,
+        "mix": args.mix,
+        "seed": args.seed,
+        "latency_profile": vars(profile),
+        "llm_provider": LLM_PROVIDER,
+        "test_runner_mode": TEST_RUNNER_MODE,
+        "test_cache": args.test_cache,
+        "few_shot": args.few_shot,
+        "slo_seconds": args.slo,
+    }}
+    if "parse" in args.stages:
+        report["parse"] = bench_parse(fixtures, args.parse_repeats)
+    if "run_tests" in args.stages:
+        report["run_tests"] = {
+            mode: await bench_run_tests(fixtures, mode, args.tasks, args.concurrency)
+            for mode in args.modes
+        }
+    if "run_task" in args.stages:
+        pool = LLMPool(interface_factory=partial(FakeLLMInterface, chain))
+        try:
+            report["run_task"] = await bench_run_task(
+                pool, tasks, args.concurrency, args.max_tries, args.slo
+            )
+        finally:
+            await pool.aclose()
+    if "api" in args.stages:
+        report["api"] = await bench_api(
+            chain, tasks, args.concurrency, args.max_tries, args.slo
+        )
+    if "overload" in args.stages:
+        report["overload"] = await bench_overload(
+            chain, tasks, args.max_tries, args.overload_slots, args.overload_queue,
+            args.overload_wait,
+        )
+    report["llm_calls"] = chain.calls
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop with a fake LLM.")
+    parser.add_argument("--tasks", type=int, default=40, help="Tasks per stage (default: 40).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent tasks (default: 8).")
+    parser.add_argument("--max-tries", type=int, default=3, help="Attempts per task (default: 3).")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=parse_mix("good=0.6,failing=0.3,malformed=0.1"),
+        help="Outcome weights of the first response (default: good=0.6,failing=0.3,malformed=0.1).",
+    )
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Median time to first token.")
+    parser.add_argument("--ttft-sigma", type=float, default=0.3, help="Log-normal spread of the time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Mean generation speed.")
+    parser.add_argument("--tokens-per-second-sd", type=float, default=10.0, help="Standard deviation of the speed.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for outcomes and timings (default: 0).")
+    parser.add_argument("--parse-repeats", type=int, default=200, help="Parses per recorded response.")
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=list(STAGES),
+        help="Stages to run (default: all).",
+    )
+    parser.add_argument(
+        "--modes", nargs="+", default=["cold", "memory", "pool"],
+        help="Runner modes for the run_tests stage (default: cold memory pool).",
+    )
+    parser.add_argument(
+        "--test-cache", action="store_true",
+        help="Serve repeated test runs from the result cache (default: every run is measured).",
+    )
+    parser.add_argument(
+        "--slo", type=float,
+        help="Latency SLO in seconds of each run_task and api task (default: none).",
+    )
+    parser.add_argument(
+        "--few-shot", type=int, default=0, metavar="N",
+        help="Show up to N solved tasks as few-shot examples (default: 0, off).",
+    )
+    parser.add_argument(
+        "--overload-slots", type=int, default=4,
+        help="Task slots of the API in the overload stage (default: 4).",
+    )
+    parser.add_argument(
+        "--overload-queue", type=int, default=4,
+        help="Requests that may wait for a slot in the overload stage (default: 4).",
+    )
+    parser.add_argument(
+        "--overload-wait", type=float, default=10.0,
+        help="Seconds a request may wait for a slot in the overload stage (default: 10).",
+    )
+    args = parser.parse_args()
+    test_cache.set_enabled(args.test_cache)
+    example_index.set_enabled(args.few_shot > 0, path="", examples=args.few_shot)
+
+    uses_pool = "pool" in args.modes or TEST_RUNNER_MODE == "pool"
+    if uses_pool:
+        # Exclude worker startup from the measurements.
+        get_worker_pool().start()
+    try:
+        # The agent loop prints progress; keep stdout for the JSON report.
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args))
+    finally:
+        if uses_pool:
+            get_worker_pool().shutdown()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmarks few-shot example retrieval at growing index sizes.
+
+Fills an in-memory `ExampleIndex` with synthetic task descriptions, built
+from combinations of operations, data and constraints like real coding
+tasks, and at each requested size measures:
+
+- the insert rate of the batch that grew the index to that size,
+- the latency of `search` for reworded versions of stored tasks (a word
+  dropped and the remaining words shuffled),
+- recall: how often the stored task comes back among the top k.
+
+Prints the results as JSON.
+
+Usage:
+    python benchmarks/bench_example_index.py --sizes 1000 10000 100000 --queries 500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.example_index import ExampleIndex
+from latency_stats import summarize
+
+OPERATIONS = [
+    "sort", "reverse", "count", "sum", "filter", "merge", "flatten", "group", "deduplicate",
+    "rotate", "partition", "compress", "validate", "parse", "format", "search", "rank",
+    "normalize", "transpose", "encode", "decode", "split", "join", "find the maximum of",
+    "find the minimum of", "compute the median of", "compute the mode of", "shuffle",
+    "zip", "chunk", "interleave", "tokenize", "hash", "serialize", "cache", "paginate",
+    "diff", "match", "balance", "schedule",
+]
+DATA = [
+    "a list of integers", "a list of strings", "a nested list", "a dictionary of counts",
+    "a binary tree", "a linked list", "a matrix", "a string", "an email address",
+    "a date string", "a JSON document", "a CSV row", "a URL", "an IPv4 address",
+    "a roman numeral", "a sentence", "a list of intervals", "a graph adjacency list",
+    "a priority queue", "a stack", "a queue", "a set of words", "a list of tuples",
+    "a histogram", "a polynomial", "a fraction", "a bit string", "a hex color",
+    "a phone number", "a file path", "a list of timestamps", "a sparse vector",
+    "a grid of characters", "a sudoku board", "a chess position", "a deck of cards",
+    "a shopping cart", "a bank account ledger", "a temperature series", "a word frequency table",
+    "a list of employees", "a matrix of floats", "a directed graph", "a trie", "a heap",
+    "a circular buffer", "a list of points", "a bounding box", "a version string",
+    "a markdown table", "a SQL query", "a regular expression", "an HTML snippet",
+    "a log line", "a queue of jobs", "a calendar", "a recipe", "a DNA sequence",
+    "a list of prices", "a tweet",
+]
+CONSTRAINTS = [
+    "in place", "in linear time", "without using built-ins", "recursively", "iteratively",
+    "case-insensitively", "ignoring whitespace", "handling empty input", "with a custom key",
+    "in descending order", "stably", "lazily", "using a generator", "with memoization",
+    "returning a new copy", "raising ValueError on invalid input", "preserving order",
+    "with O(1) extra space", "using a hash map", "using two pointers", "with a sliding window",
+    "using binary search", "using dynamic programming", "using a heap", "using a stack",
+    "using bit manipulation", "for unicode input", "for very large inputs", "with type hints",
+    "as a class", "with a default value", "up to a given depth", "within a tolerance",
+    "modulo a prime", "in reverse", "by frequency", "by length", "by a given field",
+    "with duplicates allowed", "without duplicates",
+]
+
+def make_tasks(count: int, seed: int) -> list[str]:
+    """Returns `count` distinct synthetic task descriptions."""
+    rng = random.Random(seed)
+    tasks, seen = [], set()
+    while len(tasks) < count:
+        task = (
+            f"Write a function to {rng.choice(OPERATIONS)} {rng.choice(DATA)} "
+            f"{rng.choice(CONSTRAINTS)}"
+        )
+        if rng.random() < 0.5:
+            task += f" with at most {rng.randint(2, 1000)} elements"
+        if task not in seen:
+            seen.add(task)
+            tasks.append(task)
+    return tasks
+
+def reword(task: str, rng: random.Random) -> str:
+    """Drops one word of a task and shuffles the rest."""
+    words = task.split()
+    words.pop(rng.randrange(len(words)))
+    rng.shuffle(words)
+    return " ".join(words)
+
+def bench_size(
+    index: ExampleIndex, tasks: list[str], queries: int, k: int, rng: random.Random
+) -> dict:
+    samples, found = [], 0
+    for _ in range(queries):
+        target = rng.choice(tasks)
+        query = reword(target, rng)
+        start = time.perf_counter()
+        examples = index.search(query, k)
+        samples.append(time.perf_counter() - start)
+        found += any(example.task == target for example in examples)
+    return {
+        "search": summarize(samples),
+        f"recall_at_{k}": round(found / queries, 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark few-shot example retrieval.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+        help="Index sizes to measure at (default: 1000 10000 100000).",
+    )
+    parser.add_argument("--queries", type=int, default=500, help="Searches per size (default: 500).")
+    parser.add_argument("-k", type=int, default=2, help="Examples per search (default: 2).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for tasks and queries (default: 0).")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tasks = make_tasks(max(args.sizes), args.seed)
+    index = ExampleIndex("")
+    code, tests = "def f():\n    pass", "import unittest"
+    report = {"config": vars(args), "sizes": {}}
+    for size in sorted(args.sizes):
+        batch = tasks[len(index):size]
+        start = time.perf_counter()
+        index.add_many((task, code, tests) for task in batch)
+        elapsed = time.perf_counter() - start
+        report["sizes"][str(size)] = {
+            "inserts_per_second": round(len(batch) / elapsed) if elapsed else None,
+            **bench_size(index, tasks[:size], args.queries, args.k, rng),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Compares revision prompt sizes.
+
+Runs a few failing suites, then builds the revision prompt once from the full
+test output and once from the structured report. It also replays a task that
+takes several revisions and compares, per attempt, the single-turn prompt
+that resent the task, code, tests and output with the conversation built by
+`agent.code_generator`, whose prefix repeats the previous prompt. Prints the
+prompt sizes and estimated input tokens as JSON.
+
+Usage:
+    python benchmarks/bench_revision_prompt.py --budget 500
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import metrics
+from agent.code_generator import (
+    FUNCTION_END,
+    FUNCTION_START,
+    TESTS_END,
+    TESTS_START,
+    Attempt,
+    _build_revision_prompt,
+    failure_feedback,
+)
+from agent.llm_cache import CHARS_PER_TOKEN
+from agent.llm_interface import prompt_text
+from agent.test_report import summarize_failures
+from agent.test_runner import run_test_suite
+
+# The single-turn revision prompt that preceded the conversation format.
+SINGLE_TURN_REVISION_PROMPT = """
+You're a Senior Python engineer. A previous attempt to solve a task failed.
+
+Original Task: {task_description}
+
+Previous Code:
+{original_code}
+
+Previous Tests:
+{original_tests}
+
+Test Output / Errors:
+{test_output}
+
+Please analyze the failure. Revise both the function and the tests so that all tests pass. The issue might be in the code, the tests, or both.
+
+Use this exact format:
+{function_start}
+<code>
+{function_end}
+{tests_start}
+<test_code>
+{tests_end}
+"""
+
+TASK = "Write a function that flattens arbitrarily nested lists."
+
+CODE = """
+def flatten(items):
+    result = []
+    for item in items:
+        if isinstance(item, list):
+            result.extend(flatten(item[1:]))
+        else:
+            result.append(item)
+    return result
+"""
+
+ONE_FAILURE = """
+import unittest
+
+class FlattenTest(unittest.TestCase):
+    def test_flat(self):
+        self.assertEqual(flatten([1, 2, 3]), [1, 2, 3])
+
+    def test_nested(self):
+        self.assertEqual(flatten([1, [2, [3, 4]]]), [1, 2, 3, 4])
+"""
+
+MANY_FAILURES = "\n".join(
+    ["import unittest", "", "class FlattenTest(unittest.TestCase):"]
+    + [
+        f"    def test_case_{i}(self):\n"
+        f"        self.assertEqual(flatten([[{i}] * 20, [{i + 1}]]), [{i}] * 20 + [{i + 1}])\n"
+        for i in range(25)
+    ]
+)
+
+RECURSION_ERROR = """
+import unittest
+
+class FlattenTest(unittest.TestCase):
+    def test_deeply_nested(self):
+        nested = [1]
+        for _ in range(5000):
+            nested = [nested, 1]
+        self.assertEqual(len(flatten(nested)), 5001)
+"""
+
+# Successive revisions of CODE, each still failing a test of its suite.
+REVISIONS = [
+    CODE.replace("flatten(item[1:])", "flatten(item)"),
+    CODE.replace("flatten(item[1:])", "flatten(item)").replace(
+        "isinstance(item, list)", "isinstance(item, (list, tuple))"
+    ),
+]
+
+EXTRA_TEST = """
+    def test_tuples_{index}(self):
+        self.assertEqual(flatten([{index}, ({index}, {index})]), [{index}] * 4)
+"""
+
+def prompt_with(test_output: str, tests: str, code: str = CODE) -> str:
+    return SINGLE_TURN_REVISION_PROMPT.format(
+        task_description=TASK,
+        original_code=code,
+        original_tests=tests,
+        test_output=test_output,
+        function_start=FUNCTION_START,
+        function_end=FUNCTION_END,
+        tests_start=TESTS_START,
+        tests_end=TESTS_END,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare revision prompt sizes.")
+    parser.add_argument(
+        "--budget", type=int, default=500,
+        help="Token budget for the failure summary (default: 500).",
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for name, tests in (
+        ("one_failure", ONE_FAILURE),
+        ("many_failures", MANY_FAILURES),
+        ("recursion_error", RECURSION_ERROR),
+    ):
+        result = run_test_suite(CODE, tests)
+        raw = prompt_with(result.output, tests)
+        summarized = prompt_with(summarize_failures(result, args.budget), tests)
+        report[name] = {
+            "failing_tests": result.failed_count,
+            "raw_prompt_chars": len(raw),
+            "summary_prompt_chars": len(summarized),
+            "raw_prompt_tokens_estimate": len(raw) // CHARS_PER_TOKEN,
+            "summary_prompt_tokens_estimate": len(summarized) // CHARS_PER_TOKEN,
+            "reduction": round(1 - len(summarized) / len(raw), 3),
+        }
+
+    report["multi_attempt"] = compare_attempts()
+    print(json.dumps(report, indent=2))
+
+def compare_attempts() -> list[dict]:
+    """Compares both prompt formats over successive revisions of one task."""
+    rows, history = [], []
+    attempts = [(CODE, ONE_FAILURE)] + [
+        (code, ONE_FAILURE + "".join(EXTRA_TEST.format(index=i) for i in range(index + 1)))
+        for index, code in enumerate(REVISIONS)
+    ]
+    for number, (code, tests) in enumerate(attempts, start=2):
+        result = run_test_suite(code, tests)
+        single_turn = prompt_with(failure_feedback(result.output, result), tests, code)
+        with metrics.track_task() as timings:
+            messages = _build_revision_prompt(code, tests, result.output, TASK, result, history)
+        conversation_tokens = len(prompt_text(messages)) // CHARS_PER_TOKEN
+        prefix_tokens = timings.as_dict()["attempts"][0]["prefix_tokens"]
+        rows.append({
+            "attempt": number,
+            "single_turn_tokens_estimate": len(single_turn) // CHARS_PER_TOKEN,
+            "conversation_tokens_estimate": conversation_tokens,
+            "conversation_prefix_tokens_estimate": prefix_tokens,
+            "conversation_new_tokens_estimate": conversation_tokens - prefix_tokens,
+        })
+        history.append(Attempt(code, tests, failure_feedback(result.output, result)))
+    return rows
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmarks `LLMRouter` against a single backend, using fake backends.
+
+Every backend is a `FakeLLMInterface` (see `benchmarks/fake_llm.py`) with
+its own latency profile, failure rate and concurrency cap:
+
+- "primary": a fast local model with little capacity, the single backend
+  of the baseline.
+- "second-host": a second local host with a heavy latency tail.
+- "flaky-host": a fast host that fails a share of its calls.
+- "fallback": a hosted model in tier 1, slower but with plenty of capacity.
+
+The same streamed requests are sent to the baseline and to the router with
+and without hedging, and the end-to-end latency, errors and the share of
+calls each backend served are printed as JSON.
+
+Usage:
+    python benchmarks/bench_router.py --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.concurrency import ConcurrencyLimiter
+from agent.llm_router import Backend, LLMRouter
+from fake_llm import FakeChain, FakeLLMInterface, LatencyProfile, load_fixtures
+from latency_stats import summarize
+
+# name: (latency profile, error rate, max concurrency, tier)
+BACKENDS = {
+    "primary": (LatencyProfile(ttft_ms=150, ttft_sigma=0.2, tokens_per_second=300), 0.0, 4, 0),
+    "second-host": (LatencyProfile(ttft_ms=150, ttft_sigma=1.0, tokens_per_second=300), 0.0, 4, 0),
+    "flaky-host": (LatencyProfile(ttft_ms=120, ttft_sigma=0.2, tokens_per_second=300), 0.3, 4, 0),
+    "fallback": (LatencyProfile(ttft_ms=400, ttft_sigma=0.3, tokens_per_second=100), 0.0, 16, 1),
+}
+
+def build_router(names: list[str], fixtures: list[dict], seed: int, hedge_percentile: float) -> LLMRouter:
+    backends = []
+    for index, name in enumerate(names):
+        profile, error_rate, max_concurrency, tier = BACKENDS[name]
+        chain = FakeChain(fixtures, profile, seed=seed + index, error_rate=error_rate)
+        interface = FakeLLMInterface(chain, limiter=ConcurrencyLimiter(max_concurrency))
+        backends.append(Backend(name, interface, max_concurrency, tier))
+    return LLMRouter(backends, hedge_percentile=hedge_percentile)
+
+async def drive(router: LLMRouter, fixtures: list[dict], requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        fixture = fixtures[i % len(fixtures)]
+        prompt = f"Task: {fixture['task']} (request {i})"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with contextlib.aclosing(router.astream(prompt)) as stream:
+                    async for _ in stream:
+                        pass
+            except ConnectionError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    before = router.backend_stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    # Only count this run's calls, not the warm-up's.
+    served = {
+        name: {key: stats[key] - before[name][key] for key in ("calls", "errors", "hedges")}
+        for name, stats in router.backend_stats().items()
+    }
+    return {
+        "requests_per_second": round(requests / elapsed, 2),
+        "latency": summarize(latencies),
+        "errors": errors,
+        "backends": served,
+    }
+
+async def run(args: argparse.Namespace) -> dict:
+    fixtures = load_fixtures()
+    scenarios = {
+        "single_backend": (["primary"], 0),
+        "router": (list(BACKENDS), 0),
+        "router_hedged": (list(BACKENDS), args.hedge_percentile),
+    }
+    report = {"config": {"requests": args.requests, "concurrency": args.concurrency}}
+    for name, (backends, hedge_percentile) in scenarios.items():
+        router = build_router(backends, fixtures, args.seed, hedge_percentile)
+        # Warm the latency statistics so hedging has percentiles to work with.
+        await drive(router, fixtures, args.warmup, args.concurrency)
+        report[name] = await drive(router, fixtures, args.requests, args.concurrency)
+        await router.aclose()
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the LLM router with fake backends.")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests (default: 200).")
+    parser.add_argument("--warmup", type=int, default=40, help="Warm-up requests (default: 40).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests (default: 8).")
+    parser.add_argument("--hedge-percentile", type=float, default=95, help="Hedging percentile (default: 95).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the fake backends (default: 0).")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
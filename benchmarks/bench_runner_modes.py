@@ -0,0 +1,135 @@
+"""
+Benchmarks the test runner modes against each other.
+
+Runs the same passing and failing suites through the "cold" (temporary files),
+"memory" (sources over stdin) and "pool" (warm workers) runners, checks that
+every mode produces the same output, and prints latency statistics as JSON.
+The result cache is off while the modes are measured; the "cached" entry is
+the latency of a repeated run served by the cache instead.
+
+Usage:
+    python benchmarks/bench_runner_modes.py --runs 30 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import test_cache
+from agent.test_runner import async_run_tests, get_worker_pool, run_tests
+from latency_stats import summarize
+
+CODE = """
+class Calculator:
+    def multiply(self, a, b):
+        return a * b
+
+def add(a, b):
+    return a + b
+"""
+
+PASSING_TESTS = """
+import unittest
+
+class CalculatorTest(unittest.TestCase):
+    def test_add(self):
+        self.assertEqual(add(10, 5), 15)
+
+    def test_multiply(self):
+        self.assertEqual(Calculator().multiply(3, 3), 9)
+"""
+
+FAILING_TESTS = """
+import unittest
+
+class CalculatorTest(unittest.TestCase):
+    def test_multiply(self):
+        self.assertEqual(Calculator().multiply(3, 3), 10)
+"""
+
+def normalize(output: str) -> str:
+    """Removes run-specific file names and timings from test output."""
+    output = re.sub(r"[0-9a-f]{32}", "<id>", output)
+    return re.sub(r"Ran (\d+) tests? in [\d.]+s", r"Ran \1 tests", output)
+
+def bench_sequential(mode: str, runs: int) -> dict:
+    samples = []
+    for i in range(runs):
+        tests = PASSING_TESTS if i % 2 == 0 else FAILING_TESTS
+        start = time.perf_counter()
+        run_tests(CODE, tests, mode=mode)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_sequential_cached(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_tests(CODE, PASSING_TESTS)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, unit="us")
+
+async def bench_concurrent(mode: str, runs: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            tests = PASSING_TESTS if i % 2 == 0 else FAILING_TESTS
+            await async_run_tests(CODE, tests, mode=mode)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    elapsed = time.perf_counter() - start
+    return {"runs": runs, "concurrency": concurrency, "runs_per_second": round(runs / elapsed, 2)}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the test runner modes.")
+    parser.add_argument("--runs", type=int, default=30, help="Runs per mode (default: 30).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent runs (default: 4).")
+    parser.add_argument(
+        "--modes", nargs="+", default=["cold", "memory", "pool"],
+        help="Runner modes to compare (default: cold memory pool).",
+    )
+    args = parser.parse_args()
+    # Every run must reach the runner being measured.
+    test_cache.set_enabled(False)
+
+    if "pool" in args.modes:
+        # Exclude worker startup from the measurements.
+        get_worker_pool().start()
+        run_tests(CODE, PASSING_TESTS, mode="pool")
+
+    reference = {
+        name: normalize(run_tests(CODE, tests, mode="cold")[1])
+        for name, tests in (("passing", PASSING_TESTS), ("failing", FAILING_TESTS))
+    }
+
+    report = {}
+    for mode in args.modes:
+        identical = all(
+            normalize(run_tests(CODE, tests, mode=mode)[1]) == reference[name]
+            for name, tests in (("passing", PASSING_TESTS), ("failing", FAILING_TESTS))
+        )
+        report[mode] = {
+            "output_identical_to_cold": identical,
+            "sequential": bench_sequential(mode, args.runs),
+            "concurrent": asyncio.run(bench_concurrent(mode, args.runs, args.concurrency)),
+        }
+
+    test_cache.set_enabled(True)
+    run_tests(CODE, PASSING_TESTS)
+    report["cached"] = {"sequential": bench_sequential_cached(args.runs)}
+
+    if "pool" in args.modes:
+        report["pool"]["workers"] = get_worker_pool().stats()
+        get_worker_pool().shutdown()
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+A deterministic, local fake LLM backend for benchmarking the agent loop.
+
+`FakeChain` stands in for the LangChain chain of an `LLMInterface`. It
+replays recorded responses from `benchmarks/fixtures/responses.json` and
+simulates a model's timing: a log-normally distributed time to first token,
+then chunks at a normally distributed token rate. Timings are drawn from a
+random generator seeded with the prompt, so a run is reproducible regardless
+of how concurrent calls interleave.
+
+Each task is registered with an outcome:
+
+- "good": the first response passes its tests.
+- "failing": the first response parses but its tests fail.
+- "malformed": the first response is missing the expected markers.
+
+Revision prompts (conversations with an answer after the task) always
+get the good response, so failing and malformed tasks pass on their second
+attempt. Few-shot examples before the task don't change the response.
+
+A chain can also fail a share of its calls with `ConnectionError`, to stand
+in for an unreliable backend behind `LLMRouter`.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.concurrency import ConcurrencyLimiter
+from agent.llm_cache import CHARS_PER_TOKEN
+from agent.llm_interface import LLMInterface, prompt_text
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "responses.json")
+OUTCOMES = ("good", "failing", "malformed")
+
+# The task message of the conversation (see `agent/prompts.py`).
+_TASK_LINE = re.compile(r"^Task: (.*)$")
+
+def load_fixtures(path: str = FIXTURES_PATH) -> list[dict]:
+    """Loads the recorded responses, one entry per task and outcome."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+@dataclass
+class LatencyProfile:
+    """The simulated timing of a model."""
+
+    # Median time to first token and the spread of its log-normal distribution.
+    ttft_ms: float = 300.0
+    ttft_sigma: float = 0.3
+    # Mean and standard deviation of the generation speed.
+    tokens_per_second: float = 60.0
+    tokens_per_second_sd: float = 10.0
+    # Tokens per streamed chunk.
+    chunk_tokens: int = 4
+
+    def draw(self, rng: random.Random) -> tuple[float, float]:
+        """Returns a call's time to first token and seconds per token."""
+        ttft = rng.lognormvariate(0, self.ttft_sigma) * self.ttft_ms / 1000
+        rate = max(1.0, rng.gauss(self.tokens_per_second, self.tokens_per_second_sd))
+        return ttft, 1 / rate
+
+class FakeChain:
+    """Replays recorded responses with simulated latency."""
+
+    def __init__(
+        self,
+        fixtures: list[dict],
+        profile: Optional[LatencyProfile] = None,
+        seed: int = 0,
+        error_rate: float = 0.0,
+    ):
+        self.fixtures = fixtures
+        self.profile = profile or LatencyProfile()
+        self.seed = seed
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._tasks: dict[str, tuple[dict, str]] = {}
+
+    def add_task(self, task_description: str, fixture: dict, outcome: str) -> None:
+        """Registers the responses and outcome of a task."""
+        if outcome not in OUTCOMES:
+            raise ValueError(f"Unknown outcome: {outcome}")
+        self._tasks[task_description] = (fixture, outcome)
+
+    def response_for(self, messages: list[tuple[str, str]]) -> str:
+        """Returns the recorded response for a conversation."""
+        # The task is the last task message; examples come before it.
+        task, task_index = "", 0
+        for index, (role, content) in enumerate(messages):
+            match = _TASK_LINE.match(content) if role == "human" else None
+            if match:
+                task, task_index = match.group(1).strip(), index
+        is_revision = any(role == "ai" for role, _ in messages[task_index:])
+        fixture, outcome = self._tasks.get(task, (None, "good"))
+        if fixture is None:
+            # Unregistered tasks still get a stable, passing response.
+            fixture = self.fixtures[sum(task.encode()) % len(self.fixtures)]
+        return fixture["good" if is_revision else outcome]
+
+    def _plan(self, messages: list[tuple[str, str]]) -> tuple[list[str], float, float, bool]:
+        """Returns a call's chunks, first-token delay, chunk delay and failure."""
+        self.calls += 1
+        response = self.response_for(messages)
+        rng = random.Random(f"{self.seed}:{prompt_text(messages)}")
+        ttft, token_time = self.profile.draw(rng)
+        fails = rng.random() < self.error_rate
+        size = self.profile.chunk_tokens * CHARS_PER_TOKEN
+        chunks = [response[i:i + size] for i in range(0, len(response), size)]
+        return chunks, ttft, token_time * self.profile.chunk_tokens, fails
+
+    def _fail(self) -> None:
+        self.errors += 1
+        raise ConnectionError("Simulated backend failure")
+
+    def invoke(self, inputs: dict) -> str:
+        chunks, ttft, chunk_time, fails = self._plan(inputs["messages"])
+        time.sleep(ttft + chunk_time * max(len(chunks) - 1, 0))
+        if fails:
+            self._fail()
+        return "".join(chunks)
+
+    async def ainvoke(self, inputs: dict) -> str:
+        chunks, ttft, chunk_time, fails = self._plan(inputs["messages"])
+        await asyncio.sleep(ttft + chunk_time * max(len(chunks) - 1, 0))
+        if fails:
+            self._fail()
+        return "".join(chunks)
+
+    def stream(self, inputs: dict) -> Iterator[str]:
+        chunks, ttft, chunk_time, fails = self._plan(inputs["messages"])
+        time.sleep(ttft)
+        if fails:
+            self._fail()
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(chunk_time)
+            yield chunk
+
+    async def astream(self, inputs: dict) -> AsyncIterator[str]:
+        chunks, ttft, chunk_time, fails = self._plan(inputs["messages"])
+        await asyncio.sleep(ttft)
+        if fails:
+            self._fail()
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(chunk_time)
+            yield chunk
+
+class FakeLLMInterface(LLMInterface):
+    """An `LLMInterface` whose model is a `FakeChain`.
+
+    Everything around the chain (concurrency limits, call accounting,
+    streaming) is the real implementation. The response cache is disabled so
+    every call pays the simulated latency.
+    """
+
+    def __init__(
+        self,
+        chain: FakeChain,
+        provider: Optional[str] = None,
+        model_name: Optional[str] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
+        base_url: Optional[str] = None,
+    ):
+        # Ollama's client is built without connecting, so it is a cheap base.
+        super().__init__(
+            provider="ollama", model_name=model_name, limiter=limiter,
+            use_cache=False, base_url=base_url,
+        )
+        self.provider = provider or self.provider
+        self.chain = chain
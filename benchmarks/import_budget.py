@@ -0,0 +1,93 @@
+"""
+Checks that the CLI and API entry points stay fast to import.
+
+Each module is imported in a fresh interpreter with `-X importtime`. The
+check fails if its cumulative import time (the median of several runs)
+exceeds the budget, or if it loads a module that must only be imported
+lazily, such as a provider SDK. Prints the measurements as JSON and exits
+with status 1 on any violation, so it can run as a CI step.
+
+Usage:
+    python benchmarks/import_budget.py --runs 5 --budget cli=300 --budget main=1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets, in milliseconds.
+DEFAULT_BUDGETS_MS = {"cli": 300.0, "main": 1000.0}
+
+# Modules only the LLM interface may load, when it is first built.
+LAZY_MODULES = ("langchain_core", "langchain_openai", "langchain_ollama", "openai", "ollama")
+
+def measure(module: str) -> tuple[float, set[str]]:
+    """Imports a module in a new interpreter.
+
+    Returns:
+        The module's cumulative import time in milliseconds and the names
+        of every module imported along with it.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    total_us, imported = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header line.
+        imported.add(name.strip())
+        if name.strip() == module:
+            total_us = int(cumulative)
+    if total_us is None:
+        raise RuntimeError(f"No import time reported for {module}")
+    return total_us / 1000, imported
+
+def parse_budget(value: str) -> tuple[str, float]:
+    module, _, budget = value.partition("=")
+    return module, float(budget)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the import time budget of the entry points.")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module (default: 5).")
+    parser.add_argument(
+        "--budget", type=parse_budget, action="append", default=[],
+        help="A module's budget in milliseconds, e.g. cli=300 (default: cli=300, main=1000).",
+    )
+    args = parser.parse_args()
+    budgets = {**DEFAULT_BUDGETS_MS, **dict(args.budget)}
+
+    report, failed = {}, False
+    for module, budget in budgets.items():
+        samples, imported = [], set()
+        for _ in range(args.runs):
+            elapsed, imported = measure(module)
+            samples.append(elapsed)
+        median = statistics.median(samples)
+        eager = sorted(
+            lazy for lazy in LAZY_MODULES
+            if any(name == lazy or name.startswith(lazy + ".") for name in imported)
+        )
+        ok = median <= budget and not eager
+        failed = failed or not ok
+        report[module] = {
+            "median_ms": round(median, 1),
+            "min_ms": round(min(samples), 1),
+            "budget_ms": budget,
+            "eager_lazy_modules": eager,
+            "modules_imported": len(imported),
+            "ok": ok,
+        }
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
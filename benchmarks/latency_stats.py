@@ -0,0 +1,22 @@
+"""
+Latency statistics shared by the benchmark scripts.
+"""
+import statistics
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples: list[float], unit: str = "ms") -> dict:
+    """Summarizes durations in seconds, reported in "ms" or "us"."""
+    if not samples:
+        return {"runs": 0}
+    scale = {"ms": 1000, "us": 1_000_000}[unit]
+    stats = {"mean": statistics.mean(samples)}
+    stats.update({f"p{p}": percentile(samples, p / 100) for p in (50, 95, 99)})
+    stats["max"] = max(samples)
+    return {
+        "runs": len(samples),
+        **{f"{name}_{unit}": round(value * scale, 2) for name, value in stats.items()},
+    }
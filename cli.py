@@ -1,28 +1,126 @@
 import argparse
+import asyncio
+import json
 import sys
-from typing import Optional
+import time
+from contextlib import redirect_stdout
+from typing import Awaitable, Callable, Optional
+from agent import metrics
+from agent.batch import BatchTask, load_tasks, run_batch
+from agent.concurrency import ConcurrencyLimiter
+from agent.deadline import TaskBudget
+from agent.example_index import find_examples, record_solution
+from agent.generation_guard import GenerationStopped
 from agent.llm_interface import LLMInterface
-from agent.code_generator import generate_code_and_tests, revise_code_and_tests
-from agent.test_runner import run_tests
+from agent.code_generator import (
+    Attempt,
+    async_generate_code_and_tests,
+    async_revise_code_and_tests,
+    failure_feedback,
+)
+from agent import test_runner
+from agent.test_report import TestReport
+from agent.test_runner import async_run_test_suite
+from config import (
+    LLM_PROVIDER,
+    LLM_CONCURRENCY_LIMITS,
+    TEST_MAX_CONCURRENCY,
+    CANDIDATES_PER_ATTEMPT,
+)
 
 DEFAULT_MAX_TRIES = 3
 
+# Receives progress events (dictionaries with an "event" key) from the loop.
+EventCallback = Callable[[dict], Awaitable[None]]
+
 def run_task(
     task_description: str,
     agent: Optional[LLMInterface] = None,
     max_tries: int = DEFAULT_MAX_TRIES,
-    verbose: bool = False
+    verbose: bool = False,
+    candidates: Optional[int] = None,
+    deadline: Optional[float] = None,
 ) -> tuple[str, bool, str, str]:
     """Orchestrates the main AI agent loop for code generation and testing.
 
     This function manages the iterative process of generating code, running
-    tests, and attempting revisions based on test failures.
+    tests, and attempting revisions based on test failures. It is a blocking
+    wrapper around `async_run_task` and must not be called from a running
+    event loop.
+
+    Args:
+        task_description: The user's request for code generation.
+        agent: An initialized LLMInterface object. If None, a new one is created.
+        max_tries: The maximum number of attempts to generate and fix the code.
+        verbose: If True, prints detailed step-by-step progress.
+        candidates: The number of candidates generated and tested in parallel
+            on each attempt. Defaults to `CANDIDATES_PER_ATTEMPT`.
+        deadline: An optional `time.monotonic()` time by which the task must
+            be over (see `async_run_task`).
+
+    Returns:
+        A tuple containing the final generated code, a boolean indicating if
+        tests passed, the final test suite, and the final test output.
+    """
+    return asyncio.run(async_run_task(
+        task_description, agent=agent, max_tries=max_tries, verbose=verbose,
+        candidates=candidates, deadline=deadline
+    ))
+
+async def async_run_task(
+    task_description: str,
+    agent: Optional[LLMInterface] = None,
+    max_tries: int = DEFAULT_MAX_TRIES,
+    verbose: bool = False,
+    on_event: Optional[EventCallback] = None,
+    candidates: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> tuple[str, bool, str, str]:
+    """Asynchronous version of `run_task`.
+
+    LLM calls and test runs are awaited rather than blocking, so many tasks
+    can run concurrently on a single event loop.
+
+    With several candidates, each attempt generates and tests them
+    concurrently. The first candidate to pass wins and the others are
+    cancelled; if none passes, the next revision starts from the candidate
+    with the fewest failing tests.
+
+    With a deadline, LLM calls are stopped in time to leave room for their
+    test run, test runs are cut short at the deadline, and a revision is
+    skipped when the time left is shorter than the longest attempt so far
+    (see `agent.deadline`). The task then returns the attempt with the
+    fewest failing tests instead of the last one.
+
+    Solved tasks similar to this one are shown to the model before it, and
+    a task whose tests pass is added to them (see `agent.example_index`).
+
+    Stage timings and token counts are recorded with `agent.metrics`; wrap
+    the call in `metrics.track_task()` to get the task's own breakdown.
 
     Args:
         task_description: The user's request for code generation.
         agent: An initialized LLMInterface object. If None, a new one is created.
         max_tries: The maximum number of attempts to generate and fix the code.
         verbose: If True, prints detailed step-by-step progress.
+        on_event: If given, receives progress events as they happen:
+            "examples" with the similarity of each solved task shown before
+            this one (only when there are any), "attempt" and "revision"
+            when an attempt or revision starts, "token" for each streamed
+            LLM chunk, "function" as soon as the function code is complete,
+            "generated" with the parsed code and tests, "test_result" after
+            each test run (with its wall time, CPU time and peak memory when
+            measured, and whether it came from the result cache), "error"
+            when an attempt fails (including an LLM call stopped by a
+            generation guard, see `agent.generation_guard`), and
+            "deadline_exceeded" when the task gives up because of its
+            deadline. With several candidates, "generated" and
+            "test_result" events carry a "candidate" index, and "token" and
+            "function" events are only sent for candidate 0.
+        candidates: The number of candidates generated and tested in parallel
+            on each attempt. Defaults to `CANDIDATES_PER_ATTEMPT`.
+        deadline: An optional `time.monotonic()` time by which the task must
+            be over.
 
     Returns:
         A tuple containing the final generated code, a boolean indicating if
@@ -30,57 +128,223 @@ def run_task(
     """
     if agent is None:
         agent = LLMInterface()
+    candidates = candidates or CANDIDATES_PER_ATTEMPT
+    budget = TaskBudget(deadline)
+
+    async def emit(event: dict) -> None:
+        if on_event is not None:
+            await on_event(event)
 
     code, tests, test_output = "", "", ""
+    # Structured results of the last failed run, used to keep revisions short.
+    report: Optional[TestReport] = None
+    # Failed attempts before the last one, replayed in revision prompts.
+    history: list[Attempt] = []
+    # The completed attempt with the fewest failing tests.
+    best: Optional[tuple[str, str, TestReport]] = None
+    deadline_exceeded = False
+    started = time.perf_counter()
+    attempt = 0
+
+    with metrics.span("retrieval"):
+        examples = find_examples(task_description)
+    if examples:
+        await emit({
+            "event": "examples",
+            "similarities": [example.similarity for example in examples],
+        })
 
     for attempt in range(1, max_tries + 1):
+        if budget.expired() or (attempt > 1 and not budget.can_fit_attempt()):
+            # This attempt never starts.
+            attempt -= 1
+            deadline_exceeded = True
+            break
         if verbose:
             print(f"\n🔁 Attempt {attempt}/{max_tries}...")
+        attempt_started = time.perf_counter()
+        limits = budget.generation_limits()
+        metrics.start_attempt(attempt)
+        await emit({"event": "attempt", "attempt": attempt, "max_tries": max_tries})
+
+        async def run_candidate(
+            sample: int, attempt: int = attempt
+        ) -> tuple[str, str, TestReport]:
+            """Generates (or revises) one candidate and runs its tests."""
+            tag = {"attempt": attempt}
+            if candidates > 1:
+                tag["candidate"] = sample
+
+            on_token = on_function = None
+            if on_event is not None and sample == 0:
+                async def on_token(chunk: str) -> None:
+                    await emit({"event": "token", **tag, "text": chunk})
+
+                async def on_function(function_code: str) -> None:
+                    await emit({"event": "function", **tag, "code": function_code})
 
-        try:
             if attempt == 1:
                 # First attempt: generate code and tests from the initial task.
-                code, tests = generate_code_and_tests(task_description, agent, verbose=verbose)
+                new_code, new_tests = await async_generate_code_and_tests(
+                    task_description, agent, verbose=verbose,
+                    on_token=on_token, on_function=on_function, sample=sample,
+                    limits=limits, examples=examples
+                )
             else:
                 # Subsequent attempts: revise both based on the last failure.
-                if verbose:
-                    print("Tests failed. Attempting revision of code and tests...")
-                code, tests = revise_code_and_tests(
+                new_code, new_tests = await async_revise_code_and_tests(
                     original_code=code,
                     original_tests=tests,
                     test_output=test_output,
                     task_description=task_description,
                     llm=agent,
-                    verbose=verbose
+                    verbose=verbose,
+                    on_token=on_token,
+                    on_function=on_function,
+                    sample=sample,
+                    test_report=report,
+                    history=history,
+                    limits=limits,
+                    examples=examples
                 )
-            
+            await emit({"event": "generated", **tag, "code": new_code, "tests": new_tests})
+
             if verbose:
                 print("⚙️ Running tests...")
-            passed, test_output = run_tests(code, tests)
+            # Re-run the previous failures and changed tests first.
+            new_report = await async_run_test_suite(
+                new_code, new_tests, previous=report, timeout=budget.test_timeout()
+            )
+            await emit({
+                "event": "test_result", **tag,
+                "passed": new_report.passed, "output": new_report.output,
+                "wall_time": new_report.wall_time, "cpu_time": new_report.cpu_time,
+                "peak_rss_mb": new_report.peak_rss_mb, "cached": new_report.cached,
+            })
+            return new_code, new_tests, new_report
 
-            if passed:
+        try:
+            if attempt > 1:
+                if verbose:
+                    print("Tests failed. Attempting revision of code and tests...")
+                await emit({"event": "revision", "attempt": attempt})
+
+            if candidates == 1:
+                result = await run_candidate(0)
+            else:
+                result = await _best_candidate(run_candidate, candidates)
+            if attempt > 1:
+                # The revised attempt becomes part of the next prompt's history.
+                history.append(Attempt(code, tests, failure_feedback(test_output, report)))
+            code, tests, report = result
+            test_output = report.output
+            if best is None or _failed_tests(report) <= _failed_tests(best[2]):
+                best = result
+
+            if report.passed:
                 # If tests pass, the loop is successful.
+                record_solution(task_description, code, tests)
+                metrics.observe("task", time.perf_counter() - started)
+                metrics.record_task(True, attempt)
                 return code, True, tests, test_output
         
+        except GenerationStopped as e:
+            print(f"LLM generation stopped: {e}")
+            test_output = f"Error during attempt {attempt}: {e}"
+            report = None
+            await emit({"event": "error", "attempt": attempt, "message": test_output})
+            if e.reason == "deadline":
+                deadline_exceeded = True
+                break
+            continue
         except ValueError as e:
             # Handle cases where the LLM response is not in the expected format.
             print(f"Error processing LLM response: {e}")
             test_output = f"Error during attempt {attempt}: {e}"
+            report = None
+            await emit({"event": "error", "attempt": attempt, "message": test_output})
             continue
         except Exception as e:
             print(f"An unexpected error occurred during attempt {attempt}: {e}")
             test_output = f"Unexpected error during attempt {attempt}: {e}"
+            report = None
+            await emit({"event": "error", "attempt": attempt, "message": test_output})
             break
+        finally:
+            budget.record_attempt(time.perf_counter() - attempt_started, report)
+
+    if deadline_exceeded:
+        if verbose:
+            print("⏱️ Deadline reached, returning the best attempt so far.")
+        await emit({"event": "deadline_exceeded", "attempts": attempt})
+        if best is not None:
+            code, tests, report = best
+            test_output = report.output
 
     # If the loop completes without success.
+    metrics.observe("task", time.perf_counter() - started)
+    metrics.record_task(False, attempt, deadline_exceeded)
     return code, False, tests, test_output
 
-def print_result(code: str, passed: bool, tests: str, output: str) -> None:
+async def _best_candidate(
+    run_candidate: Callable[[int], Awaitable[tuple[str, str, TestReport]]],
+    candidates: int
+) -> tuple[str, str, TestReport]:
+    """Runs candidates concurrently and returns the first one that passes.
+
+    Once a candidate passes, the others are cancelled. If none passes, the
+    one with the fewest failing tests is returned, preferring lower indexes
+    on ties and runs with a unittest summary over crashed ones.
+
+    Raises:
+        Exception: The first candidate's error, if every candidate failed
+            before its tests could run.
+    """
+    tasks = {asyncio.create_task(run_candidate(i)): i for i in range(candidates)}
+    results: dict[int, tuple[str, str, TestReport]] = {}
+    errors: dict[int, BaseException] = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = tasks[task]
+                if task.exception() is not None:
+                    errors[index] = task.exception()
+                    continue
+                result = task.result()
+                if result[2].passed:
+                    return result
+                results[index] = result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if not results:
+        raise errors[min(errors)]
+
+    def score(index: int) -> tuple[float, int]:
+        return (_failed_tests(results[index][2]), index)
+
+    return results[min(results, key=score)]
+
+def _failed_tests(report: TestReport) -> float:
+    """Ranks failed runs: fewer failing tests first, crashed runs last."""
+    failed = report.failed_count
+    return failed if failed is not None else float("inf")
+
+def print_result(
+    code: str, passed: bool, tests: str, output: str, deadline_exceeded: bool = False
+) -> None:
     """Formats and prints the final results of the agent's run."""
     print("\n" + "="*20 + " FINAL RESULT " + "="*20)
     if passed:
         print("✅ All tests passed!\n")
         print("🧠 Final Code:")
+    elif deadline_exceeded:
+        print("⏱️ Deadline reached. Human review required.")
+        print("🧠 Best Attempt:")
     else:
         print("🚨 Max attempts reached. Human review required.")
         print("🧠 Last Generated Code:")
@@ -96,6 +360,68 @@ def print_result(code: str, passed: bool, tests: str, output: str) -> None:
         print("[No output was captured from the test run]")
     print("="*54)
 
+async def async_run_batch_file(
+    tasks_path: str,
+    output_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    max_tries: int = DEFAULT_MAX_TRIES,
+    llm_concurrency: Optional[int] = None,
+    test_concurrency: Optional[int] = None,
+    candidates: Optional[int] = None,
+) -> tuple[int, int]:
+    """Runs every task of a JSONL file and writes one JSONL record per task.
+
+    LLM calls and test runs are capped separately, and enough tasks are kept
+    in flight to saturate both, so the batch takes roughly as long as the
+    slower of the two stages rather than the sum of every task's latency.
+
+    Args:
+        tasks_path: The JSONL file of tasks (see `agent.batch.load_tasks`).
+        output_path: Where records are appended. Defaults to stdout.
+        checkpoint_path: If given, finished tasks are recorded here and
+            skipped when the batch is run again.
+        max_tries: The default number of attempts for each task.
+        llm_concurrency: Maximum concurrent LLM calls. Defaults to the
+            provider's configured limit.
+        test_concurrency: Maximum concurrent test runs. Defaults to
+            `TEST_MAX_CONCURRENCY`.
+        candidates: The number of candidates tested in parallel on each
+            attempt. Defaults to `CANDIDATES_PER_ATTEMPT`.
+
+    Returns:
+        The number of tasks run and the number that passed.
+    """
+    tasks = load_tasks(tasks_path)
+    llm_concurrency = llm_concurrency or LLM_CONCURRENCY_LIMITS.get(LLM_PROVIDER, 4)
+    test_concurrency = test_concurrency or TEST_MAX_CONCURRENCY
+    agent = LLMInterface(limiter=ConcurrencyLimiter(llm_concurrency))
+    test_runner.set_max_concurrency(test_concurrency)
+
+    async def run_one(task: BatchTask) -> dict:
+        code, passed, tests, output = await async_run_task(
+            task.task_description, agent=agent, max_tries=task.max_tries or max_tries,
+            candidates=candidates
+        )
+        return {"passed": passed, "code": code, "tests": tests, "output": output}
+
+    total = passed = 0
+    output = open(output_path, "a", encoding="utf-8") if output_path else sys.stdout
+    try:
+        # Progress messages go to stderr so stdout only carries records.
+        with redirect_stdout(sys.stderr):
+            async for record in run_batch(
+                tasks, run_one, llm_concurrency + test_concurrency, checkpoint_path
+            ):
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                total += 1
+                passed += bool(record["passed"])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await agent.aclose()
+    return total, passed
+
 def main():
     """Parses command-line arguments and starts the AI agent task."""
     parser = argparse.ArgumentParser(
@@ -118,18 +444,78 @@ def main():
         action="store_true",
         help="Enable verbose output to see step-by-step progress."
     )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        help=("Candidates generated and tested in parallel on each attempt "
+              f"(default: {CANDIDATES_PER_ATTEMPT}).")
+    )
+    parser.add_argument(
+        "--slo",
+        type=float,
+        metavar="SECONDS",
+        help="Give up and return the best attempt so far after this many seconds."
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="TASKS_JSONL",
+        help="Run every task in a JSONL file and print one JSON result per line."
+    )
+    parser.add_argument(
+        "--output",
+        help="Append batch results to this file instead of stdout."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Record finished batch tasks here and skip them when resuming."
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        help="Maximum concurrent LLM calls in batch mode."
+    )
+    parser.add_argument(
+        "--test-concurrency",
+        type=int,
+        help="Maximum concurrent test runs in batch mode."
+    )
     args = parser.parse_args()
 
+    if args.batch:
+        try:
+            total, passed = asyncio.run(async_run_batch_file(
+                args.batch,
+                output_path=args.output,
+                checkpoint_path=args.checkpoint,
+                max_tries=args.max_tries,
+                llm_concurrency=args.llm_concurrency,
+                test_concurrency=args.test_concurrency,
+                candidates=args.candidates
+            ))
+        except Exception as e:
+            print(f"\n🚨 A critical error occurred: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ {passed}/{total} tasks passed.", file=sys.stderr)
+        return
+
     if args.task:
         task_description = args.task
     else:
         task_description = input("💬 Enter your code generation task:\n> ")
 
     try:
-        code, passed, tests, output = run_task(
-            task_description, max_tries=args.max_tries, verbose=args.verbose
-        )
-        print_result(code, passed, tests, output)
+        deadline = time.monotonic() + args.slo if args.slo else None
+        outcome = {"deadline_exceeded": False}
+
+        async def on_event(event: dict) -> None:
+            if event["event"] == "deadline_exceeded":
+                outcome["deadline_exceeded"] = True
+
+        code, passed, tests, output = asyncio.run(async_run_task(
+            task_description, max_tries=args.max_tries, verbose=args.verbose,
+            on_event=on_event, candidates=args.candidates, deadline=deadline
+        ))
+        print_result(code, passed, tests, output, outcome["deadline_exceeded"])
     except Exception as e:
         print(f"\n🚨 A critical error occurred: {e}")
         sys.exit(1)
@@ -1,12 +1,196 @@
 import os
-from dotenv import load_dotenv
+from typing import Optional
 
-load_dotenv(override=True)
+from dotenv import dotenv_values
 
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
-MODEL = os.getenv("MODEL", "gpt-4")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Values from a .env file take precedence over the environment, as with
+# `load_dotenv(override=True)`, but importing this module doesn't copy them
+# into os.environ. Only the settings that the provider SDKs and LangChain
+# read from the environment themselves are exported, by
+# `export_provider_env` when the first LLM interface is built.
+_DOTENV = dotenv_values()
 
-print(LLM_PROVIDER)
-print(MODEL)
\ No newline at end of file
+# Prefixes of the settings read by the provider SDKs and LangChain.
+PROVIDER_ENV_PREFIXES = ("OPENAI_", "LANGCHAIN_", "LANGSMITH_")
+
+def _getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Returns a setting from the .env file or the environment."""
+    value = _DOTENV.get(name)
+    return value if value is not None else os.getenv(name, default)
+
+def export_provider_env() -> None:
+    """Copies the .env settings read by the provider SDKs into os.environ.
+
+    This covers settings such as OPENAI_BASE_URL, OPENAI_ORG_ID and the
+    LANGCHAIN_*/LANGSMITH_* tracing settings, which the libraries look up
+    in the environment. OPENAI_API_KEY is passed to the client explicitly
+    and stays out of the environment.
+    """
+    for name, value in _DOTENV.items():
+        if name.startswith(PROVIDER_ENV_PREFIXES) and name != "OPENAI_API_KEY" and value is not None:
+            os.environ[name] = value
+
+LLM_PROVIDER = _getenv("LLM_PROVIDER", "openai")
+MODEL = _getenv("MODEL", "gpt-4")
+OPENAI_API_KEY = _getenv("OPENAI_API_KEY")
+OLLAMA_HOST = _getenv("OLLAMA_HOST", "http://localhost:11434")
+# How long Ollama keeps the model loaded after a call (e.g. "30m"), so
+# revisions can reuse the KV cache of the conversation so far. Empty uses
+# the server's default.
+OLLAMA_KEEP_ALIVE = _getenv("OLLAMA_KEEP_ALIVE", "30m")
+LLM_TEMPERATURE = float(_getenv("LLM_TEMPERATURE", "0.7"))
+
+# === Generation Guards ===
+# Streamed generations are cancelled when they cross one of these limits
+# (0 disables a limit). The token budget is also sent to the provider.
+LLM_MAX_OUTPUT_TOKENS = int(_getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))
+# Seconds to wait for the first chunk, and between later chunks.
+LLM_FIRST_TOKEN_TIMEOUT = float(_getenv("LLM_FIRST_TOKEN_TIMEOUT", "120"))
+LLM_STALL_TIMEOUT = float(_getenv("LLM_STALL_TIMEOUT", "30"))
+# Stop when the last LLM_REPETITION_BLOCK_CHARS characters of the response
+# already occur LLM_REPETITION_MAX_REPEATS times in its recent output.
+LLM_REPETITION_BLOCK_CHARS = int(_getenv("LLM_REPETITION_BLOCK_CHARS", "200"))
+LLM_REPETITION_MAX_REPEATS = int(_getenv("LLM_REPETITION_MAX_REPEATS", "4"))
+
+# === LLM Client Pool ===
+# Maximum number of concurrent LLM calls allowed per provider.
+LLM_CONCURRENCY_LIMITS = {
+    "openai": int(_getenv("OPENAI_MAX_CONCURRENCY", "16")),
+    "ollama": int(_getenv("OLLAMA_MAX_CONCURRENCY", "2")),
+}
+# Number of idle keep-alive HTTP connections kept open per client, and how
+# long (in seconds) an idle connection is kept before being closed.
+LLM_KEEPALIVE_CONNECTIONS = int(_getenv("LLM_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY = float(_getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# === LLM Router ===
+# With LLM_PROVIDER=router, calls are spread over several backends, given as
+# a JSON list of objects with "provider" and "model", and optionally
+# "base_url", "max_concurrency" (defaults to the provider's limit above),
+# "tier" (lower tiers are preferred, higher ones are fallbacks) and "name".
+LLM_BACKENDS = _getenv("LLM_BACKENDS", "")
+# Weight of the newest observation in the latency and error-rate averages.
+ROUTER_EWMA_ALPHA = float(_getenv("ROUTER_EWMA_ALPHA", "0.2"))
+# A backend whose error rate reaches this is skipped until its cooldown ends.
+ROUTER_ERROR_THRESHOLD = float(_getenv("ROUTER_ERROR_THRESHOLD", "0.5"))
+ROUTER_COOLDOWN_SECONDS = float(_getenv("ROUTER_COOLDOWN_SECONDS", "30"))
+# Send a duplicate request to another backend when the first one takes longer
+# than this percentile of its recent latencies (0 disables hedging).
+ROUTER_HEDGE_PERCENTILE = float(_getenv("ROUTER_HEDGE_PERCENTILE", "95"))
+# Latency samples a backend needs before its requests are hedged.
+ROUTER_HEDGE_MIN_SAMPLES = int(_getenv("ROUTER_HEDGE_MIN_SAMPLES", "20"))
+
+# === LLM Response Cache ===
+# "auto" caches only deterministic (temperature 0) generations, "on" always
+# caches and "off" disables the cache.
+LLM_CACHE = _getenv("LLM_CACHE", "auto").lower()
+LLM_CACHE_MAX_BYTES = int(_getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# SQLite file for the persistent tier. Set to an empty string to keep the
+# cache in memory only. Past LLM_CACHE_DISK_MAX_BYTES of responses, the least
+# recently used ones are deleted (0: unbounded).
+LLM_CACHE_PATH = _getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+LLM_CACHE_DISK_MAX_BYTES = int(_getenv("LLM_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# === Serving ===
+# API worker processes started by `python main.py`. With more than one, the
+# task, LLM and sandbox limits apply to the whole node: workers share their
+# slots through lock files in NODE_SLOT_DIR. Set it to the same value when
+# starting `uvicorn --workers` directly.
+API_WORKERS = int(_getenv("API_WORKERS", "1"))
+NODE_SLOT_DIR = _getenv("NODE_SLOT_DIR", ".cache/slots")
+# Tasks the API runs at the same time (0: the LLM concurrency limit plus
+# TEST_MAX_CONCURRENCY, i.e. as many as can make progress at once).
+ADMISSION_MAX_TASKS = int(_getenv("ADMISSION_MAX_TASKS", "0"))
+# Requests each worker lets wait for a task slot, and for how long, before
+# answering 429 Too Many Requests.
+ADMISSION_QUEUE_SIZE = int(_getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_MAX_WAIT_SECONDS = float(_getenv("ADMISSION_MAX_WAIT_SECONDS", "30"))
+
+# === Test Runner ===
+# "cold" launches a fresh interpreter per test run from temporary files;
+# "memory" launches a fresh interpreter but sends the sources over stdin so
+# nothing touches disk; "pool" reuses warm, pre-started sandbox workers
+# (POSIX only, falls back to "cold" elsewhere).
+TEST_RUNNER_MODE = _getenv("TEST_RUNNER_MODE", "cold").lower()
+TEST_WORKER_POOL_SIZE = int(_getenv("TEST_WORKER_POOL_SIZE", str(os.cpu_count() or 2)))
+TEST_WORKER_MAX_RUNS = int(_getenv("TEST_WORKER_MAX_RUNS", "50"))
+# Wall-time limit, in seconds, for a single test run.
+TEST_TIMEOUT_SECONDS = int(_getenv("TEST_TIMEOUT_SECONDS", "10"))
+# Per-run resource limits. 0 disables a limit. TEST_MAX_PROCESSES uses
+# RLIMIT_NPROC, which counts every process of the user running the tests, so
+# prefer TEST_CGROUP_ROOT (a delegated cgroup v2 directory) to cap processes.
+TEST_MEMORY_LIMIT_MB = int(_getenv("TEST_MEMORY_LIMIT_MB", "1024"))
+TEST_CPU_LIMIT_SECONDS = int(_getenv("TEST_CPU_LIMIT_SECONDS", str(TEST_TIMEOUT_SECONDS)))
+TEST_MAX_PROCESSES = int(_getenv("TEST_MAX_PROCESSES", "0"))
+TEST_CGROUP_ROOT = _getenv("TEST_CGROUP_ROOT", "")
+# Check the code and tests statically before a test run, and report syntax
+# errors, undefined names and missing imports without starting a process.
+TEST_PREFLIGHT = _getenv("TEST_PREFLIGHT", "true").lower() in ("1", "true", "yes")
+# Parsed sources kept for the pre-flight checks and test selection.
+PREFLIGHT_AST_CACHE_SIZE = int(_getenv("PREFLIGHT_AST_CACHE_SIZE", "256"))
+# Cache test results by the code and tests, so identical candidates are not
+# run again; passes are also served to reformatted ones. Failing runs,
+# timeouts included, and passes of sources importing clocks, randomness or
+# threads expire after TEST_CACHE_NEGATIVE_TTL seconds.
+TEST_CACHE = _getenv("TEST_CACHE", "true").lower() in ("1", "true", "yes")
+TEST_CACHE_MAX_BYTES = int(_getenv("TEST_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+TEST_CACHE_TTL = float(_getenv("TEST_CACHE_TTL", "86400"))
+TEST_CACHE_NEGATIVE_TTL = float(_getenv("TEST_CACHE_NEGATIVE_TTL", "3600"))
+# Optional SQLite file for a persistent tier that several API workers can
+# share. Empty keeps the cache in memory only, which is the default with a
+# single API worker.
+TEST_CACHE_PATH = _getenv(
+    "TEST_CACHE_PATH", ".cache/test_cache.sqlite" if API_WORKERS > 1 else ""
+)
+TEST_CACHE_DISK_MAX_BYTES = int(_getenv("TEST_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024)))
+# Maximum number of test runs executing at the same time in one process, or
+# on the node with several API_WORKERS.
+TEST_MAX_CONCURRENCY = int(_getenv("TEST_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+
+# === Agent Loop ===
+# Candidates generated and tested in parallel on each attempt (best-of-N).
+CANDIDATES_PER_ATTEMPT = int(_getenv("CANDIDATES_PER_ATTEMPT", "1"))
+# Approximate token budget for the test failure feedback in revision prompts.
+REVISION_FEEDBACK_MAX_TOKENS = int(_getenv("REVISION_FEEDBACK_MAX_TOKENS", "500"))
+# Approximate token budget for a whole revision prompt. Past it, earlier
+# attempts are dropped from the conversation and only the last one is sent.
+REVISION_PROMPT_MAX_TOKENS = int(_getenv("REVISION_PROMPT_MAX_TOKENS", "3000"))
+# Replay revised answers as diffs against the answer they revised.
+REVISION_DIFFS = _getenv("REVISION_DIFFS", "true").lower() in ("1", "true", "yes")
+# Solved tasks shown before a new task's first prompt (0, the default,
+# disables them), retrieved by similarity from a SQLite file of passing
+# solutions ("" keeps it in memory). Examples beyond the token budget are
+# left out. When on, every task's description, code and tests are kept in
+# the file until it is deleted and may be shown in other users' prompts.
+FEW_SHOT_EXAMPLES = int(_getenv("FEW_SHOT_EXAMPLES", "0"))
+FEW_SHOT_MIN_SIMILARITY = float(_getenv("FEW_SHOT_MIN_SIMILARITY", "0.3"))
+FEW_SHOT_MAX_TOKENS = int(_getenv("FEW_SHOT_MAX_TOKENS", "1500"))
+FEW_SHOT_INDEX_PATH = _getenv("FEW_SHOT_INDEX_PATH", ".cache/examples.sqlite")
+
+# === Deadlines ===
+# Latency SLO, in seconds, of API requests that don't set their own (0: none).
+TASK_SLO_SECONDS = float(_getenv("TASK_SLO_SECONDS", "0"))
+# Seconds of a task's remaining budget held back from each LLM call for the
+# test run that follows, until the task has timed one of its own test runs.
+DEADLINE_TEST_RESERVE_SECONDS = float(_getenv("DEADLINE_TEST_RESERVE_SECONDS", "2"))
+
+# === Metrics ===
+# Per-stage timings and token counts, served by the API at /metrics.
+METRICS_ENABLED = _getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Also start OpenTelemetry spans (needs the opentelemetry-api package and a
+# tracer provider configured by the deployment).
+METRICS_OTEL = _getenv("METRICS_OTEL", "false").lower() in ("1", "true", "yes")
+
+# === Job Queue ===
+# "memory" keeps jobs in the API process; "sqlite" stores them in a file
+# that survives restarts and can be shared by several API processes (the
+# default with several API_WORKERS).
+JOB_BACKEND = _getenv("JOB_BACKEND", "sqlite" if API_WORKERS > 1 else "memory").lower()
+JOB_DB_PATH = _getenv("JOB_DB_PATH", ".cache/jobs.sqlite")
+JOB_WORKERS = int(_getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_SIZE = int(_getenv("JOB_QUEUE_MAX_SIZE", "100"))
+# Seconds a finished job's result stays available.
+JOB_RESULT_TTL = float(_getenv("JOB_RESULT_TTL", "3600"))
+# Seconds a process holds a SQLite job it runs without renewing its lease;
+# the job of a process killed mid-run is requeued once its lease lapses.
+JOB_LEASE_SECONDS = float(_getenv("JOB_LEASE_SECONDS", "30"))
@@ -1,3 +1,4 @@
 const APP_CONFIG = {
-  API_URL: 'http://127.0.0.1:8000/generate-code'
+  API_URL: 'http://127.0.0.1:8000/generate-code',
+  STREAM_API_URL: 'http://127.0.0.1:8000/generate-code/stream'
 };
\ No newline at end of file
@@ -1,15 +1,81 @@
-from fastapi import FastAPI
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 
-from cli import run_task
+from agent import metrics, preflight
+from agent.admission import AdmissionController, AdmissionRejected
+from agent.batch import BatchTask, run_batch
+from agent.deadline import monotonic_deadline, request_deadline
+from agent.example_index import get_example_index
+from agent.jobs import InMemoryJobBackend, Job, JobQueue, QueueFullError, SQLiteJobBackend
+from agent.llm_cache import response_cache_stats
+from agent.llm_interface import LLMInterface
+from agent.llm_pool import LLMPool
+from agent.test_cache import get_result_cache
+from agent.test_runner import get_worker_pool
+from config import (
+    ADMISSION_MAX_TASKS,
+    API_WORKERS,
+    TEST_RUNNER_MODE,
+    JOB_BACKEND,
+    JOB_DB_PATH,
+    JOB_WORKERS,
+    JOB_QUEUE_MAX_SIZE,
+    JOB_RESULT_TTL,
+    TEST_MAX_CONCURRENCY,
+)
+from cli import EventCallback, async_run_task
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates the shared pools, the admission controller and the job queue,
+    and closes them on shutdown."""
+    app.state.llm_pool = LLMPool()
+    agent = None
+    try:
+        # Warm the default interface so the first request skips client setup.
+        agent = app.state.llm_pool.warm()
+    except Exception as e:
+        print(f"Could not initialize the default LLM interface: {e}")
+    app.state.admission = AdmissionController(ADMISSION_MAX_TASKS or task_slots(agent))
+    if TEST_RUNNER_MODE == "pool":
+        # Start the sandbox workers now rather than on the first test run.
+        get_worker_pool().start()
+
+    async def run_job(job: Job) -> dict:
+        # Jobs are bounded by the job queue, so they wait for a task slot.
+        async with app.state.admission.admit(bounded=False):
+            with metrics.track_task() as timings:
+                result = await _run_task(
+                    app.state.llm_pool.get(), job.task_description, job.max_tries,
+                    candidates=job.candidates, deadline=job.deadline
+                )
+        return {**result, "timings": timings.as_dict()}
+
+    backend = SQLiteJobBackend(JOB_DB_PATH) if JOB_BACKEND == "sqlite" else InMemoryJobBackend()
+    app.state.job_queue = JobQueue(
+        backend, run_job, JOB_WORKERS, JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL
+    )
+    await app.state.job_queue.start()
+    yield
+    await app.state.job_queue.stop()
+    await app.state.llm_pool.aclose()
+    if TEST_RUNNER_MODE == "pool":
+        get_worker_pool().shutdown()
 
 app = FastAPI(
     title="AI Code Generation Agent",
     description=("An API for a test-driven AI agent that generates "
                  "and validates Python code."),
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS Middleware
@@ -28,40 +94,287 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, error: AdmissionRejected):
+    """Answers requests over capacity with 429 and when to retry."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(error)},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
 class TaskRequest(BaseModel):
     """The request model for the code generation task."""
 
     task_description: str
     max_tries: int = 3
     verbose: bool = False
+    candidates: Optional[int] = None
+    include_timings: bool = False
+    # Answer within this many seconds, or by this Unix time, returning the
+    # best attempt so far if the tests don't pass in time. Defaults to
+    # `TASK_SLO_SECONDS`.
+    slo_seconds: Optional[float] = None
+    deadline: Optional[float] = None
 
 class TaskResponse(BaseModel):
     """The response model for the code generation task"""
 
+    # "passed", "failed", or "deadline_exceeded" when the task ran out of time.
+    status: Optional[str] = None
     passed: bool
     code: str
     tests: str
     output: str
+    # Per-stage seconds and per-attempt token counts, when requested.
+    timings: Optional[dict] = None
+
+class JobRequest(TaskRequest):
+    """The request model for queueing a code generation task."""
+
+    priority: int = 0
+
+class JobResponse(BaseModel):
+    """The response model describing a queued code generation task."""
+
+    job_id: str
+    status: str
+    priority: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[TaskResponse] = None
+    error: Optional[str] = None
+
+class BatchTaskRequest(BaseModel):
+    """One task of a batch request."""
+
+    id: Optional[str] = None
+    task_description: str
+    max_tries: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    """The request model for running many code generation tasks at once."""
+
+    tasks: list[BatchTaskRequest]
+    max_tries: int = 3
+    max_concurrency: Optional[int] = None
+
+def task_slots(agent: Optional[LLMInterface]) -> int:
+    """Returns how many tasks can make progress at once: one per LLM call
+    slot and one per test slot."""
+    llm_limit = agent.limiter.limit if agent is not None and agent.limiter else 1
+    return llm_limit + TEST_MAX_CONCURRENCY
+
+async def _run_task(
+    agent: LLMInterface,
+    task_description: str,
+    max_tries: int,
+    verbose: bool = False,
+    candidates: Optional[int] = None,
+    deadline: Optional[float] = None,
+    on_event: Optional[EventCallback] = None,
+) -> dict:
+    """Runs the agent within a Unix-time deadline and returns the result fields."""
+    deadline_exceeded = False
+
+    async def track(event: dict) -> None:
+        nonlocal deadline_exceeded
+        if event["event"] == "deadline_exceeded":
+            deadline_exceeded = True
+        if on_event is not None:
+            await on_event(event)
+
+    code, passed, tests, output = await async_run_task(
+        task_description=task_description,
+        agent=agent,
+        max_tries=max_tries,
+        verbose=verbose,
+        on_event=track,
+        candidates=candidates,
+        deadline=monotonic_deadline(deadline),
+    )
+    status = "passed" if passed else "deadline_exceeded" if deadline_exceeded else "failed"
+    return {"status": status, "passed": passed, "code": code, "tests": tests, "output": output}
+
+def _job_response(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result": job.result,
+        "error": job.error
+    }
 
 @app.post("/generate-code", response_model=TaskResponse)
-def generate_code_endpoint(request: TaskRequest):
+async def generate_code_endpoint(request: TaskRequest, http_request: Request):
     """
     Receives a code generation task, runs the AI agent, and return the result.
+
+    When every task slot is busy, the request waits in a bounded queue, and
+    is answered with 429 and a `Retry-After` header if it can't get a slot.
     """
     print(f"received task: {request.task_description}")
 
-    code, passed, tests, output = run_task(
-        task_description=request.task_description,
-        max_tries=request.max_tries,
-        verbose=request.verbose
-    )
+    deadline = request_deadline(request.slo_seconds, request.deadline)
+    async with http_request.app.state.admission.admit(deadline):
+        with metrics.track_task() as timings:
+            result = await _run_task(
+                http_request.app.state.llm_pool.get(), request.task_description,
+                request.max_tries, request.verbose, request.candidates, deadline
+            )
 
-    return {
-        "passed": passed,
-        "code": code,
-        "tests": tests,
-        "output": output
+    return {**result, "timings": timings.as_dict() if request.include_timings else None}
+
+@app.post("/generate-code/stream")
+async def generate_code_stream_endpoint(request: TaskRequest, http_request: Request):
+    """
+    Runs the AI agent and streams its progress as newline-delimited JSON.
+
+    Each line is one event: "attempt", "token", "function", "generated",
+    "test_result", "revision", "error" and "deadline_exceeded" as the loop
+    progresses, then a final "result" event with the same fields as the
+    /generate-code response. Requests over capacity are rejected with 429
+    before the stream starts.
+    """
+    print(f"received streaming task: {request.task_description}")
+    events: asyncio.Queue = asyncio.Queue()
+    deadline = request_deadline(request.slo_seconds, request.deadline)
+    admission = http_request.app.state.admission
+    admitted_at = await admission.acquire(deadline)
+
+    async def run() -> None:
+        try:
+            with metrics.track_task() as timings:
+                result = await _run_task(
+                    http_request.app.state.llm_pool.get(), request.task_description,
+                    request.max_tries, request.verbose, request.candidates, deadline,
+                    on_event=events.put
+                )
+            result = {"event": "result", **result}
+            if request.include_timings:
+                result["timings"] = timings.as_dict()
+            await events.put(result)
+        except Exception as e:
+            await events.put({"event": "error", "message": str(e)})
+        finally:
+            await admission.release(admitted_at)
+            await events.put(None)
+
+    # Started here rather than in the stream, so the slot is released even
+    # if the response is never sent.
+    task = asyncio.create_task(run())
+
+    async def stream():
+        try:
+            while (event := await events.get()) is not None:
+                yield json.dumps(event) + "\n"
+        finally:
+            # Stop the agent if the client disconnects early.
+            task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/generate-code/batch")
+async def generate_code_batch_endpoint(request: BatchRequest, http_request: Request):
+    """
+    Runs many tasks concurrently and streams one JSON line per task.
+
+    Lines arrive in completion order, each with the task "id" (its index
+    when none was given), "passed", "code", "tests", "output" and
+    "duration_s", or an "error" if the task failed. LLM calls and test runs
+    are bounded by the server's own limits; `max_concurrency` caps how many
+    tasks are in flight.
+    """
+    agent = http_request.app.state.llm_pool.get()
+    admission = http_request.app.state.admission
+    max_in_flight = request.max_concurrency or task_slots(agent)
+    tasks = [
+        BatchTask(
+            id=task.id if task.id is not None else str(index),
+            task_description=task.task_description,
+            max_tries=task.max_tries or request.max_tries
+        )
+        for index, task in enumerate(request.tasks)
+    ]
+
+    async def run_one(task: BatchTask) -> dict:
+        # Batch tasks are bounded by `max_in_flight`, so they wait for a slot.
+        async with admission.admit(bounded=False):
+            code, passed, tests, output = await async_run_task(
+                task_description=task.task_description,
+                agent=agent,
+                max_tries=task.max_tries
+            )
+        return {"passed": passed, "code": code, "tests": tests, "output": output}
+
+    async def stream():
+        async for record in run_batch(tasks, run_one, max_in_flight):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job_endpoint(request: JobRequest, http_request: Request):
+    """
+    Queues a code generation task and returns immediately.
+
+    Poll GET /jobs/{job_id} for the result. Submitting a task identical to
+    one that is still queued or running returns the existing job. Jobs with
+    a higher priority run first. A job's SLO counts from its submission, so
+    time spent in the queue uses up its budget.
+    """
+    try:
+        job = http_request.app.state.job_queue.submit(
+            request.task_description, request.max_tries, request.priority,
+            request.candidates, request_deadline(request.slo_seconds, request.deadline)
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return _job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_endpoint(job_id: str, http_request: Request):
+    """Returns the status of a queued task, and its result once finished."""
+    job = http_request.app.state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return _job_response(job)
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job_endpoint(job_id: str, http_request: Request):
+    """Cancels a queued or running task."""
+    job = http_request.app.state.job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return _job_response(job)
+
+@app.get("/stats")
+def stats_endpoint(http_request: Request):
+    """Reports reuse statistics for the shared LLM client pool and caches."""
+    stats = {
+        "llm_pool": http_request.app.state.llm_pool.stats(),
+        "llm_cache": response_cache_stats(),
+        "ast_cache": preflight.cache_stats(),
+        "admission": http_request.app.state.admission.stats(),
     }
+    if get_result_cache() is not None:
+        stats["test_cache"] = get_result_cache().stats()
+    if get_example_index() is not None:
+        stats["examples"] = get_example_index().stats()
+    if TEST_RUNNER_MODE == "pool":
+        stats["sandbox_pool"] = get_worker_pool().stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Serves stage timings, token counts and task outcomes for Prometheus."""
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
 
 @app.get("/")
 def read_root():
@@ -74,4 +387,7 @@ def read_root():
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+
+    # Several workers need the app as an import string, so each can load it.
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
\ No newline at end of file
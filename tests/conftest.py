@@ -0,0 +1,6 @@
+"""Shared pytest setup: makes the repository's modules importable."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
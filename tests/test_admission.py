@@ -0,0 +1,76 @@
+"""Tests for admission control and the API's 429 responses."""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from agent.admission import AdmissionController, AdmissionRejected
+
+def test_requests_wait_for_a_free_slot():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=1, max_wait=5)
+        admitted_at = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0.01)
+        assert controller.stats()["waiting"] == 1
+        await controller.release(admitted_at)
+        await controller.release(await waiter)
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2 and stats["running"] == 0 and stats["rejected"] == {}
+
+@pytest.mark.parametrize("queue_size, max_wait, deadline, reason", [
+    (0, 5, None, "queue_full"),
+    (1, 0.01, None, "timeout"),
+    (1, 5, 0.01, "deadline"),
+])
+def test_rejections(queue_size, max_wait, deadline, reason):
+    async def scenario():
+        controller = AdmissionController(2, queue_size=queue_size, max_wait=max_wait)
+        controller.average_task_seconds = 9.0
+        await controller.acquire()
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(None if deadline is None else time.time() + deadline)
+        return controller, rejected.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.reason == reason
+    # Nine seconds per task, spread over two slots, for the one request.
+    assert error.retry_after == 5
+    assert controller.stats()["rejected"] == {reason: 1}
+    assert controller.stats()["waiting"] == 0
+
+def test_unbounded_requests_wait_past_the_queue_limits():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=0, max_wait=0.01)
+        admitted_at = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire(bounded=False))
+        await asyncio.sleep(0.05)
+        await controller.release(admitted_at)
+        await controller.release(await waiter)
+        return controller.stats()
+
+    assert asyncio.run(scenario())["admitted"] == 2
+
+def test_api_answers_429_with_retry_after(monkeypatch):
+    class BusySlots:
+        async def __aenter__(self):
+            await asyncio.Event().wait()
+
+    controller = AdmissionController(1, queue_size=0)
+    controller.average_task_seconds = 2.5
+    controller._slots = BusySlots()
+    # The lifespan isn't run, so no LLM client is created: the request must
+    # be turned away before it needs one.
+    monkeypatch.setattr(main.app.state, "admission", controller, raising=False)
+
+    response = TestClient(main.app).post(
+        "/generate-code", json={"task_description": "Reverse a string"}
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    assert "queue full" in response.json()["detail"]
@@ -0,0 +1,56 @@
+"""Tests for parsing streamed [FUNCTION]/[TESTS] responses."""
+import re
+
+import pytest
+
+from agent.code_generator import StreamingResponseParser
+
+RESPONSE = (
+    "Here is the code.\n[FUNCTION]\ndef add(a, b):\n    return a + b\n[/FUNCTION]\n"
+    "[TESTS]\nimport unittest\n[/TESTS]\nTrailing text."
+)
+CODE = "def add(a, b):\n    return a + b"
+TESTS = "import unittest"
+
+def _feed(chunks: list[str]) -> tuple[StreamingResponseParser, list[tuple[str, str]]]:
+    parser, sections = StreamingResponseParser(), []
+    for chunk in chunks:
+        sections += parser.feed(chunk)
+    return parser, sections
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 11])
+def test_markers_split_across_chunks(size):
+    chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    parser, sections = _feed(chunks)
+    assert parser.done
+    assert sections == [("function", CODE), ("tests", TESTS)]
+    assert parser.result() == (CODE, TESTS)
+
+@pytest.mark.parametrize("split", range(1, len(RESPONSE)))
+def test_every_two_chunk_split(split):
+    parser, _ = _feed([RESPONSE[:split], RESPONSE[split:]])
+    assert parser.result() == (CODE, TESTS)
+
+def test_done_as_soon_as_tests_close():
+    end = RESPONSE.index("[/TESTS]") + len("[/TESTS]")
+    parser, _ = _feed([RESPONSE[:end - 1]])
+    assert not parser.done
+    parser.feed(RESPONSE[end - 1:end])
+    assert parser.done
+
+def test_function_is_reported_before_the_tests():
+    parser = StreamingResponseParser()
+    end = RESPONSE.index("[TESTS]")
+    assert parser.feed(RESPONSE[:end]) == [("function", CODE)]
+    assert parser.feed(RESPONSE[end:]) == [("tests", TESTS)]
+
+@pytest.mark.parametrize("response, marker", [
+    ("def add(a, b): ...", "[FUNCTION]"),
+    ("[FUNCTION]\ndef add(a, b): ...\n[TESTS]\n", "[/FUNCTION]"),
+    ("[FUNCTION]\ncode\n[/FUNCTION]\nimport unittest", "[TESTS]"),
+    ("[FUNCTION]\ncode\n[/FUNCTION]\n[TESTS]\nimport unittest", "[/TESTS]"),
+])
+def test_missing_marker(response, marker):
+    parser, _ = _feed([response])
+    with pytest.raises(ValueError, match=re.escape(f"Missing marker: {marker}")):
+        parser.result()
@@ -0,0 +1,93 @@
+"""Tests for the concurrency limiters."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.concurrency import ConcurrencyLimiter
+
+class _Peak:
+    """Tracks the most holders of a limiter at once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.done = 0
+
+    def enter(self) -> None:
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self) -> None:
+        with self._lock:
+            self.current -= 1
+            self.done += 1
+
+def test_limit_holds_across_threads_and_event_loops():
+    limiter, peak = ConcurrencyLimiter(3), _Peak()
+
+    def thread_worker():
+        for _ in range(5):
+            with limiter:
+                peak.enter()
+                time.sleep(0.002)
+                peak.exit()
+
+    async def task():
+        async with limiter:
+            peak.enter()
+            await asyncio.sleep(0.002)
+            peak.exit()
+
+    def loop_worker():
+        async def main():
+            await asyncio.gather(*(task() for _ in range(10)))
+        asyncio.run(main())
+
+    workers = [threading.Thread(target=thread_worker) for _ in range(4)]
+    workers += [threading.Thread(target=loop_worker) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert peak.done == 4 * 5 + 3 * 10
+    assert peak.peak == 3
+
+def test_cancelled_waiter_gives_its_slot_back():
+    limiter = ConcurrencyLimiter(1)
+
+    async def main():
+        await limiter.__aenter__()
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.01):
+                await limiter.__aenter__()
+        await limiter.__aexit__(None, None, None)
+        # The slot is free again, not lost to the cancelled waiter.
+        async with asyncio.timeout(1):
+            async with limiter:
+                pass
+
+    asyncio.run(main())
+    assert limiter._free == 1
+
+def test_slots_are_granted_in_arrival_order():
+    limiter, order = ConcurrencyLimiter(1), []
+
+    async def waiter(name: str):
+        async with limiter:
+            order.append(name)
+
+    async def main():
+        async with limiter:
+            tasks = []
+            for name in "abc":
+                tasks.append(asyncio.create_task(waiter(name)))
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["a", "b", "c"]
@@ -0,0 +1,21 @@
+"""Tests for how settings from the .env file reach the environment."""
+import os
+
+import config
+
+def test_export_provider_env(monkeypatch):
+    monkeypatch.setattr(config, "_DOTENV", {
+        "OPENAI_BASE_URL": "http://localhost:9999/v1",
+        "LANGCHAIN_PROJECT": "agent",
+        "OPENAI_API_KEY": "sk-secret",
+        "TEST_TIMEOUT": "5",
+    })
+    for name in config._DOTENV:
+        monkeypatch.delenv(name, raising=False)
+
+    config.export_provider_env()
+
+    assert os.environ["OPENAI_BASE_URL"] == "http://localhost:9999/v1"
+    assert os.environ["LANGCHAIN_PROJECT"] == "agent"
+    assert "OPENAI_API_KEY" not in os.environ
+    assert "TEST_TIMEOUT" not in os.environ
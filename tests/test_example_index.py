@@ -0,0 +1,75 @@
+"""Tests for the few-shot example index."""
+import os
+import random
+import sys
+
+from agent import example_index
+from agent.example_index import ExampleIndex, find_examples, terms
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+
+from bench_example_index import make_tasks, reword  # noqa: E402
+
+CODE, TESTS = "def f():\n    pass", "import unittest"
+
+def test_terms_drop_stop_words_and_add_word_pairs():
+    assert terms("Write a function to sort the lists") == {"sort", "list", "sort_list"}
+    assert terms("Check the class") == {"check", "class", "check_class"}
+    assert terms("a the of") == frozenset()
+
+def test_search_returns_most_similar_first():
+    index = ExampleIndex("")
+    index.add_many([
+        ("Reverse a linked list", CODE, TESTS),
+        ("Sort a list of integers in descending order", CODE, TESTS),
+        ("Sort a list of integers", CODE, TESTS),
+    ])
+    found = index.search("sort a list of integers", k=3)
+    assert [example.task for example in found[:2]] == [
+        "Sort a list of integers",
+        "Sort a list of integers in descending order",
+    ]
+    assert found[0].similarity == 1.0
+    assert found[0].similarity > found[1].similarity
+    assert index.stats() == {"entries": 3, "searches": 1, "hits": 1}
+
+def test_search_drops_tasks_below_min_similarity():
+    index = ExampleIndex("")
+    index.add_many([
+        ("Sort a list of integers", CODE, TESTS),
+        ("Sort a deck of cards by suit", CODE, TESTS),
+    ])
+    found = index.search("sort a list of integers", k=2, min_similarity=0.5)
+    assert [example.task for example in found] == ["Sort a list of integers"]
+    assert index.search("parse an email address", k=2, min_similarity=0.1) == []
+
+def test_find_examples_stays_within_token_budget(monkeypatch):
+    index = ExampleIndex("")
+    index.add_many([
+        ("Sort a list of integers", "x" * 400, TESTS),
+        ("Sort a list of integers in place", "y" * 400, TESTS),
+    ])
+    monkeypatch.setattr(example_index, "_enabled", True)
+    monkeypatch.setattr(example_index, "_examples", 2)
+    monkeypatch.setattr(example_index, "_default_index", index)
+    monkeypatch.setattr(example_index, "FEW_SHOT_MIN_SIMILARITY", 0.0)
+
+    monkeypatch.setattr(example_index, "FEW_SHOT_MAX_TOKENS", 1000)
+    assert len(find_examples("sort a list of integers")) == 2
+    monkeypatch.setattr(example_index, "FEW_SHOT_MAX_TOKENS", 150)
+    assert [example.task for example in find_examples("sort a list of integers")] == [
+        "Sort a list of integers"
+    ]
+    monkeypatch.setattr(example_index, "FEW_SHOT_MAX_TOKENS", 10)
+    assert find_examples("sort a list of integers") == []
+
+def test_reworded_tasks_are_found_among_10k_entries():
+    tasks = make_tasks(10_000, seed=0)
+    index = ExampleIndex("")
+    index.add_many((task, CODE, TESTS) for task in tasks)
+    rng = random.Random(0)
+    found = 0
+    for _ in range(100):
+        task = rng.choice(tasks)
+        found += any(example.task == task for example in index.search(reword(task, rng), k=2))
+    assert found >= 80
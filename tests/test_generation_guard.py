@@ -0,0 +1,94 @@
+"""Tests for the limits that stop runaway generations."""
+import asyncio
+import time
+
+import pytest
+
+from agent.concurrency import ConcurrencyLimiter
+from agent.generation_guard import (
+    GenerationGuard,
+    GenerationLimits,
+    GenerationStopped,
+    deadline_slot,
+)
+from agent.llm_cache import CHARS_PER_TOKEN
+
+def _limits(**overrides) -> GenerationLimits:
+    """Limits with every check off except the overridden ones."""
+    values = dict(
+        max_tokens=0, first_token_timeout=0, stall_timeout=0,
+        repetition_block=0, max_repeats=0, deadline=None,
+    )
+    return GenerationLimits(**{**values, **overrides})
+
+def _stop_reason(guard: GenerationGuard, chunks: list[str]) -> str:
+    with pytest.raises(GenerationStopped) as stopped:
+        for chunk in chunks:
+            guard.feed(chunk)
+    return stopped.value.reason
+
+def test_no_limits_never_stop():
+    guard = GenerationGuard(_limits())
+    for _ in range(1000):
+        guard.feed("the same line over and over\n")
+    assert guard.timeout() is None and guard.time_to_deadline() is None
+
+def test_token_budget():
+    guard = GenerationGuard(_limits(max_tokens=10))
+    guard.feed("x" * 10 * CHARS_PER_TOKEN)
+    assert _stop_reason(guard, ["x" * CHARS_PER_TOKEN]) == "max_tokens"
+
+def test_repetition():
+    guard = GenerationGuard(_limits(repetition_block=20, max_repeats=3))
+    assert _stop_reason(guard, ["print('looping forever')\n"] * 10) == "repetition"
+
+def test_varied_output_is_not_repetition():
+    guard = GenerationGuard(_limits(repetition_block=20, max_repeats=3))
+    for line in range(200):
+        guard.feed(f"assert add({line}, {line}) == {2 * line}\n")
+
+def test_first_token_and_stall_timeouts():
+    guard = GenerationGuard(_limits(first_token_timeout=5, stall_timeout=1))
+    assert guard.timeout() == 5
+    assert "within 5s" in str(guard.timed_out())
+    guard.feed("chunk")
+    assert guard.timeout() == 1
+    error = guard.timed_out()
+    assert error.reason == "stall" and "for 1s" in str(error)
+
+def test_deadline():
+    guard = GenerationGuard(_limits(stall_timeout=30, deadline=time.monotonic() + 0.05))
+    assert guard.timeout() <= 0.05
+    time.sleep(0.06)
+    assert guard.timed_out().reason == "deadline"
+    assert _stop_reason(guard, ["chunk"]) == "deadline"
+    with pytest.raises(GenerationStopped):
+        guard.timeout()
+
+def test_deadline_slot_stops_waiting_at_the_deadline():
+    limiter = ConcurrencyLimiter(1)
+
+    async def scenario():
+        async with limiter:
+            guard = GenerationGuard(_limits(deadline=time.monotonic() + 0.05))
+            with pytest.raises(GenerationStopped) as stopped:
+                async with deadline_slot(limiter, guard):
+                    pass
+        # The slot the waiter never got is free again.
+        async with asyncio.timeout(1):
+            async with limiter:
+                pass
+        return stopped.value.reason
+
+    assert asyncio.run(scenario()) == "deadline"
+
+def test_deadline_slot_holds_the_slot():
+    limiter = ConcurrencyLimiter(1)
+
+    async def scenario():
+        async with deadline_slot(limiter, GenerationGuard(_limits())):
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.01):
+                    await limiter.__aenter__()
+
+    asyncio.run(scenario())
@@ -0,0 +1,22 @@
+"""Checks that the entry points import without the provider SDKs.
+
+Import time itself is checked by `benchmarks/import_budget.py`, since a
+wall-clock budget depends on the machine running the tests.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+
+from import_budget import DEFAULT_BUDGETS_MS, LAZY_MODULES, measure  # noqa: E402
+
+@pytest.mark.parametrize("module", sorted(DEFAULT_BUDGETS_MS))
+def test_entry_point_imports_no_provider_sdk(module):
+    _, imported = measure(module)
+    eager = [
+        name for name in imported
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    ]
+    assert not eager, f"{module} imports {sorted(eager)} eagerly"
@@ -0,0 +1,178 @@
+"""Tests for the job queue and its backends."""
+import asyncio
+import time
+
+import pytest
+
+from agent.jobs import (
+    CANCELLED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    InMemoryJobBackend,
+    JobQueue,
+    QueueFullError,
+    SQLiteJobBackend,
+)
+
+async def _never(job):
+    raise AssertionError("jobs are claimed by hand in these tests")
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryJobBackend()
+    return SQLiteJobBackend(str(tmp_path / "jobs.sqlite"))
+
+def test_identical_tasks_share_a_job(backend):
+    queue = JobQueue(backend, _never, 1, 10, 60)
+    job = queue.submit("Reverse a string", 3)
+    assert queue.submit("Reverse a string", 3).id == job.id
+    assert queue.submit("Reverse a string", 2).id != job.id
+
+    backend.claim_next()
+    assert queue.submit("Reverse a string", 3).id == job.id
+
+def test_full_queue_rejects_new_jobs(backend):
+    queue = JobQueue(backend, _never, 1, 2, 60)
+    queue.submit("task one", 3)
+    queue.submit("task two", 3)
+    with pytest.raises(QueueFullError):
+        queue.submit("task three", 3)
+
+def test_claims_follow_priority_then_age(backend):
+    queue = JobQueue(backend, _never, 1, 10, 60)
+    old = queue.submit("old task", 3)
+    urgent = queue.submit("urgent task", 3, priority=5)
+    assert [backend.claim_next().id, backend.claim_next().id] == [urgent.id, old.id]
+    assert backend.claim_next() is None
+
+def test_cancel_queued_job(backend):
+    queue = JobQueue(backend, _never, 1, 10, 60)
+    job = queue.submit("Reverse a string", 3)
+    assert queue.cancel(job.id).status == CANCELLED
+    assert backend.claim_next() is None
+    assert queue.submit("Reverse a string", 3).id != job.id
+    assert queue.cancel("missing") is None
+
+def test_only_queued_jobs_are_cancelled_by_the_backend(backend):
+    queue = JobQueue(backend, _never, 1, 10, 60)
+    job = queue.submit("Reverse a string", 3)
+    cancelled = backend.cancel_if_queued(job.id)
+    assert cancelled.status == CANCELLED and cancelled.finished_at is not None
+    assert backend.get(job.id).status == CANCELLED
+    assert backend.cancel_if_queued(job.id) is None
+
+    running = queue.submit("Sort a list", 3)
+    backend.claim_next()
+    assert backend.cancel_if_queued(running.id) is None
+    assert backend.cancel_if_queued("missing") is None
+
+def test_cancel_leaves_a_job_claimed_by_another_process_running(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(SQLiteJobBackend(path), _never, 1, 10, 60)
+    job = queue.submit("Reverse a string", 3)
+    other = SQLiteJobBackend(path)
+    assert other.claim_next().id == job.id
+
+    assert queue.cancel(job.id).status == RUNNING
+    assert other.get(job.id).status == RUNNING
+
+def test_cancel_running_job(backend):
+    started = asyncio.Event()
+
+    async def run(job):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def main():
+        queue = JobQueue(backend, run, 1, 10, 60, poll_interval=0.01)
+        await queue.start()
+        job = queue.submit("Reverse a string", 3)
+        await asyncio.wait_for(started.wait(), 5)
+        assert queue.cancel(job.id).status == CANCELLED
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return queue.get(job.id)
+
+    assert asyncio.run(main()).status == CANCELLED
+
+def test_stopping_requeues_running_jobs(backend):
+    started = asyncio.Event()
+
+    async def run(job):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def main():
+        queue = JobQueue(backend, run, 1, 10, 60, poll_interval=0.01)
+        await queue.start()
+        job = queue.submit("Reverse a string", 3)
+        await asyncio.wait_for(started.wait(), 5)
+        await queue.stop()
+        return queue.get(job.id)
+
+    job = asyncio.run(main())
+    assert job.status == QUEUED and job.started_at is None
+    assert backend.claim_next().id == job.id
+
+def test_finished_jobs_keep_their_result(backend):
+    async def run(job):
+        return {"passed": True}
+
+    async def main():
+        queue = JobQueue(backend, run, 1, 10, 60, poll_interval=0.01)
+        await queue.start()
+        job = queue.submit("Reverse a string", 3)
+        for _ in range(100):
+            if queue.get(job.id).status == SUCCEEDED:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return queue.get(job.id)
+
+    job = asyncio.run(main())
+    assert job.status == SUCCEEDED and job.result == {"passed": True}
+
+def test_finished_jobs_are_purged_while_workers_are_busy(backend):
+    started = asyncio.Event()
+
+    async def run(job):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def main():
+        queue = JobQueue(backend, run, 1, 10, 0, poll_interval=0.01, purge_interval=0.01)
+        await queue.start()
+        queue.submit("Reverse a string", 3)
+        await asyncio.wait_for(started.wait(), 5)
+        finished = queue.submit("Sort a list", 3)
+        queue.cancel(finished.id)
+        await asyncio.sleep(0.05)
+        purged = queue.get(finished.id) is None
+        await queue.stop()
+        return purged
+
+    assert asyncio.run(main())
+
+def test_job_of_a_killed_process_is_requeued(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(SQLiteJobBackend(path, lease_seconds=0.1), _never, 1, 10, 60)
+    job = queue.submit("Reverse a string", 3)
+    assert queue.backend.claim_next().id == job.id
+
+    # The process that claimed the job dies and its lease lapses.
+    time.sleep(0.15)
+    backend = SQLiteJobBackend(path, lease_seconds=0.1)
+    assert backend.find_active(job.dedupe_key).status == QUEUED
+    assert backend.claim_next().id == job.id
+
+def test_renewed_lease_keeps_the_job_running(tmp_path):
+    backend = SQLiteJobBackend(str(tmp_path / "jobs.sqlite"), lease_seconds=0.2)
+    job = JobQueue(backend, _never, 1, 10, 60).submit("Reverse a string", 3)
+    backend.claim_next()
+    for _ in range(3):
+        time.sleep(0.1)
+        backend.renew([job.id])
+    assert backend.find_active(job.dedupe_key).status == RUNNING
+    assert backend.claim_next() is None
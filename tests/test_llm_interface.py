@@ -0,0 +1,65 @@
+"""Tests for the response caching of `LLMInterface.astream`."""
+import asyncio
+from contextlib import aclosing
+
+from agent.cache import LRUCache, TieredCache
+from agent.code_generator import async_generate_code_and_tests
+from agent.llm_cache import ResponseCache
+from agent.llm_interface import LLMInterface
+
+RESPONSE = [
+    "[FUNCTION]\ndef add(a, b):\n",
+    "    return a + b\n[/FUNCTION]\n[TESTS]\n",
+    "import unittest\n[/TESTS]\n",
+    "Some trailing commentary the model adds.",
+]
+
+class _Chain:
+    """Streams a fixed response in chunks."""
+
+    def __init__(self, chunks: list[str]):
+        self.chunks = chunks
+        self.calls = 0
+
+    async def astream(self, inputs: dict):
+        self.calls += 1
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+def _interface(chunks: list[str]) -> LLMInterface:
+    cache = ResponseCache(TieredCache(LRUCache(1 << 20)))
+    llm = LLMInterface(provider="ollama", use_cache=True, cache=cache)
+    llm.chain = _Chain(chunks)
+    return llm
+
+async def _read(llm: LLMInterface, count: int = 0, complete=None) -> str:
+    """Reads `count` chunks of a response, or all of it when `count` is 0."""
+    received = []
+    async with aclosing(llm.astream("prompt", complete=complete)) as stream:
+        async for chunk in stream:
+            received.append(chunk)
+            if len(received) == count:
+                break
+    return "".join(received)
+
+def test_finished_stream_is_cached():
+    llm = _interface(RESPONSE)
+    first = asyncio.run(_read(llm))
+    assert asyncio.run(_read(llm)) == first
+    assert llm.chain.calls == 1
+
+def test_stream_closed_early_is_not_cached():
+    llm = _interface(RESPONSE)
+    asyncio.run(_read(llm, 1))
+    asyncio.run(_read(llm, 1, complete=lambda: False))
+    asyncio.run(_read(llm))
+    assert llm.chain.calls == 3
+
+def test_complete_response_closed_early_is_cached():
+    llm = _interface(RESPONSE)
+    asyncio.run(async_generate_code_and_tests("add two numbers", llm))
+    code, tests = asyncio.run(async_generate_code_and_tests("add two numbers", llm))
+    assert llm.chain.calls == 1
+    assert "return a + b" in code
+    assert tests == "import unittest"
@@ -0,0 +1,48 @@
+"""Tests for the static checks run before a test run."""
+import sys
+
+import pytest
+
+from agent import preflight
+
+TESTS = """import unittest
+from code import first, Stack
+
+class T(unittest.TestCase):
+    def test(self):
+        self.assertEqual(first([1, 2]), 1)
+        self.assertEqual(Stack().items, [])
+"""
+
+def _checks(code: str, tests: str = TESTS) -> list[str]:
+    return [error.check for error in preflight.check(code, tests)]
+
+def test_valid_code_passes():
+    code = (
+        "def first(xs):\n    return xs[0]\n"
+        "class Stack:\n    def __init__(self):\n        self.items = []\n"
+    )
+    assert _checks(code) == []
+
+def test_undefined_name_is_reported():
+    code = (
+        "def first(xs):\n    return xss[0]\n"
+        "class Stack:\n    def __init__(self):\n        self.items = []\n"
+    )
+    assert _checks(code) == ["undefined_name"]
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="PEP 695 syntax needs Python 3.12")
+def test_generic_function_and_class_pass():
+    code = (
+        "def first[T](xs: list[T]) -> T:\n    return xs[0]\n"
+        "class Stack[T, *Ts, **P]:\n"
+        "    def __init__(self) -> None:\n        self.items: list[T] = []\n"
+    )
+    assert _checks(code) == []
+
+def test_tests_that_ignore_the_code_are_rejected():
+    tests = (
+        "import unittest\n"
+        "class T(unittest.TestCase):\n    def test(self):\n        self.assertTrue(True)\n"
+    )
+    assert _checks("def first(xs):\n    return xs[0]\n", tests) == ["no_symbol_references"]
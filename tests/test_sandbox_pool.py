@@ -0,0 +1,20 @@
+"""Tests for the pool of warm sandbox workers."""
+import pytest
+
+from agent import test_runner
+from agent.sandbox_pool import NoWorkerError, SandboxPool
+
+CODE = "def add(a, b):\n    return a + b\n"
+TESTS = "import unittest\nclass T(unittest.TestCase):\n    def test(self):\n        self.assertEqual(add(1, 2), 3)\n"
+
+def test_waiting_for_a_busy_pool_times_out():
+    pool = SandboxPool(0, 1, start_timeout=0.01)
+    with pytest.raises(NoWorkerError, match=r"no sandbox worker became free in 0\.06s") as error:
+        pool.run({}, 0.05)
+    assert isinstance(error.value, TimeoutError)
+
+def test_busy_pool_is_not_reported_as_a_test_timeout(monkeypatch):
+    monkeypatch.setattr(test_runner, "get_worker_pool", lambda: SandboxPool(0, 1, start_timeout=0.01))
+    report = test_runner._run_tests_in_pool(CODE, TESTS, timeout=0.05)
+    assert not report.passed and not report.cacheable
+    assert "no sandbox worker became free" in report.output
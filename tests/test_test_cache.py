@@ -0,0 +1,61 @@
+"""Tests for the test result cache."""
+from agent import test_cache, test_runner
+from agent.cache import LRUCache, TieredCache
+from agent.test_cache import ResultCache
+from agent.test_report import TestReport as Report
+
+CODE = "def add(a, b):\n    return a + b\n"
+REFORMATTED = "def add(a,b):\n    # Sum.\n    return a+b\n"
+TESTS = "import unittest\nclass T(unittest.TestCase):\n    def test(self):\n        self.assertEqual(add(1, 2), 3)\n"
+
+def _cache(ttl: float = 60, negative_ttl: float = 60) -> ResultCache:
+    return ResultCache(TieredCache(LRUCache(1 << 20)), ttl, negative_ttl)
+
+def test_pass_is_served_to_reformatted_sources():
+    cache = _cache()
+    cache.put(cache.key(CODE, TESTS), Report(True, "OK", wall_time=0.5))
+
+    report = cache.get(cache.key(REFORMATTED, TESTS))
+    assert report.passed and report.cached
+    assert cache.stats()["normalized_hits"] == 1
+    assert cache.stats()["saved_seconds"] == 0.5
+
+def test_failure_is_only_served_to_identical_sources():
+    cache = _cache()
+    cache.put(cache.key(CODE, TESTS), Report(False, 'File "code.py", line 2'))
+
+    assert cache.get(cache.key(CODE, TESTS)).output == 'File "code.py", line 2'
+    assert cache.get(cache.key(REFORMATTED, TESTS)) is None
+
+def test_failure_expires_after_negative_ttl():
+    cache = _cache(ttl=60, negative_ttl=-1)
+    key = cache.key(CODE, TESTS)
+    cache.put(key, Report(False, "FAILED"))
+    assert cache.get(key) is None
+    assert cache.stats()["expired"] == 1
+
+    cache.put(key, Report(True, "OK"))
+    assert cache.get(key).passed
+
+def test_nondeterministic_pass_expires_after_negative_ttl():
+    cache = _cache(ttl=60, negative_ttl=-1)
+    key = cache.key("import random\n" + CODE, TESTS)
+    assert not key.deterministic
+    cache.put(key, Report(True, "OK"))
+    assert cache.get(key) is None
+
+def test_runner_failure_is_not_cached():
+    cache = _cache()
+    key = cache.key(CODE, TESTS)
+    cache.put(key, Report(False, "runner crashed", cacheable=False))
+    assert cache.get(key) is None
+
+def test_repeated_run_is_served_from_the_cache(monkeypatch):
+    cache = _cache()
+    monkeypatch.setattr(test_cache, "_enabled", True)
+    monkeypatch.setattr(test_cache, "_default_cache", cache)
+    first = test_runner._run_suite("memory", CODE, TESTS)
+    second = test_runner._run_suite("memory", REFORMATTED, TESTS)
+    assert first.passed and not first.cached
+    assert second.passed and second.cached
+    assert cache.stats()["normalized_hits"] == 1